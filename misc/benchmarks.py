@@ -0,0 +1,330 @@
+"""
+Benchmarks for the performance sensitive paths of retro-data-structures.
+
+Usage: python misc/benchmarks.py <benchmark> --help
+"""
+import argparse
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+from pathlib import Path
+
+from retro_data_structures import compression, property_codegen, property_template
+from retro_data_structures.asset_provider import AssetProvider
+from retro_data_structures.cli import add_game_argument
+from retro_data_structures.formats.mrea import MREA
+from retro_data_structures.formats.pak import PAK, write_pak
+from retro_data_structures.game_check import Game
+
+
+def _report(label: str, seconds: float, total_bytes: typing.Optional[int] = None, count: typing.Optional[int] = None):
+    message = f"{label}: {seconds:.3f}s"
+    if count is not None:
+        message += f", {count} items"
+    if total_bytes is not None:
+        message += f", {total_bytes / (1024 * 1024) / seconds:.1f} MiB/s"
+    print(message)
+
+
+def _best_of(repeat: int, func) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _read_all_assets(game: Game, paks: typing.List[Path], **kwargs):
+    total = 0
+    count = 0
+    with AssetProvider(game, paks, **kwargs) as provider:
+        for resource in list(provider.all_resource_headers):
+            total += len(provider._get_asset_data(resource.asset.id))
+            count += 1
+    return total, count
+
+
+def do_pak_read(args):
+    game: Game = args.game
+    paks = list(args.paks_path.glob("*.pak"))
+
+    for label, kwargs in [("file handles", {}), ("mmap", {"use_mmap": True})]:
+        total, count = _read_all_assets(game, paks, **kwargs)
+        _report(label, _best_of(args.repeat, lambda: _read_all_assets(game, paks, **kwargs)), total, count)
+
+
+def do_pak_index(args):
+    game: Game = args.game
+    paks = list(args.paks_path.glob("*.pak"))
+
+    def open_provider(**kwargs):
+        with AssetProvider(game, paks, **kwargs):
+            pass
+
+    _report("no index cache", _best_of(args.repeat, open_provider), count=len(paks))
+
+    def cold_start():
+        with tempfile.TemporaryDirectory() as cache_dir:
+            open_provider(index_cache_dir=Path(cache_dir))
+
+    _report("cold index cache", _best_of(args.repeat, cold_start), count=len(paks))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        open_provider(index_cache_dir=Path(cache_dir))
+        _report("warm index cache",
+                _best_of(args.repeat, lambda: open_provider(index_cache_dir=Path(cache_dir))),
+                count=len(paks))
+
+
+def _lzo_test_data(segments: int) -> bytes:
+    # Half random-ish, half repetitive, so segments are neither trivial nor stored uncompressed
+    segment = bytes((i * 7919) % 251 for i in range(0x2000)) + b"\x00" * 0x2000
+    return segment * segments
+
+
+def do_lzo_decompress(args):
+    data = _lzo_test_data(args.segments)
+    block = compression.LZOCompressedBlock(len(data))
+    encoded = block.build(data)
+    print(f"{args.segments} segments, {len(encoded)} bytes compressed")
+
+    _report("GreedyRange of LZOSegment",
+            _best_of(args.repeat, lambda: b"".join(block.subcon.parse(encoded))), len(data))
+    _report("serial decoder",
+            _best_of(args.repeat, lambda: compression.decompress_lzo_segments(encoded, len(data), parallel=False)),
+            len(data))
+    _report("parallel decoder",
+            _best_of(args.repeat, lambda: compression.decompress_lzo_segments(encoded, len(data), parallel=True)),
+            len(data))
+
+
+def do_lzo_compress(args):
+    data = _lzo_test_data(args.segments)
+    block = compression.LZOCompressedBlock(len(data))
+    segments = block._encode(data, None, "")
+
+    _report("GreedyRange of LZOSegment", _best_of(args.repeat, lambda: block.subcon.build(segments)), len(data))
+    _report("serial encoder",
+            _best_of(args.repeat, lambda: compression.compress_lzo_segments(data, parallel=False)), len(data))
+    _report("parallel encoder",
+            _best_of(args.repeat, lambda: compression.compress_lzo_segments(data, parallel=True)), len(data))
+
+
+def do_mrea_parse(args):
+    game: Game = args.game
+    paks = list(args.paks_path.glob("*.pak"))
+
+    with AssetProvider(game, paks) as provider:
+        areas = [
+            provider.get_decompressed_bytes(resource.asset.id)
+            for resource in provider.all_resource_headers
+            if resource.asset.type == "MREA"
+        ]
+    total = sum(len(area) for area in areas)
+
+    def parse_all(access_hashes: bool, **params):
+        for area in areas:
+            decoded = MREA.parse(area, target_game=game, **params)
+            if access_hashes:
+                for category in decoded.sections.values():
+                    for section in category:
+                        section.hash
+
+    _report("sha256, every hash accessed",
+            _best_of(args.repeat, lambda: parse_all(True, section_hash="sha256")), total, len(areas))
+    _report("crc32, every hash accessed",
+            _best_of(args.repeat, lambda: parse_all(True, section_hash="crc32")), total, len(areas))
+    _report("hashes not accessed", _best_of(args.repeat, lambda: parse_all(False)), total, len(areas))
+
+
+def _peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def do_pak_write(args):
+    game: Game = args.game
+    paks = list(args.paks_path.glob("*.pak"))
+
+    with AssetProvider(game, paks) as provider:
+        headers = list(provider.all_resource_headers)
+
+        def build():
+            pak = PAK.build({
+                "named_resources": [],
+                "resources": [
+                    {"asset": resource.asset, "compressed": resource.compressed,
+                     "contents": {"value": provider.get_decompressed_bytes(resource.asset.id)}}
+                    for resource in headers
+                ],
+            }, target_game=game)
+            with tempfile.TemporaryFile() as output:
+                output.write(pak)
+
+        def stream():
+            with tempfile.TemporaryFile() as output:
+                write_pak(output, [
+                    ((resource.asset.type, resource.asset.id), None,
+                     lambda asset_id=resource.asset.id: provider.get_decompressed_bytes(asset_id),
+                     resource.compressed > 0)
+                    for resource in headers
+                ], game)
+
+        for label, func in [("PAK.build", build), ("write_pak", stream)]:
+            _report(label, _best_of(args.repeat, func), count=len(headers))
+            print(f"{label}: peak memory {_peak_memory(func) / (1024 * 1024):.1f} MiB")
+
+
+_COLD_IMPORT = """
+import time
+start = time.perf_counter()
+from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import GetGameTemplate, GetPropertyConstruct
+game = Game[{game!r}]
+GetPropertyConstruct(game, next(iter(GetGameTemplate(game).script_objects)))
+print(time.perf_counter() - start)
+"""
+
+
+def do_property_templates(args):
+    game: Game = args.game
+    template_path = property_template._game_template_path(game)
+    data = template_path.read_bytes()
+    template = property_template.GameTemplate.parse(data)
+    pickled = pickle.dumps(template, protocol=pickle.HIGHEST_PROTOCOL)
+
+    _report("parse template", _best_of(args.repeat, lambda: property_template.GameTemplate.parse(data)), len(data))
+    _report("load template cache", _best_of(args.repeat, lambda: pickle.loads(pickled)), len(pickled))
+
+    def create_constructs(names):
+        property_template.PropertyConstructs.pop(game, None)
+        for name in names:
+            property_template.GetPropertyConstruct(game, name)
+
+    names = list(template.script_objects)
+    _report("create every script object construct", _best_of(args.repeat, lambda: create_constructs(names)),
+            count=len(names))
+    _report("create one script object construct", _best_of(args.repeat, lambda: create_constructs(names[:1])),
+            count=1)
+
+    def cold_import():
+        output = subprocess.run([sys.executable, "-c", _COLD_IMPORT.format(game=game.name)],
+                                check=True, capture_output=True, text=True).stdout
+        return float(output)
+
+    cache_path = property_template._template_cache_path(template_path)
+    if cache_path is not None:
+        cache_path.unlink(missing_ok=True)
+    print(f"cold import, no template cache: {cold_import():.3f}s")
+    print(f"cold import, template cache: {min(cold_import() for _ in range(args.repeat)):.3f}s")
+
+
+def do_property_codecs(args):
+    game: Game = args.game
+    samples = []
+    for name in property_template.GetGameTemplate(game).script_objects:
+        codec = property_codegen.get_property_codec(game, name)
+        if codec is None:
+            continue
+        try:
+            data = property_template.GetPropertyConstruct(game, name, True).build({}, target_game=game)
+        except Exception:
+            continue
+        samples.append((property_template.GetPropertyConstruct(game, name), codec, data))
+
+    total_bytes = sum(len(data) for _, _, data in samples)
+    print(f"{len(samples)} script object types with a codec")
+
+    def construct_parse():
+        return [reference.parse(data, target_game=game) for reference, _, data in samples]
+
+    def codec_parse():
+        return [codec.parse(data) for _, codec, data in samples]
+
+    parsed = construct_parse()
+    _report("construct parse", _best_of(args.repeat, construct_parse), total_bytes, len(samples))
+    _report("codec parse", _best_of(args.repeat, codec_parse), total_bytes, len(samples))
+
+    def construct_build():
+        for (reference, _, _), obj in zip(samples, parsed):
+            reference.build(obj, target_game=game)
+
+    def codec_build():
+        for (_, codec, _), obj in zip(samples, parsed):
+            codec.build(obj)
+
+    _report("construct build", _best_of(args.repeat, construct_build), total_bytes, len(samples))
+    _report("codec build", _best_of(args.repeat, codec_build), total_bytes, len(samples))
+
+
+def create_parser():
+    parser = argparse.ArgumentParser()
+    subparser = parser.add_subparsers(dest="command", required=True)
+
+    pak_read = subparser.add_parser("pak-read", help="Read and decompress every asset of all paks.")
+    add_game_argument(pak_read)
+    pak_read.add_argument("paks_path", type=Path, help="Path to where to find pak files")
+    pak_read.add_argument("--repeat", type=int, default=3, help="Number of runs. Only the fastest is reported.")
+    pak_read.set_defaults(func=do_pak_read)
+
+    pak_index = subparser.add_parser("pak-index", help="Startup time of an AssetProvider, with and without index cache.")
+    add_game_argument(pak_index)
+    pak_index.add_argument("paks_path", type=Path, help="Path to where to find pak files")
+    pak_index.add_argument("--repeat", type=int, default=3, help="Number of runs. Only the fastest is reported.")
+    pak_index.set_defaults(func=do_pak_index)
+
+    mrea_parse = subparser.add_parser("mrea-parse", help="Parse every MREA of the paks, such as all areas of a world.")
+    add_game_argument(mrea_parse)
+    mrea_parse.add_argument("paks_path", type=Path, help="Path to where to find pak files")
+    mrea_parse.add_argument("--repeat", type=int, default=3, help="Number of runs. Only the fastest is reported.")
+    mrea_parse.set_defaults(func=do_mrea_parse)
+
+    pak_write = subparser.add_parser("pak-write", help="Write every asset of the paks into a single new pak.")
+    add_game_argument(pak_write)
+    pak_write.add_argument("paks_path", type=Path, help="Path to where to find pak files")
+    pak_write.add_argument("--repeat", type=int, default=3, help="Number of runs. Only the fastest is reported.")
+    pak_write.set_defaults(func=do_pak_write)
+
+    templates = subparser.add_parser("property-templates",
+                                     help="Loading the property templates, and creating script object constructs.")
+    add_game_argument(templates)
+    templates.add_argument("--repeat", type=int, default=3, help="Number of runs. Only the fastest is reported.")
+    templates.set_defaults(func=do_property_templates)
+
+    codecs = subparser.add_parser("property-codecs",
+                                  help="Parse and build the default properties of every script object type, "
+                                       "with the constructs and with the generated codecs.")
+    add_game_argument(codecs)
+    codecs.add_argument("--repeat", type=int, default=3, help="Number of runs. Only the fastest is reported.")
+    codecs.set_defaults(func=do_property_codecs)
+
+    lzo = subparser.add_parser("lzo-decompress", help="Decompress a synthetic segmented LZO block.")
+    lzo.add_argument("--segments", type=int, default=256, help="Number of 0x4000 bytes segments")
+    lzo.add_argument("--repeat", type=int, default=5, help="Number of runs. Only the fastest is reported.")
+    lzo.set_defaults(func=do_lzo_decompress)
+
+    lzo_compress = subparser.add_parser("lzo-compress", help="Compress a synthetic block into LZO segments.")
+    lzo_compress.add_argument("--segments", type=int, default=256, help="Number of 0x4000 bytes segments")
+    lzo_compress.add_argument("--repeat", type=int, default=5, help="Number of runs. Only the fastest is reported.")
+    lzo_compress.set_defaults(func=do_lzo_compress)
+
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,53 @@
+import concurrent.futures
+import hashlib
+import io
 import logging
+import mmap
+import os
+import struct
+import threading
 import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, BinaryIO, Optional
+from typing import Any, Dict, Iterable, Iterator, List, BinaryIO, Optional, Tuple
 
 from retro_data_structures import formats
 from retro_data_structures.formats import AssetType, AssetId
-from retro_data_structures.formats.pak import CompressedPakResource, PAKNoData
+from retro_data_structures.formats.pak import (
+    RESOURCE_ALIGNMENT,
+    PAKNoData,
+    ResourceHeader,
+    compress_pak_resource,
+    decompress_pak_resource,
+    write_pak,
+)
 from retro_data_structures.game_check import Game
+from retro_data_structures.pak_index import (
+    AssetLocations,
+    PakIndex,
+    load_cached_pak_index,
+    read_pak_index,
+    save_cached_pak_index,
+)
 
 logger = logging.getLogger(__name__)
 
+# Resources at most this far apart are fetched with a single read in the batch APIs
+_MAX_COALESCE_GAP = 0x10000
+_MAX_COALESCED_READ = 0x800000
+
+_DEFAULT_BYTES_CACHE_SIZE = 32 * 1024 * 1024
+
 
 class UnknownAssetId(Exception):
     def __init__(self, asset_id):
         super().__init__(f"Unknown asset id 0x{asset_id:08X}")
         self.asset_id = asset_id
 
+    def __reduce__(self):
+        return type(self), (self.asset_id,)
+
 
 class InvalidAssetId(Exception):
     def __init__(self, asset_id, reason: str):
@@ -23,52 +55,309 @@ class InvalidAssetId(Exception):
         self.asset_id = asset_id
         self.reason = reason
 
+    def __reduce__(self):
+        return type(self), (self.asset_id, self.reason)
+
+
+class AssetCache:
+    """
+    Cache for parsed assets, that evicts the least recently used entries once over the configured limits.
+    The memory used by each asset is approximated by the size of its decompressed data.
+    Pinned assets are never evicted and don't count towards the limits.
+    All operations are thread-safe.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 pinned_types: Iterable[AssetType] = ("MLVL",)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.pinned_types = {t.upper() for t in pinned_types}
+        self._entries: typing.OrderedDict[AssetId, typing.Tuple[Any, int]] = OrderedDict()
+        self._pinned: Dict[AssetId, Any] = {}
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries) + len(self._pinned)
+
+    def __contains__(self, asset_id: AssetId) -> bool:
+        return asset_id in self._entries or asset_id in self._pinned
+
+    def __getitem__(self, asset_id: AssetId):
+        with self._lock:
+            if asset_id in self._pinned:
+                return self._pinned[asset_id]
+            return self._entries[asset_id][0]
+
+    def __setitem__(self, asset_id: AssetId, asset):
+        self.put(asset_id, asset)
+
+    def get(self, asset_id: AssetId, default=None):
+        """
+        Gets the given asset, marking it as recently used and updating the hit/miss counters.
+        """
+        with self._lock:
+            if asset_id in self._pinned:
+                self.hits += 1
+                return self._pinned[asset_id]
+
+            entry = self._entries.get(asset_id)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(asset_id)
+            return entry[0]
+
+    def put(self, asset_id: AssetId, asset, size: int = 0, asset_type: Optional[AssetType] = None):
+        if asset_type is not None and asset_type.upper() in self.pinned_types:
+            self.pin(asset_id, asset)
+            return
+
+        with self._lock:
+            self.discard(asset_id)
+            self._entries[asset_id] = (asset, size)
+            self.total_bytes += size
+            self._evict()
+
+    def pin(self, asset_id: AssetId, asset=None):
+        """
+        Keeps the given asset in the cache until it's unpinned. If no asset is given, pins the already cached one.
+        """
+        with self._lock:
+            if asset is None:
+                asset = self[asset_id]
+            self.discard(asset_id)
+            self._pinned[asset_id] = asset
+
+    def unpin(self, asset_id: AssetId):
+        with self._lock:
+            asset = self._pinned.pop(asset_id)
+            self.put(asset_id, asset)
+
+    def discard(self, asset_id: AssetId):
+        with self._lock:
+            self._pinned.pop(asset_id, None)
+            entry = self._entries.pop(asset_id, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self.total_bytes = 0
+
+    def _is_over_limit(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.total_bytes > self.max_bytes
+
+    def _evict(self):
+        while self._entries and self._is_over_limit():
+            _, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "pinned": len(self._pinned),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def _fileno(pak_file: BinaryIO) -> Optional[int]:
+    try:
+        return pak_file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return None
+
+
+def _map_pak_file(pak_file: BinaryIO) -> Optional[memoryview]:
+    fileno = _fileno(pak_file)
+    if fileno is None:
+        return None
+
+    try:
+        return memoryview(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        # Empty files and some special files can't be mapped
+        return None
+
+
+def _release_view(view: Optional[memoryview]):
+    if view is None:
+        return
+    mapping = view.obj
+    view.release()
+    try:
+        mapping.close()
+    except BufferError:
+        # Someone still holds a slice; the mapping is closed once it's garbage collected.
+        pass
+
 
 class AssetProvider:
+    """
+    Reads assets from a list of paks. Use it as a context manager to open the paks; nested `with` blocks reuse the
+    already opened paks.
+    Once open, assets can be fetched from multiple threads at the same time: reads use `os.pread` or the mmap when
+    possible, and fall back to a lock around the file handle otherwise.
+    Assets present in many paks are read from the copy closest to the previous read, preferably in the same pak.
+    """
     _pak_files: Optional[List[BinaryIO]] = None
+    _pak_views: Optional[List[Optional[memoryview]]] = None
+    _pak_filenos: Optional[List[Optional[int]]] = None
 
-    def __init__(self, target_game: Game, pak_paths: List[Path], pak_files: Optional[List[typing.BinaryIO]] = None):
+    def __init__(self, target_game: Game, pak_paths: List[Path], pak_files: Optional[List[typing.BinaryIO]] = None,
+                 use_mmap: bool = False, index_cache_dir: Optional[Path] = None,
+                 asset_cache: Optional[AssetCache] = None, bytes_cache: Optional[AssetCache] = None,
+                 lazy_formats: bool = False):
+        """
+        :param use_mmap: Map the paks into memory instead of reading through the file handles. Uncompressed assets are
+        then handed to the parsers as memoryview slices of the mapping, without any intermediate copy.
+        Paks that can't be mapped (such as in-memory streams) silently use the file handle instead.
+        :param index_cache_dir: When set, the parsed resource table of each pak is stored in this directory and reused
+        while the pak's size, modification time and header are unchanged.
+        :param asset_cache: Where parsed assets are kept. Defaults to a cache without limits.
+        :param bytes_cache: Where the results of `get_decompressed_bytes` are kept. Defaults to a 32 MiB cache.
+        :param lazy_formats: Parse assets with the variants in `formats.LAZY_FORMATS` when available, which only decode
+        their largest fields when accessed.
+        """
         self.pak_paths = pak_paths
         self._pak_files = pak_files
+        self._owns_pak_files = pak_files is None
         self.target_game = target_game
-        self.loaded_assets = {}
+        self.use_mmap = use_mmap
+        self.index_cache_dir = index_cache_dir
+        self.lazy_formats = lazy_formats
+        self.loaded_assets = asset_cache if asset_cache is not None else AssetCache()
+        self.bytes_cache = bytes_cache if bytes_cache is not None else AssetCache(max_bytes=_DEFAULT_BYTES_CACHE_SIZE,
+                                                                                  pinned_types=())
+        self._enter_count = 0
+        self._last_read = (None, 0)
+        self._state_lock = threading.Lock()
+        self._io_lock = threading.Lock()
 
     def __enter__(self):
+        with self._state_lock:
+            if self._enter_count == 0:
+                self._open()
+            self._enter_count += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._state_lock:
+            self._enter_count -= 1
+            if self._enter_count == 0:
+                self._close()
+
+    def _open(self):
         if self._pak_files is None:
             self._pak_files = [path.open("rb") for path in self.pak_paths]
-        self._paks = []
-        for i, pak_file in enumerate(self._pak_files):
-            logger.info("Parsing PAK at %s", str(self.pak_paths[i]))
-            self._paks.append(PAKNoData.parse_stream(pak_file, target_game=self.target_game))
+        if self.use_mmap:
+            self._pak_views = [_map_pak_file(pak_file) for pak_file in self._pak_files]
+        self._paks: List[PakIndex] = [self._load_index(i) for i in range(len(self._pak_files))]
+        self._build_resource_lookup()
+
+        if hasattr(os, "pread"):
+            self._pak_filenos = [_fileno(pak_file) for pak_file in self._pak_files]
 
+    def _load_index(self, pak_id: int) -> PakIndex:
+        pak_file = self._pak_files[pak_id]
+        if self.index_cache_dir is not None:
+            return load_cached_pak_index(pak_file, self.pak_paths[pak_id], self.target_game, self.index_cache_dir)
+
+        logger.info("Parsing PAK at %s", str(self.pak_paths[pak_id]))
+        return read_pak_index(pak_file, self.target_game)
+
+    def _build_resource_lookup(self):
         self._resource_by_asset_id = {}
         for i, pak in enumerate(self._paks):
             for resource in pak.resources:
                 if resource.asset.id not in self._resource_by_asset_id:
                     self._resource_by_asset_id[resource.asset.id] = (resource, i)
 
-        return self
+        self.asset_locations = AssetLocations(self._paks)
+        self._duplicated_asset_ids = frozenset(self.asset_locations.duplicated_asset_ids())
+
+    def _close(self):
+        self._pak_filenos = None
+        if self._pak_views is not None:
+            for view in self._pak_views:
+                _release_view(view)
+            self._pak_views = None
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
         for pak in self._pak_files:
             pak.close()
         self._pak_files = None
 
-    def get_asset(self, asset_id: AssetId):
-        if asset_id in self.loaded_assets:
-            return self.loaded_assets[asset_id]
+    def _read_range(self, pak_id: int, offset: int, size: int):
+        if self._pak_views is not None and self._pak_views[pak_id] is not None:
+            return self._pak_views[pak_id][offset:offset + size]
+
+        if self._pak_filenos is not None and self._pak_filenos[pak_id] is not None:
+            return os.pread(self._pak_filenos[pak_id], size, offset)
+
+        with self._io_lock:
+            pak_file = self._pak_files[pak_id]
+            pak_file.seek(offset)
+            return pak_file.read(size)
 
+    def _read_resource(self, resource, pak_id: int):
+        self._last_read = (pak_id, resource.offset + resource.size)
+        return self._read_range(pak_id, resource.offset, resource.size)
+
+    def _locate(self, asset_id: AssetId):
         try:
-            resource, pak_id = self._resource_by_asset_id[asset_id]
+            return self._resource_by_asset_id[asset_id]
         except KeyError:
             raise UnknownAssetId(asset_id)
 
-        pak_file = self._pak_files[pak_id]
-        pak_file.seek(resource.offset)
-        data = pak_file.read(resource.size)
+    def _copies(self, asset_id: AssetId) -> List[Tuple[Any, int]]:
+        # Only the copies stored like the first one, as uncompressed resources are read with their padding
+        compressed = self._locate(asset_id)[0].compressed
+        return [
+            (resource, pak_id)
+            for resource, pak_id in ((self._paks[pak_id].resources[entry], pak_id)
+                                     for pak_id, entry in self.asset_locations.locations(asset_id))
+            if resource.compressed == compressed
+        ]
+
+    def _locate_for_read(self, asset_id: AssetId, preferred_pak: Optional[int] = None, near_offset: int = 0):
+        """
+        Same as `_locate`, but for assets in many paks picks the copy in `preferred_pak` closest to `near_offset`.
+        Without a preferred pak, the copy closest to the previous read is used.
+        """
+        location = self._locate(asset_id)
+        if asset_id not in self._duplicated_asset_ids:
+            return location
+
+        if preferred_pak is None:
+            preferred_pak, near_offset = self._last_read
+
+        best = None
+        for resource, pak_id in self._copies(asset_id):
+            if pak_id == preferred_pak:
+                distance = abs(resource.offset - near_offset)
+                if best is None or distance < best[0]:
+                    best = (distance, resource, pak_id)
+
+        return location if best is None else best[1:]
+
+    def _decompress_resource(self, asset_id: AssetId, resource, pak_id: int, data):
         if resource.compressed:
             try:
-                data = CompressedPakResource.parse(data, target_game=self.target_game)
+                data = decompress_pak_resource(data, self.target_game)
             except Exception as e:
                 raise InvalidAssetId(
                     asset_id,
@@ -76,8 +365,11 @@ class AssetProvider:
                     f"{self.pak_paths[pak_id]} at {resource.offset} with size {resource.size}: {e}.",
                 )
 
+        return data
+
+    def _parse_asset(self, asset_id: AssetId, resource, data):
         try:
-            format_for_type = formats.format_for(resource.asset.type)
+            format_for_type = formats.format_for(resource.asset.type, lazy=self.lazy_formats)
         except Exception:
             raise InvalidAssetId(asset_id, f"Unsupported type {resource.asset.type}")
 
@@ -86,9 +378,141 @@ class AssetProvider:
         except Exception:
             raise InvalidAssetId(asset_id, f"Unable to decode using type {resource.asset.type}")
 
-        self.loaded_assets[asset_id] = asset
+        self.loaded_assets.put(asset_id, asset, len(data), resource.asset.type)
         return asset
 
+    def _get_asset_data(self, asset_id: AssetId):
+        """
+        Reads and decompresses the given asset, without parsing it.
+        :return: A bytes-like object. With `use_mmap`, uncompressed assets are a memoryview into the pak.
+        """
+        resource, pak_id = self._locate_for_read(asset_id)
+        return self._decompress_resource(asset_id, resource, pak_id, self._read_resource(resource, pak_id))
+
+    def get_raw_asset(self, asset_id: AssetId) -> bytes:
+        """
+        The resource exactly as stored in the pak, compressed or not, including the alignment padding.
+        Useful for copying an asset into another pak without decompressing it.
+        """
+        resource, pak_id = self._locate(asset_id)
+        return bytes(self._read_resource(resource, pak_id))
+
+    def get_decompressed_bytes(self, asset_id: AssetId) -> bytes:
+        """
+        The decompressed data of the asset, without parsing it. Works for all asset types, including the ones
+        without a known format.
+        """
+        data = self.bytes_cache.get(asset_id)
+        if data is None:
+            data = bytes(self._get_asset_data(asset_id))
+            self.bytes_cache.put(asset_id, data, len(data))
+        return data
+
+    def get_asset(self, asset_id: AssetId):
+        asset = self.loaded_assets.get(asset_id)
+        if asset is not None:
+            return asset
+
+        resource, _ = self._locate(asset_id)
+        return self._parse_asset(asset_id, resource, self._get_asset_data(asset_id))
+
+    def _batched_reads(self, asset_ids: Iterable[AssetId]):
+        """
+        Groups the given assets by pak and sorts them by offset, merging resources that are close together into a
+        single read. Assets in many paks are read from the pak with the most of the other requested assets.
+        Yields (asset_id, resource, pak_id, data) for each asset.
+        """
+        by_pak: Dict[int, list] = {}
+        duplicated = []
+        for asset_id in asset_ids:
+            resource, pak_id = self._locate(asset_id)
+            if asset_id in self._duplicated_asset_ids:
+                duplicated.append(asset_id)
+            else:
+                by_pak.setdefault(pak_id, []).append((resource.offset, asset_id, resource))
+
+        for asset_id in duplicated:
+            copies = self._copies(asset_id)
+            pak_id = max((pak_id for _, pak_id in copies), key=lambda p: len(by_pak.get(p, ())))
+            resource, _ = self._locate_for_read(asset_id, pak_id)
+            by_pak.setdefault(pak_id, []).append((resource.offset, asset_id, resource))
+
+        for pak_id, entries in sorted(by_pak.items()):
+            entries.sort(key=lambda entry: entry[0])
+
+            runs = []
+            for offset, asset_id, resource in entries:
+                end = offset + resource.size
+                if runs and offset - runs[-1][1] <= _MAX_COALESCE_GAP and end - runs[-1][0] <= _MAX_COALESCED_READ:
+                    runs[-1][1] = max(runs[-1][1], end)
+                    runs[-1][2].append((asset_id, resource))
+                else:
+                    runs.append([offset, end, [(asset_id, resource)]])
+
+            for run_start, run_end, run in runs:
+                data = memoryview(self._read_range(pak_id, run_start, run_end - run_start))
+                for asset_id, resource in run:
+                    start = resource.offset - run_start
+                    yield asset_id, resource, pak_id, data[start:start + resource.size]
+
+    def _process_batch(self, asset_ids: Iterable[AssetId], process, max_workers: Optional[int]):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Limit how much data is read ahead of the workers
+            max_pending = 2 * max_workers
+            pending = set()
+
+            for asset_id, resource, pak_id, data in self._batched_reads(asset_ids):
+                pending.add(executor.submit(process, asset_id, resource, pak_id, data))
+                if len(pending) >= max_pending:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+            for future in concurrent.futures.as_completed(pending):
+                yield future.result()
+
+    def get_assets(self, asset_ids: Iterable[AssetId],
+                   max_workers: Optional[int] = None) -> Iterator[Tuple[AssetId, Any]]:
+        """
+        Fetches many assets at once. The reads are sorted by their position in the paks, and decompressing and parsing
+        happen in a thread pool.
+        :return: Yields (asset_id, asset) as each asset finishes, in no particular order.
+        """
+        missing = []
+        for asset_id in dict.fromkeys(asset_ids):
+            asset = self.loaded_assets.get(asset_id)
+            if asset is not None:
+                yield asset_id, asset
+            else:
+                missing.append(asset_id)
+
+        def process(asset_id, resource, pak_id, data):
+            data = self._decompress_resource(asset_id, resource, pak_id, data)
+            return asset_id, self._parse_asset(asset_id, resource, data)
+
+        yield from self._process_batch(missing, process, max_workers)
+
+    def get_assets_bytes(self, asset_ids: Iterable[AssetId],
+                         max_workers: Optional[int] = None) -> Iterator[Tuple[AssetId, bytes]]:
+        """
+        Same as `get_assets`, but yields the decompressed bytes of each asset instead of parsing them.
+        """
+        missing = []
+        for asset_id in dict.fromkeys(asset_ids):
+            data = self.bytes_cache.get(asset_id)
+            if data is not None:
+                yield asset_id, data
+            else:
+                missing.append(asset_id)
+
+        def process(asset_id, resource, pak_id, data):
+            return asset_id, bytes(self._decompress_resource(asset_id, resource, pak_id, data))
+
+        yield from self._process_batch(missing, process, max_workers)
+
     def get_type_for_asset(self, asset_id: AssetId) -> AssetType:
         try:
             return self._resource_by_asset_id[asset_id][0].asset.type
@@ -103,5 +527,157 @@ class AssetProvider:
         for resource, _ in self._resource_by_asset_id.values():
             yield resource
 
+    def resource_entries(self) -> Iterator[Tuple[AssetId, Any, Path]]:
+        """
+        Each asset, with the resource table entry that's read for it and the path of the pak with that entry.
+        """
+        for asset_id, (resource, pak_id) in self._resource_by_asset_id.items():
+            yield asset_id, resource, self.pak_paths[pak_id]
+
+    def pak_fingerprints(self) -> Dict[Path, Tuple[int, int, int, bytes]]:
+        """
+        The size, modification time, header length and header hash of each pak, which change whenever the pak does.
+        """
+        result = {}
+        for path, pak in zip(self.pak_paths, self._paks):
+            stat = path.stat()
+            result[path] = (stat.st_size, stat.st_mtime_ns, pak.header_length, pak.header_hash)
+        return result
+
+    def _write_ranges(self, pak_id: int, writes: List[Tuple[int, bytes]]):
+        if self._owns_pak_files:
+            with self.pak_paths[pak_id].open("r+b") as pak_file:
+                for offset, data in writes:
+                    pak_file.seek(offset)
+                    pak_file.write(data)
+        else:
+            with self._io_lock:
+                pak_file = self._pak_files[pak_id]
+                for offset, data in writes:
+                    pak_file.seek(offset)
+                    pak_file.write(data)
+                pak_file.flush()
+
+    def _pak_size(self, pak_id: int) -> int:
+        if self._owns_pak_files:
+            return self.pak_paths[pak_id].stat().st_size
+        with self._io_lock:
+            return self._pak_files[pak_id].seek(0, io.SEEK_END)
+
+    def _refresh_pak(self, pak_id: int):
+        # The file changed under the mapping and the index, so remap it and update the header hash
+        if self._pak_views is not None:
+            _release_view(self._pak_views[pak_id])
+            self._pak_views[pak_id] = _map_pak_file(self._pak_files[pak_id])
+
+        pak = self._paks[pak_id]
+        pak.header_hash = hashlib.sha1(self._read_range(pak_id, 0, pak.header_length)).digest()
+        if self.index_cache_dir is not None:
+            save_cached_pak_index(pak, self.pak_paths[pak_id], self.index_cache_dir)
+
     def save_asset(self, asset_id: AssetId, data: bytes):
-        raise NotImplementedError()
\ No newline at end of file
+        """
+        Replaces the data of an existing asset, patching its paks instead of rebuilding them. Every copy of the asset
+        is replaced, so reads stay consistent whichever copy they use.
+        A resource is written over the old one when it fits in its space, and appended to the end of the pak
+        otherwise. Only the resource and its entry in the resource table are written.
+        Use `compact` to reclaim the space left unused by this.
+        Must not be called while other threads read from this provider.
+        :param data: The decompressed data. It's compressed for the copies that are compressed.
+        """
+        self._locate(asset_id)
+        encoded = {}
+
+        by_pak: Dict[int, List[int]] = {}
+        for pak_id, index in self.asset_locations.locations(asset_id):
+            by_pak.setdefault(pak_id, []).append(index)
+
+        for pak_id, indices in by_pak.items():
+            pak = self._paks[pak_id]
+            end = self._pak_size(pak_id)
+            writes = []
+            # Copies in the same pak may share their data
+            new_slots: Dict[int, Tuple[int, int]] = {}
+
+            for index in indices:
+                resource = pak.resources[index]
+                if resource.offset not in new_slots:
+                    compressed = resource.compressed > 0
+                    if compressed not in encoded:
+                        raw = compress_pak_resource(data, self.target_game) if compressed else bytes(data)
+                        encoded[compressed] = raw + b"\xFF" * (-len(raw) % RESOURCE_ALIGNMENT)
+                    resource_data = encoded[compressed]
+
+                    if len(resource_data) <= resource.size:
+                        offset = resource.offset
+                    else:
+                        offset = end + (-end % RESOURCE_ALIGNMENT)
+                        end = offset + len(resource_data)
+                    writes.append((offset, resource_data))
+                    new_slots[resource.offset] = (offset, len(resource_data))
+
+                offset, size = new_slots[resource.offset]
+                table_entry = pak.header_length - (len(pak) - index) * ResourceHeader.sizeof()
+                writes.append((table_entry + 0xC, struct.pack(">LL", size, offset)))
+                resource.size = pak.sizes[index] = size
+                resource.offset = pak.offsets[index] = offset
+
+            self._write_ranges(pak_id, writes)
+            self._refresh_pak(pak_id)
+
+        self.loaded_assets.discard(asset_id)
+        self.bytes_cache.discard(asset_id)
+
+    def _unused_space(self, pak_id: int) -> int:
+        pak = self._paks[pak_id]
+        used = pak.header_length + (-pak.header_length % RESOURCE_ALIGNMENT)
+        used += sum(dict(zip(pak.offsets, pak.sizes)).values())
+        return self._pak_size(pak_id) - used
+
+    def compact(self) -> int:
+        """
+        Rewrites the paks with space left unused by `save_asset`, with their resources back to back as `PAK.build`
+        places them. Resources are copied as stored, without compressing them again.
+        Only possible when the paks were opened from `pak_paths`.
+        :return: How many bytes were reclaimed.
+        """
+        if not self._owns_pak_files:
+            raise ValueError("Only paks opened from pak_paths can be compacted")
+
+        reclaimed = 0
+        for pak_id, pak in enumerate(self._paks):
+            unused = self._unused_space(pak_id)
+            if unused <= 0:
+                continue
+
+            path = self.pak_paths[pak_id]
+            logger.info("Compacting PAK at %s", str(path))
+            header = PAKNoData.parse(self._read_range(pak_id, 0, pak.header_length), target_game=self.target_game)
+            temp_path = path.with_name(path.name + ".tmp")
+            # One reader per offset, so the entries sharing their data keep sharing a single copy
+            readers = {}
+            for resource in pak.resources:
+                readers.setdefault(resource.offset, lambda r=resource: self._read_resource(r, pak_id))
+            with temp_path.open("wb") as output:
+                write_pak(output, [
+                    ((resource.asset.type, resource.asset.id), None, readers[resource.offset],
+                     resource.compressed > 0)
+                    for resource in pak.resources
+                ], self.target_game, named_resources=header.named_resources, precompressed=True)
+
+            if self._pak_views is not None:
+                _release_view(self._pak_views[pak_id])
+            self._pak_files[pak_id].close()
+            os.replace(temp_path, path)
+
+            self._pak_files[pak_id] = path.open("rb")
+            if self._pak_views is not None:
+                self._pak_views[pak_id] = _map_pak_file(self._pak_files[pak_id])
+            if self._pak_filenos is not None:
+                self._pak_filenos[pak_id] = _fileno(self._pak_files[pak_id])
+            self._paks[pak_id] = self._load_index(pak_id)
+            reclaimed += unused
+
+        if reclaimed:
+            self._build_resource_lookup()
+        return reclaimed
\ No newline at end of file
@@ -11,6 +11,7 @@ from typing import Optional, List
 from retro_data_structures import dependencies, formats
 from retro_data_structures.asset_provider import AssetProvider
 from retro_data_structures.construct_extensions.json import convert_to_raw_python
+from retro_data_structures.dependency_graph import DependencyGraph
 from retro_data_structures.conversion import conversions
 from retro_data_structures.conversion.asset_converter import AssetConverter
 from retro_data_structures.formats import mlvl, AssetId
@@ -76,12 +77,27 @@ def create_parser():
     decode_from_paks.add_argument("paks_path", type=Path, help="Path to where to find pak files")
     decode_from_paks.add_argument("asset_id", type=lambda x: int(x, 0), help="Asset id to print")
 
+    duplicates = subparser.add_parser("pak-duplicates", help="Report the assets stored in more than one pak.")
+    add_game_argument(duplicates)
+    duplicates.add_argument("paks_path", type=Path, help="Path to where to find pak files")
+
     deps = subparser.add_parser("list-dependencies")
     add_game_argument(deps)
     deps.add_argument("paks_path", type=Path, help="Path to where to find pak files")
     g = deps.add_mutually_exclusive_group()
     g.add_argument("--asset-ids", type=lambda x: int(x, 0), nargs="+", help="Asset id to list dependencies for")
     g.add_argument("--asset-type", type=str, help="List dependencies for all assets of the given type.")
+    deps.add_argument("--full-parse", action="store_true",
+                      help="Always parse the assets instead of scanning their bytes for dependencies.")
+    deps.add_argument("--cross-check", action="store_true",
+                      help="Compare the scanned dependencies with the ones from fully parsing each asset.")
+    deps.add_argument("--workers", type=int, default=None,
+                      help="Number of processes used to read the assets. Defaults to doing everything in-process.")
+    deps.add_argument("--graph-cache", type=Path,
+                      help="Answer from a dependency graph stored in this file, updating it first if the paks changed. "
+                           "Can't be combined with --cross-check or --workers.")
+    deps.add_argument("--dependents", action="store_true",
+                      help="List the assets that directly depend on the given assets instead. Requires --graph-cache.")
 
     convert = subparser.add_parser("convert")
     add_game_argument(convert, "--source-game")
@@ -146,11 +162,58 @@ def do_decode_from_pak(args):
         print(asset_provider.get_asset(asset_id))
 
 
+def do_pak_duplicates(args):
+    game: Game = args.game
+    pak_paths = sorted(args.paks_path.glob("*.pak"))
+
+    with AssetProvider(game, pak_paths) as asset_provider:
+        locations = asset_provider.asset_locations
+        for key, value in locations.duplication_stats().items():
+            print(f"{key}: {value}")
+
+        print("Redundant bytes by type:")
+        for asset_type, size in sorted(locations.redundant_bytes_by_type().items(), key=lambda item: -item[1]):
+            print(f"    {asset_type}: {size}")
+
+        print("Bytes shared with other paks:")
+        for path, size in zip(pak_paths, locations.shared_bytes_by_pak()):
+            print(f"    {path.name}: {size}")
+
+
+def _list_dependencies_from_graph(args, pak_paths: List[Path]):
+    game: Game = args.game
+
+    with DependencyGraph(args.graph_cache, game) as graph:
+        if not graph.is_up_to_date(pak_paths):
+            with AssetProvider(game, pak_paths) as asset_provider:
+                graph.update(asset_provider, use_scanners=not args.full_parse)
+
+        if args.asset_ids is not None:
+            asset_ids = args.asset_ids
+        else:
+            asset_ids = graph.asset_ids_of_type(args.asset_type)
+
+        if args.dependents:
+            result = set()
+            for asset_id in asset_ids:
+                result.update(graph.dependents(asset_id))
+        else:
+            result = graph.recursive_dependencies(asset_ids)
+
+        for asset_type, asset_id in result:
+            print("{}: {}".format(asset_type, hex(asset_id)))
+
+
 def list_dependencies(args):
     game: Game = args.game
     paks_path: Path = args.paks_path
     asset_ids: List[int]
 
+    if args.graph_cache is not None:
+        return _list_dependencies_from_graph(args, list(paks_path.glob("*.pak")))
+    if args.dependents:
+        raise ValueError("--dependents requires --graph-cache")
+
     with AssetProvider(game, list(paks_path.glob("*.pak"))) as asset_provider:
         if args.asset_ids is not None:
             asset_ids = args.asset_ids
@@ -161,7 +224,10 @@ def list_dependencies(args):
                 if resource.asset.type == args.asset_type.upper()
             ]
 
-        for asset_type, asset_id in dependencies.recursive_dependencies_for(asset_provider, asset_ids):
+        for asset_type, asset_id in dependencies.recursive_dependencies_for(
+            asset_provider, asset_ids, use_scanners=not args.full_parse, cross_check=args.cross_check,
+            max_workers=args.workers,
+        ):
             print("{}: {}".format(asset_type, hex(asset_id)))
 
 
@@ -295,7 +361,12 @@ async def compare_all_files_in_path(args):
 
 def main():
     logging.basicConfig(level=logging.INFO)
-    args = create_parser().parse_args()
+    parser = create_parser()
+    args = parser.parse_args()
+
+    if args.command == "list-dependencies" and args.graph_cache is not None:
+        if args.cross_check or args.workers is not None:
+            parser.error("--cross-check and --workers can't be used with --graph-cache")
 
     if args.command == "ksy-export":
         do_ksy_export(args)
@@ -303,6 +374,8 @@ def main():
         do_decode(args)
     elif args.command == "decode-from-pak":
         do_decode_from_pak(args)
+    elif args.command == "pak-duplicates":
+        do_pak_duplicates(args)
     elif args.command == "list-dependencies":
         list_dependencies(args)
     elif args.command == "convert":
@@ -1,5 +1,10 @@
 import io
 import math
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
 
 import construct
 import lzokay
@@ -77,6 +82,28 @@ class LZOCompressedBlock(Adapter):
             # Another segment with this size
             return segment_size
 
+    def _parse(self, stream, context, path):
+        # Same result as parsing the GreedyRange of LZOSegment, but without going through construct for each segment
+        decompressed_size = construct.evaluate(self.decompressed_size, context)
+        segment_size = construct.evaluate(self.segment_size, context)
+
+        start = construct.stream_tell(stream, path)
+        data = construct.stream_read_entire(stream, path)
+        try:
+            result, consumed = _decompress_lzo_segments(memoryview(data), decompressed_size, segment_size, None)
+        except construct.StreamError as e:
+            raise construct.StreamError(str(e), path) from e
+
+        construct.stream_seek(stream, start + consumed, 0, path)
+        return bytes(result)
+
+    def _build(self, obj, stream, context, path):
+        # Same result as building each LZOSegment, with the segments compressed in parallel when worth it
+        segments = self._encode(obj, context, path)
+        data = b"".join(_map_segments(_compress_segment, segments, None))
+        construct.stream_write(stream, data, len(data), path)
+        return obj
+
     def _decode(self, segments, context, path):
         return b"".join(segments)
 
@@ -97,4 +124,112 @@ class LZOCompressedBlock(Adapter):
         ]
 
 
+# Below this many segments, the overhead of the thread pool is bigger than the gains
+_PARALLEL_MIN_SEGMENTS = 8
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix="lzo")
+        return _executor
+
+
+def _use_parallel(segment_count: int, parallel: Optional[bool]) -> bool:
+    if parallel is None:
+        return segment_count >= _PARALLEL_MIN_SEGMENTS and (os.cpu_count() or 1) > 1
+    return parallel
+
+
+def _map_segments(func, segments: list, parallel: Optional[bool]) -> list:
+    if _use_parallel(len(segments), parallel):
+        return list(_shared_executor().map(func, segments))
+    return [func(segment) for segment in segments]
+
+
+def _compress_segment(segment) -> bytes:
+    segment = bytes(segment)
+    compressed = lzokay.compress(segment)
+    if len(compressed) < len(segment):
+        return struct.pack(">h", len(compressed)) + compressed
+    return struct.pack(">h", -len(segment)) + segment
+
+
+def _split_segments(data, segment_size: int) -> list:
+    return [data[i:i + segment_size] for i in range(0, len(data), segment_size)]
+
+
+def compress_lzo_segments(data, segment_size: int = 0x4000, parallel: Optional[bool] = None) -> bytes:
+    """
+    Encodes the data exactly like building a `LZOCompressedBlock`.
+    :param parallel: See `decompress_lzo_segments`.
+    """
+    return b"".join(_map_segments(_compress_segment, _split_segments(data, segment_size), parallel))
+
+
+def compress_lzo_blocks(blocks: Sequence, segment_size: int = 0x4000, parallel: Optional[bool] = None) -> List[bytes]:
+    """
+    Same as calling `compress_lzo_segments` for each block, but with the segments of all blocks sharing the thread
+    pool, so a few big blocks still use every worker.
+    """
+    split_blocks = [_split_segments(block, segment_size) for block in blocks]
+    compressed = iter(_map_segments(_compress_segment, [segment for block in split_blocks for segment in block],
+                                    parallel))
+    return [b"".join(next(compressed) for _ in block) for block in split_blocks]
+
+
+def _scan_lzo_segments(view: memoryview, decompressed_size: int, segment_size: int):
+    """
+    Reads the header of every segment needed for `decompressed_size` bytes.
+    :return: The (output offset, decompressed size, segment data, is compressed) of each segment, and how many bytes
+    of `view` they use.
+    """
+    segments = []
+    offset = 0
+    for start in range(0, decompressed_size, segment_size):
+        expected_size = min(segment_size, decompressed_size - start)
+        if offset + 2 > len(view):
+            raise construct.StreamError(f"Missing segment header at {offset}")
+        length = struct.unpack_from(">h", view, offset)[0]
+        offset += 2
+        if offset + abs(length) > len(view):
+            raise construct.StreamError(f"Segment at {offset} needs {abs(length)} bytes, only {len(view) - offset} left")
+
+        segments.append((start, expected_size, view[offset:offset + abs(length)], length > 0))
+        offset += abs(length)
+
+    return segments, offset
+
+
+def decompress_lzo_segments(data, decompressed_size: int, segment_size: int = 0x4000,
+                            parallel: Optional[bool] = None) -> bytearray:
+    """
+    Decodes the same data as `LZOCompressedBlock`, but directly from any bytes-like object (such as a memoryview
+    of a mmap) and into a single preallocated buffer, avoiding the intermediate streams and joins.
+    :param parallel: Decompress the segments in a shared thread pool; lzokay releases the GIL while decompressing.
+    Defaults to doing so when there are enough segments and more than one CPU.
+    """
+    return _decompress_lzo_segments(memoryview(data), decompressed_size, segment_size, parallel)[0]
+
+
+def _decompress_lzo_segments(view: memoryview, decompressed_size: int, segment_size: int,
+                             parallel: Optional[bool]):
+    segments, consumed = _scan_lzo_segments(view, decompressed_size, segment_size)
+    result = bytearray(decompressed_size)
+
+    def decompress(segment):
+        start, expected_size, data, compressed = segment
+        if compressed:
+            data = lzokay.decompress(bytes(data), expected_size)
+        if len(data) != expected_size:
+            raise construct.StreamError(f"Expected to decompress {expected_size} bytes, got {len(data)}")
+        result[start:start + expected_size] = data
+
+    _map_segments(decompress, segments, parallel)
+    return result, consumed
+
+
 ZlibCompressedBlock = construct.Compressed(construct.GreedyBytes, "zlib", level=9)
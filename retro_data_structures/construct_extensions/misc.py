@@ -1,3 +1,5 @@
+import typing
+
 import construct
 from construct import FocusedSeq, Rebuild, len_, this, stream_tell, Construct, Optional, Const
 
@@ -109,3 +111,84 @@ def LabeledOptional(label, subcon):
             "subcon" / subcon,
         )
     )
+
+
+class LazyValue:
+    """
+    A value that is only parsed when first accessed through a `LazyFieldsContainer`.
+    """
+
+    def __init__(self, execute, raw=None):
+        """
+        :param raw: The bytes the value is parsed from, when known, so it can be written back without parsing it.
+        """
+        self.execute = execute
+        self.raw = raw
+
+    def __call__(self):
+        return self.execute()
+
+    def __repr__(self):
+        return "<LazyValue>"
+
+
+def resolve_lazy(obj):
+    """
+    Recursively replaces all `LazyValue` in the given object with their parsed values.
+    """
+    if isinstance(obj, LazyValue):
+        obj = obj()
+    if isinstance(obj, dict):
+        for key in list(obj.keys()):
+            dict.__setitem__(obj, key, resolve_lazy(dict.__getitem__(obj, key)))
+    elif isinstance(obj, list):
+        for i, item in enumerate(obj):
+            obj[i] = resolve_lazy(item)
+    return obj
+
+
+class LazyFieldsContainer(construct.Container):
+    """
+    Container that parses `LazyValue` fields on first access, replacing them with the result.
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, LazyValue):
+            value = value()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def is_loaded(self, key) -> bool:
+        return not isinstance(super().__getitem__(key), LazyValue)
+
+    def get_lazy(self, key) -> typing.Optional[LazyValue]:
+        """
+        The `LazyValue` of the given field, or None if it's already loaded.
+        """
+        value = super().__getitem__(key)
+        return value if isinstance(value, LazyValue) else None
+
+
+class LazyFields(construct.Adapter):
+    """
+    Exposes the result of the given Struct as a `LazyFieldsContainer`. Fields that use lazy constructs (such as
+    `LazyDataSections`) are then only decoded when accessed. Building always decodes everything first.
+    """
+
+    def _decode(self, obj, context, path):
+        return LazyFieldsContainer(obj)
+
+    def _encode(self, obj, context, path):
+        return resolve_lazy(obj)
@@ -1,7 +1,10 @@
+import struct
+
+import construct
 from construct import Tell, Pointer, Int32ub, Struct, Array, Rebuild, If
 
 from retro_data_structures.construct_extensions.alignment import AlignedPrefixed
-from retro_data_structures.construct_extensions.misc import Skip
+from retro_data_structures.construct_extensions.misc import LazyValue, Skip
 
 
 def _get_current_section(context, increment=True):
@@ -44,3 +47,54 @@ def DataSectionSizePointer():
 
 def DataSection(subcon, align=32, size=DataSectionSizePointer):
     return AlignedPrefixed(size(), subcon, align, 0, b"\x00")
+
+
+def _read_section_sizes(stream, context, first: int, count: int, path):
+    sizes = context._root.data_section_sizes
+    if sizes.get("value") is not None:
+        return list(sizes.value[first:first + count])
+
+    fallback = construct.stream_tell(stream, path)
+    construct.stream_seek(stream, sizes.address + first * Int32ub.length, 0, path)
+    result = list(struct.unpack(f">{count}L", construct.stream_read(stream, count * Int32ub.length, path)))
+    construct.stream_seek(stream, fallback, 0, path)
+    return result
+
+
+class LazyDataSections(construct.Subconstruct):
+    """
+    Wraps a subcon that spans `count` consecutive data sections. Parsing only skips over the sections, returning a
+    `LazyValue` that parses the subcon when called. Use it inside `LazyFields`.
+    """
+
+    def __init__(self, subcon, count):
+        super().__init__(subcon)
+        self.count = count
+
+    def _parse(self, stream, context, path):
+        root = context._root
+        count = construct.evaluate(self.count, context)
+        first_section = root["_current_section"]
+        offset = construct.stream_tell(stream, path)
+
+        length = sum(_read_section_sizes(stream, context, first_section, count, path))
+        root["_current_section"] += count
+        construct.stream_seek(stream, offset + length, 0, path)
+
+        def execute():
+            fallback = construct.stream_tell(stream, path)
+            current_section = root["_current_section"]
+            construct.stream_seek(stream, offset, 0, path)
+            root["_current_section"] = first_section
+            try:
+                return self.subcon._parsereport(stream, context, path)
+            finally:
+                root["_current_section"] = current_section
+                construct.stream_seek(stream, fallback, 0, path)
+
+        return LazyValue(execute)
+
+    def _build(self, obj, stream, context, path):
+        if isinstance(obj, LazyValue):
+            obj = obj()
+        return self.subcon._build(obj, stream, context, path)
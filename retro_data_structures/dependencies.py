@@ -1,5 +1,9 @@
+import atexit
 import logging
-from typing import Iterator, Dict, Set, List, NamedTuple, Callable, Any
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Dict, Set, List, NamedTuple, Callable, Iterable, Tuple, Optional
 
 from retro_data_structures.asset_provider import AssetProvider, UnknownAssetId, InvalidAssetId
 from retro_data_structures.conversion.asset_converter import AssetConverter
@@ -23,6 +27,21 @@ class InvalidDependency(Exception):
         self.dependency_type = dependency_type
 
 
+class DependencyScanMismatch(Exception):
+    def __init__(self, asset_id: AssetId, asset_type: AssetType, scanned: Set[Dependency], parsed: Set[Dependency]):
+        super().__init__(
+            f"Asset id 0x{asset_id:08X} ({asset_type}) has different dependencies when scanned: "
+            f"missing {sorted(parsed - scanned)}, extra {sorted(scanned - parsed)}."
+        )
+        self.asset_id = asset_id
+        self.asset_type = asset_type
+        self.scanned = scanned
+        self.parsed = parsed
+
+    def __reduce__(self):
+        return type(self), (self.asset_id, self.asset_type, self.scanned, self.parsed)
+
+
 def _no_dependencies(_obj, _target_game):
     pass
 
@@ -38,6 +57,16 @@ _dependency_functions = {
     "dgrp": dgrp.dependencies_for,
 }
 
+# Functions that read the dependencies directly from the decompressed bytes of an asset, without parsing it.
+# These must always produce the same dependencies as the matching entry of `_dependency_functions`.
+_fast_dependency_functions = {
+    "cmdl": cmdl.dependencies_from_bytes,
+    "evnt": evnt.dependencies_from_bytes,
+    "part": part.dependencies_from_bytes,
+    "scan": scan.dependencies_from_bytes,
+    "dgrp": dgrp.dependencies_from_bytes,
+}
+
 
 def format_has_dependencies(obj_type: AssetType):
     return obj_type.lower() not in _formats_without_dependencies
@@ -48,41 +77,212 @@ def direct_dependencies_for(obj, obj_type: AssetType, target_game: Game) -> Iter
         yield from _dependency_functions[obj_type.lower()](obj, target_game)
 
 
+def has_dependency_function(obj_type: AssetType) -> bool:
+    return obj_type.lower() in _dependency_functions
+
+
+def has_fast_dependencies(obj_type: AssetType) -> bool:
+    return obj_type.lower() in _fast_dependency_functions
+
+
+def direct_dependencies_from_bytes(data: bytes, obj_type: AssetType, target_game: Game) -> Iterator[Dependency]:
+    """
+    Same as `direct_dependencies_for`, but using the decompressed bytes of the asset.
+    Only valid for types where `has_fast_dependencies` is True.
+    """
+    for new_type, new_asset_id in _fast_dependency_functions[obj_type.lower()](data, target_game):
+        yield Dependency(new_type, new_asset_id)
+
+
+_DirectDependencies = Callable[..., Iterable[Tuple[AssetType, AssetId]]]
+
+# For each asset of a level: its direct dependencies, or the exception raised while getting them
+_LevelResult = Tuple[AssetId, Optional[List[Dependency]], Optional[Exception]]
+_LevelDependencies = Callable[[List[Tuple[AssetId, AssetType]]], Iterable[_LevelResult]]
+
+
+def _serial_level_dependencies(get_direct_dependencies: _DirectDependencies) -> _LevelDependencies:
+    def get_level(level: List[Tuple[AssetId, AssetType]]) -> Iterator[_LevelResult]:
+        for asset_id, obj_type in level:
+            yield _level_entry(get_direct_dependencies, asset_id, obj_type)
+
+    return get_level
+
+
+def _level_entry(get_direct_dependencies: _DirectDependencies, asset_id: AssetId, obj_type: AssetType) -> _LevelResult:
+    try:
+        return asset_id, [Dependency(*dep) for dep in get_direct_dependencies(asset_id, obj_type)], None
+    except (UnknownAssetId, InvalidAssetId) as e:
+        return asset_id, None, e
+
+
 def _internal_dependencies_for(
-    get_asset: Callable[[AssetId], Any],
-    target_game: Game,
-    asset_id: AssetId,
-    obj_type: AssetType,
+    get_level_dependencies: _LevelDependencies,
+    roots: Iterable[Tuple[AssetId, AssetType]],
     deps_by_asset_id: Dict[AssetId, Set[Dependency]],
 ):
-    if asset_id in deps_by_asset_id:
-        return
+    """
+    Breadth-first search from the given roots, fetching the direct dependencies of a whole level at once.
+    Assets already in `deps_by_asset_id` are never fetched again.
+    """
+    # Which asset first referenced each asset, for error messages
+    parent_of: Dict[AssetId, AssetId] = {}
+
+    def visit(asset_id: AssetId, obj_type: AssetType, level: List[Tuple[AssetId, AssetType]]):
+        deps_by_asset_id[asset_id] = {Dependency(obj_type, asset_id)}
+        if format_has_dependencies(obj_type):
+            level.append((asset_id, obj_type))
+
+    level = []
+    for asset_id, obj_type in roots:
+        if asset_id not in deps_by_asset_id:
+            visit(asset_id, obj_type, level)
+
+    while level:
+        type_by_id = dict(level)
+        next_level = []
+        for asset_id, direct_dependencies, error in get_level_dependencies(level):
+            if error is not None:
+                if asset_id not in parent_of:
+                    raise error
+                parent_id = parent_of[asset_id]
+                if isinstance(error, UnknownAssetId):
+                    logging.warning(
+                        f"Asset id 0x{parent_id:08X} has dependency 0x{asset_id:08X} ({type_by_id[asset_id]}) "
+                        f"that doesn't exist."
+                    )
+                    continue
+                raise InvalidDependency(parent_id, asset_id, type_by_id[asset_id]) from error
+
+            for dependency in direct_dependencies:
+                deps_by_asset_id[asset_id].add(dependency)
+                if dependency.id not in deps_by_asset_id:
+                    parent_of[dependency.id] = asset_id
+                    visit(dependency.id, dependency.type, next_level)
+
+        level = next_level
+
 
-    deps_by_asset_id[asset_id] = {Dependency(obj_type, asset_id)}
-    if not format_has_dependencies(obj_type):
-        return
+def provider_direct_dependencies(asset_provider: AssetProvider, use_scanners: bool = True,
+                                 cross_check: bool = False) -> _DirectDependencies:
+    """
+    Creates a function that returns the direct dependencies of an asset of the given provider.
+    The function also accepts the asset already fetched: its decompressed bytes when it's scanned, the parsed asset
+    otherwise.
+    See `recursive_dependencies_for` for the arguments.
+    """
+    target_game = asset_provider.target_game
 
-    obj = get_asset(asset_id)
-    for new_type, new_asset_id in direct_dependencies_for(obj, obj_type, target_game):
-        deps_by_asset_id[asset_id].add(Dependency(new_type, new_asset_id))
+    def parsed_dependencies(asset_id: AssetId, obj_type: AssetType, obj=None) -> List[Dependency]:
+        if obj is None:
+            obj = asset_provider.get_asset(asset_id)
+        return [Dependency(*dep) for dep in direct_dependencies_for(obj, obj_type, target_game)]
+
+    def get_direct_dependencies(asset_id: AssetId, obj_type: AssetType, fetched=None) -> List[Dependency]:
+        if not (use_scanners and has_fast_dependencies(obj_type)):
+            return parsed_dependencies(asset_id, obj_type, fetched)
+
+        data = fetched if fetched is not None else asset_provider.get_decompressed_bytes(asset_id)
         try:
-            _internal_dependencies_for(get_asset, target_game, new_asset_id, new_type, deps_by_asset_id)
-        except UnknownAssetId:
-            logging.warning(
-                f"Asset id 0x{asset_id:08X} has dependency 0x{new_asset_id:08X} ({new_type}) " f"that doesn't exist."
-            )
+            result = list(direct_dependencies_from_bytes(data, obj_type, target_game))
+        except (struct.error, ValueError, IndexError) as e:
+            logging.warning(f"Unable to scan asset id 0x{asset_id:08X} ({obj_type}), parsing it instead: {e}")
+            return parsed_dependencies(asset_id, obj_type)
+
+        if cross_check:
+            parsed = set(parsed_dependencies(asset_id, obj_type))
+            if set(result) != parsed:
+                raise DependencyScanMismatch(asset_id, obj_type, set(result), parsed)
+
+        return result
+
+    return get_direct_dependencies
+
+
+def _provider_level_dependencies(asset_provider: AssetProvider, use_scanners: bool, cross_check: bool,
+                                 max_workers: Optional[int]) -> _LevelDependencies:
+    get_direct_dependencies = provider_direct_dependencies(asset_provider, use_scanners, cross_check)
+
+    def get_level(level: List[Tuple[AssetId, AssetType]]) -> Iterator[_LevelResult]:
+        # The whole level is fetched in one batch, with the reads sorted by position in the paks and the
+        # decompressing done in a thread pool. A single asset isn't worth the pool.
+        scanned, parsed = [], []
+        for asset_id, obj_type in level:
+            if len(level) > 1 and asset_provider.asset_id_exists(asset_id):
+                (scanned if use_scanners and has_fast_dependencies(obj_type) else parsed).append(asset_id)
+
+        fetched = {}
+        try:
+            if scanned:
+                fetched.update(asset_provider.get_assets_bytes(scanned, max_workers))
+            if parsed:
+                fetched.update(asset_provider.get_assets(parsed, max_workers))
         except InvalidAssetId:
-            raise InvalidDependency(asset_id, new_asset_id, new_type)
+            # The assets not fetched yet are fetched one at a time, which reports the error for the right asset
+            pass
+
+        for asset_id, obj_type in level:
+            yield _level_entry(
+                lambda i, t: get_direct_dependencies(i, t, fetched.pop(i, None)), asset_id, obj_type,
+            )
 
+    return get_level
 
-def recursive_dependencies_for(asset_provider: AssetProvider, asset_ids: List[AssetId]) -> Set[Dependency]:
+
+# The AssetProvider of each worker process of `recursive_dependencies_for`
+_worker_direct_dependencies: Optional[_DirectDependencies] = None
+
+
+def _init_worker(target_game: Game, pak_paths: List[Path], use_mmap: bool, index_cache_dir: Optional[Path],
+                 use_scanners: bool, cross_check: bool):
+    global _worker_direct_dependencies
+    asset_provider = AssetProvider(target_game, pak_paths, use_mmap=use_mmap, index_cache_dir=index_cache_dir)
+    asset_provider.__enter__()
+    atexit.register(asset_provider.__exit__, None, None, None)
+    _worker_direct_dependencies = provider_direct_dependencies(asset_provider, use_scanners, cross_check)
+
+
+def _worker_level_dependencies(chunk: List[Tuple[AssetId, AssetType]]) -> List[_LevelResult]:
+    return [_level_entry(_worker_direct_dependencies, asset_id, obj_type) for asset_id, obj_type in chunk]
+
+
+def _pool_level_dependencies(pool: ProcessPoolExecutor, max_workers: int) -> _LevelDependencies:
+    def get_level(level: List[Tuple[AssetId, AssetType]]) -> Iterator[_LevelResult]:
+        # A few chunks per worker, so a single expensive asset doesn't leave the other workers idle
+        chunk_size = max(1, len(level) // (max_workers * 4))
+        chunks = [level[i:i + chunk_size] for i in range(0, len(level), chunk_size)]
+        for results in pool.map(_worker_level_dependencies, chunks):
+            yield from results
+
+    return get_level
+
+
+def recursive_dependencies_for(asset_provider: AssetProvider, asset_ids: List[AssetId],
+                               use_scanners: bool = True, cross_check: bool = False,
+                               max_workers: Optional[int] = None) -> Set[Dependency]:
+    """
+    Returns the given assets and everything they depend on, directly or not.
+    :param use_scanners: For the formats that support it, read the dependencies straight from the asset's bytes
+    instead of fully parsing it.
+    :param cross_check: Also fully parse every scanned asset, raising DependencyScanMismatch if the results differ.
+    :param max_workers: When greater than 1, each level of the search is fetched by that many processes, each one
+    with its own AssetProvider for the same paks. Otherwise, everything is done with `asset_provider`, fetching each
+    level with `AssetProvider.get_assets`.
+    """
     deps_by_asset_id: Dict[AssetId, Set[Dependency]] = {}
+    roots = [(asset_id, asset_provider.get_type_for_asset(asset_id)) for asset_id in asset_ids]
 
-    for asset_id in asset_ids:
-        obj_type = asset_provider.get_type_for_asset(asset_id)
-        _internal_dependencies_for(
-            asset_provider.get_asset, asset_provider.target_game, asset_id, obj_type, deps_by_asset_id
-        )
+    if max_workers is not None and max_workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(asset_provider.target_game, list(asset_provider.pak_paths), asset_provider.use_mmap,
+                      asset_provider.index_cache_dir, use_scanners, cross_check),
+        ) as pool:
+            _internal_dependencies_for(_pool_level_dependencies(pool, max_workers), roots, deps_by_asset_id)
+    else:
+        _internal_dependencies_for(_provider_level_dependencies(asset_provider, use_scanners, cross_check, max_workers),
+                                   roots, deps_by_asset_id)
 
     result = set()
     for deps in deps_by_asset_id.values():
@@ -100,10 +300,13 @@ def all_converted_dependencies(asset_converter: AssetConverter) -> Dict[AssetId,
         except KeyError:
             raise UnknownAssetId(asset_id) from None
 
-    for converted in asset_converter.converted_assets.values():
-        if converted.id not in deps_by_asset_id:
-            _internal_dependencies_for(
-                get_asset, asset_converter.target_game, converted.id, converted.type, deps_by_asset_id
-            )
+    def get_direct_dependencies(asset_id: AssetId, obj_type: AssetType):
+        return direct_dependencies_for(get_asset(asset_id), obj_type, asset_converter.target_game)
+
+    _internal_dependencies_for(
+        _serial_level_dependencies(get_direct_dependencies),
+        [(converted.id, converted.type) for converted in asset_converter.converted_assets.values()],
+        deps_by_asset_id,
+    )
 
     return deps_by_asset_id
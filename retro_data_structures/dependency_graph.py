@@ -0,0 +1,250 @@
+"""
+Persistent graph of the direct dependencies of every asset in a set of paks.
+
+Listing dependencies of many assets means reading and scanning most of a game, so the graph keeps the result in a
+SQLite database. Each asset is stored with a hash of its data, and each pak with a fingerprint of its size,
+modification time and header, so `DependencyGraph.update` only needs to scan the assets that actually changed.
+"""
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+from retro_data_structures import dependencies
+from retro_data_structures.asset_provider import AssetProvider, InvalidAssetId, UnknownAssetId
+from retro_data_structures.dependencies import Dependency
+from retro_data_structures.formats import AssetId, AssetType
+from retro_data_structures.game_check import Game
+from retro_data_structures.pak_index import hash_pak_header
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS paks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    header_length INTEGER NOT NULL,
+    header_hash BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    asset_id INTEGER PRIMARY KEY,
+    asset_type TEXT NOT NULL,
+    pak TEXT NOT NULL,
+    data_hash BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    asset_id INTEGER NOT NULL,
+    dependency_id INTEGER NOT NULL,
+    dependency_type TEXT NOT NULL,
+    PRIMARY KEY (asset_id, dependency_id, dependency_type)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_by_dependency ON edges (dependency_id);
+"""
+
+# SQLite integers are signed, but Corruption asset ids use all 64 bits
+_ID_SIGN = 1 << 63
+_ID_RANGE = 1 << 64
+
+
+def asset_id_to_db(asset_id: AssetId) -> int:
+    """SQLite integers are signed, so 64-bit asset ids are stored as their two's complement."""
+    return asset_id - _ID_RANGE if asset_id >= _ID_SIGN else asset_id
+
+
+def asset_id_from_db(value: int) -> AssetId:
+    """The asset id stored by `asset_id_to_db`."""
+    return value + _ID_RANGE if value < 0 else value
+
+
+# Size, modification time, header length and header hash of a pak
+PakFingerprint = Tuple[int, int, int, bytes]
+
+
+def _is_pak_unchanged(pak_path: Path, fingerprint: PakFingerprint) -> bool:
+    size, mtime, header_length, header_hash = fingerprint
+    try:
+        stat = pak_path.stat()
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+            return False
+        with pak_path.open("rb") as pak_file:
+            return hash_pak_header(pak_file, header_length) == header_hash
+    except OSError:
+        return False
+
+
+class DependencyGraph:
+    """
+    The direct dependencies of every asset of a set of paks, along with the reverse index.
+    Use as a context manager, or call `close` when done.
+    """
+
+    def __init__(self, path: Union[Path, str], target_game: Game):
+        """
+        :param path: The database file. Created if missing, and emptied if it was built for another game.
+        """
+        self.target_game = target_game
+        self._db = sqlite3.connect(str(path))
+        self._db.executescript(_SCHEMA)
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        if meta != {"version": str(_SCHEMA_VERSION), "game": target_game.name}:
+            with self._db:
+                for table in ("meta", "paks", "assets", "edges"):
+                    self._db.execute(f"DELETE FROM {table}")
+                self._db.executemany("INSERT INTO meta VALUES (?, ?)",
+                                     [("version", str(_SCHEMA_VERSION)), ("game", target_game.name)])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _stored_paks(self) -> Dict[str, PakFingerprint]:
+        return {row[0]: tuple(row[1:]) for row in self._db.execute("SELECT * FROM paks")}
+
+    def is_up_to_date(self, pak_paths: Iterable[Path]) -> bool:
+        """
+        Checks if the graph was built from exactly these paks, in their current state.
+        Much cheaper than opening an AssetProvider, as only the pak headers are read.
+        """
+        stored = self._stored_paks()
+        paths = [str(path) for path in pak_paths]
+        if sorted(paths) != sorted(stored.keys()):
+            return False
+        return all(_is_pak_unchanged(Path(path), stored[path]) for path in paths)
+
+    def update(self, asset_provider: AssetProvider, use_scanners: bool = True) -> int:
+        """
+        Brings the graph in sync with the paks of the given provider, which must be open.
+        Only assets in paks that changed are hashed, and only the ones with different data are scanned again.
+        :return: How many assets had their dependencies computed.
+        """
+        stored_paks = self._stored_paks()
+        fingerprints = {str(path): fingerprint for path, fingerprint in asset_provider.pak_fingerprints().items()}
+
+        unchanged_paks = {path for path, fingerprint in fingerprints.items() if stored_paks.get(path) == fingerprint}
+        if len(unchanged_paks) == len(fingerprints) == len(stored_paks):
+            return 0
+
+        stored_assets = {
+            asset_id_from_db(asset_id): (pak, data_hash)
+            for asset_id, pak, data_hash in self._db.execute("SELECT asset_id, pak, data_hash FROM assets")
+        }
+        get_direct_dependencies = dependencies.provider_direct_dependencies(asset_provider, use_scanners)
+
+        to_scan: List[Tuple[AssetId, AssetType, str, bytes]] = []
+        moved: List[Tuple[str, AssetId]] = []
+        present: Set[AssetId] = set()
+        for asset_id, resource, pak_path in asset_provider.resource_entries():
+            present.add(asset_id)
+            pak = str(pak_path)
+            previous = stored_assets.get(asset_id)
+            if previous is not None and previous[0] == pak and pak in unchanged_paks:
+                continue
+
+            data_hash = hashlib.sha1(asset_provider.get_raw_asset(asset_id)).digest()
+            if previous is not None and previous[1] == data_hash:
+                moved.append((pak, asset_id))
+            else:
+                to_scan.append((asset_id, resource.asset.type, pak, data_hash))
+
+        removed = [asset_id_to_db(asset_id) for asset_id in stored_assets.keys() - present]
+
+        new_edges = []
+        for asset_id, asset_type, _, _ in to_scan:
+            if not dependencies.has_dependency_function(asset_type):
+                continue
+            try:
+                for dependency in get_direct_dependencies(asset_id, asset_type):
+                    new_edges.append((asset_id_to_db(asset_id), asset_id_to_db(dependency.id), dependency.type))
+            except (UnknownAssetId, InvalidAssetId) as e:
+                logger.warning("Unable to list dependencies of 0x%08X (%s): %s", asset_id, asset_type, e)
+
+        with self._db:
+            self._db.executemany("DELETE FROM assets WHERE asset_id = ?", ((asset_id,) for asset_id in removed))
+            self._db.executemany("DELETE FROM edges WHERE asset_id = ?", ((asset_id,) for asset_id in removed))
+            self._db.executemany("DELETE FROM edges WHERE asset_id = ?",
+                                 ((asset_id_to_db(asset_id),) for asset_id, _, _, _ in to_scan))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?)",
+                ((asset_id_to_db(asset_id), asset_type, pak, data_hash)
+                 for asset_id, asset_type, pak, data_hash in to_scan),
+            )
+            self._db.executemany("UPDATE assets SET pak = ? WHERE asset_id = ?",
+                                 ((pak, asset_id_to_db(asset_id)) for pak, asset_id in moved))
+            self._db.executemany("INSERT OR IGNORE INTO edges VALUES (?, ?, ?)", new_edges)
+            self._db.execute("DELETE FROM paks")
+            self._db.executemany("INSERT INTO paks VALUES (?, ?, ?, ?, ?)",
+                                 ((path, *fingerprint) for path, fingerprint in fingerprints.items()))
+
+        return len(to_scan)
+
+    def get_type_for_asset(self, asset_id: AssetId) -> AssetType:
+        row = self._db.execute("SELECT asset_type FROM assets WHERE asset_id = ?",
+                               (asset_id_to_db(asset_id),)).fetchone()
+        if row is None:
+            raise UnknownAssetId(asset_id)
+        return row[0]
+
+    def asset_ids_of_type(self, asset_type: AssetType) -> List[AssetId]:
+        return [
+            asset_id_from_db(asset_id)
+            for asset_id, in self._db.execute("SELECT asset_id FROM assets WHERE asset_type = ? ORDER BY asset_id",
+                                              (asset_type.upper(),))
+        ]
+
+    def direct_dependencies(self, asset_id: AssetId) -> Set[Dependency]:
+        return {
+            Dependency(dependency_type, asset_id_from_db(dependency_id))
+            for dependency_id, dependency_type in self._db.execute(
+                "SELECT dependency_id, dependency_type FROM edges WHERE asset_id = ?", (asset_id_to_db(asset_id),)
+            )
+        }
+
+    def dependents(self, asset_id: AssetId) -> Set[Dependency]:
+        """
+        The assets that directly depend on the given asset.
+        """
+        return {
+            Dependency(asset_type, asset_id_from_db(dependent_id))
+            for dependent_id, asset_type in self._db.execute(
+                "SELECT e.asset_id, a.asset_type FROM edges e JOIN assets a ON a.asset_id = e.asset_id "
+                "WHERE e.dependency_id = ?",
+                (asset_id_to_db(asset_id),),
+            )
+        }
+
+    def recursive_dependencies(self, asset_ids: Iterable[AssetId]) -> Set[Dependency]:
+        """
+        Same as `dependencies.recursive_dependencies_for`, but answered from the graph.
+        """
+        roots = [(asset_id, self.get_type_for_asset(asset_id)) for asset_id in asset_ids]
+        result = {Dependency(asset_type, asset_id) for asset_id, asset_type in roots}
+
+        with self._db:
+            self._db.execute("CREATE TEMP TABLE IF NOT EXISTS roots (asset_id INTEGER PRIMARY KEY)")
+            self._db.execute("DELETE FROM roots")
+            self._db.executemany("INSERT OR IGNORE INTO roots VALUES (?)", ((asset_id_to_db(i),) for i, _ in roots))
+            rows = self._db.execute(
+                """
+                WITH RECURSIVE reached(asset_id) AS (
+                    SELECT asset_id FROM roots
+                    UNION
+                    SELECT e.dependency_id FROM edges e JOIN reached r ON e.asset_id = r.asset_id
+                )
+                SELECT DISTINCT e.dependency_type, e.dependency_id FROM edges e
+                JOIN reached r ON e.asset_id = r.asset_id
+                """
+            ).fetchall()
+
+        result.update(Dependency(dependency_type, asset_id_from_db(dependency_id))
+                      for dependency_type, dependency_id in rows)
+        return result
@@ -3,7 +3,7 @@ from construct import Construct
 from retro_data_structures.formats.ancs import ANCS
 from retro_data_structures.formats.anim import ANIM
 from retro_data_structures.formats.cinf import CINF
-from retro_data_structures.formats.cmdl import CMDL
+from retro_data_structures.formats.cmdl import CMDL, LazyCMDL
 from retro_data_structures.formats.cskr import CSKR
 from retro_data_structures.formats.cspp import CSPP
 from retro_data_structures.formats.dgrp import DGRP
@@ -37,7 +37,15 @@ ALL_FORMATS = {
     "STRG": STRG,
 }
 
+# Variants that only decode their largest fields when accessed.
+# See `retro_data_structures.construct_extensions.misc.LazyFields`.
+LAZY_FORMATS = {
+    "CMDL": LazyCMDL,
+}
 
 
-def format_for(type_name: AssetType) -> Construct:
-    return ALL_FORMATS[type_name.upper()]
+def format_for(type_name: AssetType, lazy: bool = False) -> Construct:
+    type_name = type_name.upper()
+    if lazy and type_name in LAZY_FORMATS:
+        return LAZY_FORMATS[type_name]
+    return ALL_FORMATS[type_name]
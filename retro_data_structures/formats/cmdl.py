@@ -1,3 +1,5 @@
+import struct
+
 import construct
 from construct import (
     Struct,
@@ -27,8 +29,8 @@ from construct import (
 from retro_data_structures import game_check
 from retro_data_structures.common_types import AABox, AssetId32, Vector3, Color4f, Vector2f
 from retro_data_structures.construct_extensions.alignment import AlignTo
-from retro_data_structures.construct_extensions.misc import Skip
-from retro_data_structures.data_section import DataSectionSizes, DataSection
+from retro_data_structures.construct_extensions.misc import LazyFields, Skip
+from retro_data_structures.data_section import DataSectionSizes, DataSection, LazyDataSections
 from retro_data_structures.game_check import Game
 
 TEVStage = Struct(
@@ -209,66 +211,101 @@ Surface = Struct(
     ),
 )
 
-# 0x2 = Prime 1
-# 0x4 = Prime 2
-# 0x5 = Prime 3
-CMDL = Struct(
-    _magic=Const(0xDEADBABE, Int32ub),
-    version=Int32ub,
-    flags=Int32ub,
-    aabox=AABox,
-    _data_section_count=Rebuild(
-        Int32ub,
-        lambda context: (
-            len(context.material_sets)
-            + sum(1 for k, v in context.attrib_arrays.items() if not k.startswith("_") and v is not None)
-            + 1
-            + len(context.surfaces)
+def _create_cmdl(lazy: bool):
+    def maybe_lazy(subcon, section_count):
+        return LazyDataSections(subcon, section_count) if lazy else subcon
+
+    result = Struct(
+        _magic=Const(0xDEADBABE, Int32ub),
+        version=Int32ub,
+        flags=Int32ub,
+        aabox=AABox,
+        _data_section_count=Rebuild(
+            Int32ub,
+            lambda context: (
+                len(context.material_sets)
+                + sum(1 for k, v in context.attrib_arrays.items() if not k.startswith("_") and v is not None)
+                + 1
+                + len(context.surfaces)
+            ),
         ),
-    ),
-    _material_set_count=Rebuild(Int32ub, construct.len_(construct.this.material_sets)),
-    data_section_sizes=DataSectionSizes(construct.this._root._data_section_count),
-    _=AlignTo(32),
-    _current_section=construct.Computed(lambda this: 0),
-    material_sets=Array(construct.this._material_set_count, DataSection(MaterialSet)),
-    attrib_arrays=Struct(
-        positions=DataSection(GreedyRange(Vector3)),
-        normals=DataSection(
-            GreedyRange(Normal),
+        _material_set_count=Rebuild(Int32ub, construct.len_(construct.this.material_sets)),
+        data_section_sizes=DataSectionSizes(construct.this._root._data_section_count),
+        _=AlignTo(32),
+        _current_section=construct.Computed(lambda this: 0),
+        material_sets=Array(construct.this._material_set_count, DataSection(MaterialSet)),
+        attrib_arrays=maybe_lazy(
+            Struct(
+                positions=DataSection(GreedyRange(Vector3)),
+                normals=DataSection(
+                    GreedyRange(Normal),
+                ),
+                # TODO: none of Retro's games actually have data here, so this might be the wrong type!
+                colors=DataSection(GreedyRange(Color4f)),
+                uvs=DataSection(GreedyRange(Vector2f)),
+                lightmap_uvs=If(
+                    lambda this: hasattr(this._root, "flags") and this._root.flags & 0x4,
+                    DataSection(GreedyRange(Array(2, Float16b))),
+                ),
+            ),
+            lambda this: 5 if this.flags & 0x4 else 4,
         ),
-        # TODO: none of Retro's games actually have data here, so this might be the wrong type!
-        colors=DataSection(GreedyRange(Color4f)),
-        uvs=DataSection(GreedyRange(Vector2f)),
-        lightmap_uvs=If(
-            lambda this: hasattr(this._root, "flags") and this._root.flags & 0x4,
-            DataSection(GreedyRange(Array(2, Float16b))),
+        _surface_header_address=Tell,
+        _surface_header=DataSection(
+            Struct(
+                num_surfaces=Rebuild(Int32ub, construct.len_(construct.this["_"].surfaces)),
+                end_offsets=Skip(construct.this.num_surfaces, Int32ub),
+            )
         ),
-    ),
-    _surface_header_address=Tell,
-    _surface_header=DataSection(
-        Struct(
-            num_surfaces=Rebuild(Int32ub, construct.len_(construct.this["_"].surfaces)),
-            end_offsets=Skip(construct.this.num_surfaces, Int32ub),
-        )
-    ),
-    _surfaces_start=Tell,
-    surfaces=Array(
-        construct.this["_surface_header"].num_surfaces,
-        FocusedSeq(
-            "surface",
-            surface=DataSection(Surface),
-            end=Tell,
-            update_end_offset=Pointer(
-                # One extra Int32ub for the num_surfaces
-                lambda ctx: ctx["_"]["_surface_header_address"] + Int32ub.length + Int32ub.length * ctx["_index"],
-                Rebuild(Int32ub, lambda ctx: ctx.end - ctx["_"]["_surfaces_start"]),
+        _surfaces_start=Tell,
+        surfaces=maybe_lazy(
+            Array(
+                construct.this["_surface_header"].num_surfaces,
+                FocusedSeq(
+                    "surface",
+                    surface=DataSection(Surface),
+                    end=Tell,
+                    update_end_offset=Pointer(
+                        # One extra Int32ub for the num_surfaces
+                        lambda ctx: ctx["_"]["_surface_header_address"] + Int32ub.length + Int32ub.length * ctx["_index"],
+                        Rebuild(Int32ub, lambda ctx: ctx.end - ctx["_"]["_surfaces_start"]),
+                    ),
+                ),
             ),
+            construct.this["_surface_header"].num_surfaces,
         ),
-    ),
-)
+    )
+    if lazy:
+        result = LazyFields(result)
+    return result
+
+
+# 0x2 = Prime 1
+# 0x4 = Prime 2
+# 0x5 = Prime 3
+CMDL = _create_cmdl(lazy=False)
+
+# Same as CMDL, but the vertex data and surfaces are only decoded when accessed
+LazyCMDL = _create_cmdl(lazy=True)
 
 
 def dependencies_for(obj, target_game: Game):
     for material_set in obj.material_sets:
         for file_id in material_set.texture_file_ids:
             yield "TXTR", file_id
+
+
+def dependencies_from_bytes(data: bytes, target_game: Game):
+    """
+    Same as `dependencies_for`, but only reads the texture id table of each material set from the raw data.
+    """
+    section_count, material_set_count = struct.unpack_from(">LL", data, 0x24)
+    section_sizes = struct.unpack_from(f">{section_count}L", data, 0x2C)
+
+    offset = 0x2C + 4 * section_count
+    offset += -offset % 32
+    for section_size in section_sizes[:material_set_count]:
+        texture_count = struct.unpack_from(">L", data, offset)[0]
+        for file_id in struct.unpack_from(f">{texture_count}L", data, offset + 4):
+            yield "TXTR", file_id
+        offset += section_size
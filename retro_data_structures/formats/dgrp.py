@@ -1,3 +1,5 @@
+import struct
+
 from construct import Struct, Int32ub, PrefixedArray
 
 from retro_data_structures.common_types import FourCC
@@ -11,3 +13,19 @@ DGRP = PrefixedArray(Int32ub, Dependency)
 def dependencies_for(obj, target_game: Game):
     for dependency in obj:
         yield dependency.asset_type, dependency.asset_id
+
+
+def dependencies_from_bytes(data: bytes, target_game: Game, offset: int = 0):
+    """
+    Same as `dependencies_for`, reading directly from the raw data.
+    """
+    id_format = target_game.asset_id_format
+    id_size = struct.calcsize(id_format)
+
+    count = struct.unpack_from(">L", data, offset)[0]
+    offset += 4
+    for _ in range(count):
+        asset_type = data[offset:offset + 4].decode("ascii")
+        asset_id = struct.unpack_from(id_format, data, offset + 4)[0]
+        yield asset_type, asset_id
+        offset += 4 + id_size
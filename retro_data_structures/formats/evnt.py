@@ -1,8 +1,11 @@
+import struct
+
 from construct import Struct, Int32ub, PrefixedArray, Int16ub, Byte, Float32b, If, Int32sb, Hex
 
 from retro_data_structures import game_check
 from retro_data_structures.common_types import String, CharAnimTime
 from retro_data_structures.construct_extensions.version import WithVersion
+from retro_data_structures.game_check import Game
 
 BasePOINode = Struct(
     unk_1=Int16ub,
@@ -77,3 +80,52 @@ EVNT = Struct(
 def dependencies_for(obj, target_game):
     for particle_poi in obj.particle_poi_nodes:
         yield particle_poi.particle.type, particle_poi.particle.id
+
+
+def dependencies_from_bytes(data: bytes, target_game: Game):
+    """
+    Same as `dependencies_for`, but only walks the POI nodes far enough to find the particles.
+    """
+    is_prime3 = target_game == Game.CORRUPTION
+    id_format = target_game.asset_id_format
+
+    def skip_string(offset):
+        return data.index(b"\x00", offset) + 1
+
+    def skip_base(offset):
+        offset = skip_string(offset + 2)  # unk_1, name
+        offset += 2 + 8 + 4  # type, timestamp, index
+        if is_prime3:
+            offset += 4
+        offset += 1 + 4 + 4 + 4  # unique, weight, character_index, flags
+        if is_prime3:
+            offset += 20
+        return offset
+
+    def read_count(offset):
+        return struct.unpack_from(">L", data, offset)[0], offset + 4
+
+    # version
+    offset = 4
+
+    count, offset = read_count(offset)
+    for _ in range(count):
+        offset = skip_base(offset) + 1
+
+    count, offset = read_count(offset)
+    for _ in range(count):
+        offset = skip_string(skip_base(offset) + 4)
+
+    count, offset = read_count(offset)
+    for _ in range(count):
+        offset = skip_base(offset) + 4  # duration
+        particle_type = data[offset:offset + 4].decode("ascii")
+        particle_id = struct.unpack_from(id_format, data, offset + 4)[0]
+        yield particle_type, particle_id
+
+        offset += 4 + struct.calcsize(id_format)
+        if target_game == Game.PRIME:
+            offset = skip_string(offset)
+        elif target_game == Game.ECHOES:
+            offset += 4
+        offset += 8  # effect_scale, transform_type
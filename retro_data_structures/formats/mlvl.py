@@ -2,7 +2,6 @@
 Wiki: https://wiki.axiodl.com/w/MLVL_(File_Format)
 """
 from __future__ import annotations
-import sys
 import typing
 from typing import Iterable, Iterator, Optional
 from construct import Adapter, BitsSwapped, ByteSwapped, Construct, Error, len_
@@ -71,7 +70,7 @@ class LayerFlags(Adapter):
         flags[:len(obj)] = obj
         return Container({
             "layer_count": len(obj),
-            "layer_flags": reversed(flags)
+            "layer_flags": list(reversed(flags))
         })
 
 class LayerNameOffsetAdapter(OffsetAdapter):
@@ -322,8 +321,10 @@ class AreaHelper(FormatWrapper):
     
     @property
     def next_instance_id(self) -> int:
-        ids = [instance.id_struct.instance for layer in self.layers for instance in layer.instances]
-        return next(i for i in range(0, sys.maxsize) if i not in ids)
+        """
+        The lowest instance number not used by any layer of this area.
+        """
+        return self.mrea.instance_id_allocator.lowest_free()
 
     
 class Mlvl(FormatWrapper):
@@ -338,7 +339,7 @@ class Mlvl(FormatWrapper):
         names = self._raw.layer_names
         for i, area in enumerate(self._raw.areas):
             area_layer_names = names[offsets[i]:] if i == len(self._raw.areas) - 1 else names[offsets[i]:offsets[i+1]]
-            yield AreaHelper(area, self._raw.area_layer_flags[i], area_layer_names, i, self.target_game, self.asset_provider)
+            yield AreaHelper(area, self.target_game, self.asset_provider, self._raw.area_layer_flags[i], area_layer_names, i)
     
     def get_area(self, asset_id: int) -> AreaHelper:
         return next(area for area in self.areas if area.mrea_asset_id == asset_id)
@@ -1,10 +1,14 @@
 """
 Wiki: https://wiki.axiodl.com/w/MREA_(Metroid_Prime_2)
+
+Parse parameters:
+- section_hash: How the `hash` of each data section is computed when first accessed, "sha256" (default) or "crc32".
 """
 import hashlib
 import io
+import zlib
 from enum import IntEnum
-from typing import Iterator, Optional
+from typing import Callable, Iterator, List, Optional
 
 from construct.core import (
     Adapter,
@@ -33,15 +37,17 @@ from construct.lib.containers import Container, ListContainer
 
 from retro_data_structures import game_check
 from retro_data_structures.common_types import FourCC, Transform4f
-from retro_data_structures.compression import LZOCompressedBlock
+from retro_data_structures.compression import LZOCompressedBlock, compress_lzo_blocks
 from retro_data_structures.construct_extensions.alignment import PrefixedWithPaddingBefore
-from retro_data_structures.construct_extensions.misc import Skip
+from retro_data_structures.construct_extensions.misc import LazyFieldsContainer, LazyValue, Skip
 from retro_data_structures.construct_extensions.version import BeforeVersion, WithVersion, WithVersionElse
 from retro_data_structures.data_section import DataSection, DataSectionSizes, GetDataSectionId, GetDataSectionSize
 from retro_data_structures.formats.area_collision import AreaCollision
 from retro_data_structures.formats.arot import AROT
 from retro_data_structures.formats.lights import Lights
-from retro_data_structures.formats.script_layer import SCGN, SCLY, ScriptLayerHelper
+from retro_data_structures.formats.script_layer import (
+    SCGN, SCLY, AreaInstanceIndex, InstanceIdAllocator, ScriptLayerHelper,
+)
 from retro_data_structures.formats.script_object import ScriptInstanceHelper
 from retro_data_structures.formats.visi import VISI
 from retro_data_structures.formats.wrapper import FormatWrapper
@@ -58,6 +64,31 @@ class MREAVersion(IntEnum):
     DonkeyKongCountryReturns = 0x20
 
 
+# How the `hash` of each data section is computed, selected with the `section_hash` parse parameter.
+_SECTION_HASHES = {
+    "sha256": lambda data: hashlib.sha256(data).hexdigest(),
+    "crc32": lambda data: f"{zlib.crc32(data):08x}",
+}
+
+
+def _section_hash_function(context) -> Callable[[bytes], str]:
+    name = context._params.get("section_hash", "sha256")
+    try:
+        return _SECTION_HASHES[name]
+    except KeyError:
+        raise ValueError(f"Unknown section hash {name}, expected one of {list(_SECTION_HASHES)}") from None
+
+
+def _create_section(data, size: int, section_id: int, hash_function: Callable[[bytes], str]) -> LazyFieldsContainer:
+    return LazyFieldsContainer(
+        data=data,
+        # Nothing needs the hash while parsing, so it's only computed when accessed
+        hash=LazyValue(lambda: hash_function(data)),
+        size=size,
+        id=section_id,
+    )
+
+
 class DataSectionGroupAdapter(Adapter):
     def __init__(self, subcon, header):
         super().__init__(subcon)
@@ -66,6 +97,7 @@ class DataSectionGroupAdapter(Adapter):
     def _decode(self, group, context, path):
         sections = []
         offset = 0
+        hash_function = _section_hash_function(context)
 
         for i in range(self.header.data_section_count):
             section_id = GetDataSectionId(context)
@@ -73,14 +105,7 @@ class DataSectionGroupAdapter(Adapter):
 
             data = group[offset: offset + section_size]
 
-            sections.append(
-                Container(
-                    data=data,
-                    hash=hashlib.sha256(data).hexdigest(),
-                    size=section_size,
-                    id=section_id,
-                )
-            )
+            sections.append(_create_section(data, section_size, section_id, hash_function))
 
             offset += section_size
 
@@ -104,17 +129,11 @@ class UncompressedDataSections(Adapter):
         )
 
     def _decode(self, sections, context, path):
+        hash_function = _section_hash_function(context)
         decoded = []
         for i in range(len(sections)):
             section = sections[i]
-            decoded.append(
-                Container(
-                    data=section,
-                    hash=hashlib.sha256(section).hexdigest(),
-                    size=len(section),
-                    id=i,
-                )
-            )
+            decoded.append(_create_section(section, len(section), i, hash_function))
         return [ListContainer(decoded)]
 
     def _encode(self, sections, context, path):
@@ -138,18 +157,31 @@ _all_categories = [
 
 
 class SectionCategoryAdapter(Adapter):
+    """
+    Splits the data sections into their categories. The sections of categories with a known format are only parsed
+    when their data is first accessed, and the ones never accessed are written back as the original bytes.
+    """
+
     def _decode_category(self, category, subcon, context, path):
         for i in range(len(category)):
             section = category[i]
             if section["size"] > 0:
-                decoded = subcon._parse(io.BytesIO(section["data"]), context, path)
-                category[i]["data"] = decoded
+                data = section["data"]
+                category[i]["data"] = LazyValue(
+                    lambda data=data: subcon._parse(io.BytesIO(data), context, path),
+                    raw=data,
+                )
         return category
 
     def _encode_category(self, category, subcon, context, path):
         for i in range(len(category)):
             section = category[i]
             if section["size"] > 0:
+                lazy = section.get_lazy("data") if isinstance(section, LazyFieldsContainer) else None
+                if lazy is not None and lazy.raw is not None:
+                    category[i]["data"] = lazy.raw
+                    continue
+
                 encoded = io.BytesIO()
                 subcon._build(section["data"], encoded, context, path)
                 category[i]["data"] = encoded.getvalue()
@@ -251,7 +283,11 @@ class CompressedBlocksAdapter(SectionCategoryAdapter):
         for i in range(len(groups)):
             header = section_groups.headers[i]
             subcon = self._get_subcon(header.compressed_size, header.uncompressed_size, context)
+            original = Container(header=header, data=groups[i], hash_function=_section_hash_function(context))
             groups[i] = DataSectionGroupAdapter(subcon, header)._parsereport(io.BytesIO(groups[i]), context, path)
+            for section in groups[i]:
+                # The block as stored in the file, so it can be written back as-is if none of its sections change
+                section["_block"] = original
 
         return super()._decode(groups, context, path)
 
@@ -270,62 +306,111 @@ class CompressedBlocksAdapter(SectionCategoryAdapter):
             return (True, "Previous SCGN completed.")
         return (False, "")
 
+    def _group_sections(self, labeled_sections):
+        """
+        Splits the sections into groups, following the rules of the original files.
+        """
+        groups = []
+        current_group_size = 0
+        current_group = []
+
+        for label, previous_label, section in labeled_sections:
+            start_new, reason = self._start_new_group(current_group_size, section["size"], previous_label, label)
+            if start_new:
+                groups.append(current_group)
+                current_group = []
+                current_group_size = 0
+
+            current_group.append(section)
+            current_group_size += section["size"]
+
+        if current_group:
+            groups.append(current_group)
+        return groups
+
+    def _original_runs(self, labeled_sections):
+        """
+        Splits the sections in runs that are exactly one of the blocks from when the file was parsed,
+        and runs of sections that aren't.
+        """
+        runs = []
+        i = 0
+        while i < len(labeled_sections):
+            block = labeled_sections[i][2].get("_block")
+            if block is not None:
+                count = block.header.data_section_count
+                candidate = labeled_sections[i:i + count]
+                if len(candidate) == count and all(section.get("_block") is block for _, _, section in candidate):
+                    runs.append((block, candidate))
+                    i += count
+                    continue
+
+            if runs and runs[-1][0] is None:
+                runs[-1][1].append(labeled_sections[i])
+            else:
+                runs.append((None, [labeled_sections[i]]))
+            i += 1
+
+        return runs
+
+    @staticmethod
+    def _is_unchanged(section, encoded: bytes) -> bool:
+        return (len(encoded) == section["size"]
+                and section["_block"].hash_function(encoded) == section["hash"])
+
     def _encode(self, sections, context, path):
         sections = super()._encode(sections, context, path)
 
-        compressed_blocks = ListContainer()
-
-        current_group_size = 0
-        current_group = ListContainer()
+        # Each section with the label of its category and of the category before it
+        labeled_sections = []
         previous_label = ""
-
-        def add_group(r):
-            nonlocal current_group_size, current_group
-            # print(f"Group complete! {r} Group size: {current_group_size}")
-            compressed_blocks.append(Container(
-                header=Container(
-                    buffer_size=current_group_size,
-                    uncompressed_size=current_group_size,
-                    compressed_size=0,
-                    data_section_count=len(current_group)
-                ),
-                group=current_group,
-            ))
-            current_group = []
-            current_group_size = 0
-
-        for cat_label, cat_sections in sorted(sections.items(), key=lambda item: item[1][0]["id"]):
-            for section in cat_sections:
-                start_new, reason = self._start_new_group(
-                    current_group_size, section["size"],
-                    previous_label, cat_label
-                )
-                if start_new:
-                    add_group(reason)
-
-                current_group.append(section)
-                current_group_size += section["size"]
-
-            previous_label = cat_label
-        add_group("Final group.")
-
+        for label, category in sorted(sections.items(), key=lambda item: item[1][0]["id"]):
+            labeled_sections.extend((label, previous_label, section) for section in category)
+            previous_label = label
+
+        compressed_blocks = []
+        for original, run in self._original_runs(labeled_sections):
+            if original is not None:
+                encoded = [DataSectionGroupAdapter(Pass, None)._encode([section], context, path) for *_, section in run]
+                if all(self._is_unchanged(section, data) for (*_, section), data in zip(run, encoded)):
+                    compressed_blocks.append(Container(header=Container(original.header), group=original.data,
+                                                       compressed=True))
+                    continue
+
+                if sum(len(data) for data in encoded) <= 0x20000 or len(run) == 1:
+                    compressed_blocks.append(Container(group=[section for *_, section in run]))
+                    continue
+
+            compressed_blocks.extend(Container(group=group) for group in self._group_sections(run))
+
+        to_compress = []
         for block in compressed_blocks:
-            group = block.group
-            header = block.header
-
-            group = DataSectionGroupAdapter(Pass, header)._encode(group, context, path)
+            if block.get("compressed"):
+                continue
+
+            group = DataSectionGroupAdapter(Pass, None)._encode(block.group, context, path)
+            block.header = Container(
+                buffer_size=len(group),
+                uncompressed_size=len(group),
+                compressed_size=0,
+                data_section_count=len(block.group),
+            )
+            block.group = group
+            to_compress.append(block)
 
-            substream = io.BytesIO()
-            LZOCompressedBlock(header.uncompressed_size)._build(group, substream, context, path)
-            compressed_size = len(substream.getvalue())
-            if compressed_size < header.uncompressed_size:
-                header.compressed_size = compressed_size
+        # Compress everything at once, so the segments of all blocks share the thread pool
+        for block, compressed in zip(to_compress, compress_lzo_blocks([block.group for block in to_compress])):
+            header = block.header
+            if len(compressed) < header.uncompressed_size:
+                header.compressed_size = len(compressed)
                 header.buffer_size += 0x120
-
-            substream = io.BytesIO()
-            subcon = self._get_subcon(header.compressed_size, header.uncompressed_size, context)
-            subcon._build(group, substream, context, path)
-            block.group = substream.getvalue()
+                # Same as building the PrefixedWithPaddingBefore from _get_subcon, without compressing again
+                block.group = b"\x00" * (-len(compressed) % 32) + compressed
+            else:
+                substream = io.BytesIO()
+                subcon = self._get_subcon(header.compressed_size, header.uncompressed_size, context)
+                subcon._build(block.group, substream, context, path)
+                block.group = substream.getvalue()
 
         return Container(
             headers=[block.header for block in compressed_blocks],
@@ -415,15 +500,41 @@ MREA = AlignedStruct(32,
 
 
 class Mrea(FormatWrapper):
+    _layer_helpers: Optional[List[ScriptLayerHelper]] = None
+    _area_index: Optional[AreaInstanceIndex] = None
+
     @property
     def script_layers(self) -> Iterator[ScriptLayerHelper]:
-        for section in self._raw.sections.script_layers_section:
-            yield ScriptLayerHelper(section["data"], self.target_game, self.asset_provider)
+        # The same helpers are returned every time, so their instance indexes are only built once
+        sections = self._raw.sections.script_layers_section
+        helpers = self._layer_helpers
+        if helpers is None or len(helpers) != len(sections) or any(
+                helper._raw is not section["data"] for helper, section in zip(helpers, sections)):
+            previous = {id(helper._raw): helper for helper in helpers or []}
+            helpers = self._layer_helpers = [
+                previous.get(id(section["data"])) or ScriptLayerHelper(section["data"], self.target_game,
+                                                                       self.asset_provider)
+                for section in sections
+            ]
+        yield from tuple(helpers)
+
+    def _instance_index(self) -> AreaInstanceIndex:
+        layers = list(self.script_layers)
+        if self._area_index is None or self._area_index.layers != layers:
+            self._area_index = AreaInstanceIndex(layers)
+        return self._area_index
+
+    @property
+    def instance_id_allocator(self) -> InstanceIdAllocator:
+        """
+        The instance numbers used by every layer, kept up to date as instances are added and removed.
+        """
+        return self._instance_index().allocator
 
     def get_instance(self, instance_id: int) -> Optional[ScriptInstanceHelper]:
-        for layer in self.script_layers:
-            if (instance := layer.get_instance(instance_id)) is not None:
-                return instance
+        layer = self._instance_index().layer_with_instance(instance_id)
+        if layer is not None:
+            return layer.get_instance(instance_id)
 
     def get_instance_by_name(self, name: str) -> Optional[ScriptInstanceHelper]:
         for layer in self.script_layers:
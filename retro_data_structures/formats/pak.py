@@ -1,3 +1,7 @@
+import struct
+import zlib
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
 import construct
 from construct import (
     Struct,
@@ -21,9 +25,16 @@ from construct import (
 
 from retro_data_structures import game_check
 from retro_data_structures.common_types import ObjectTag_32
-from retro_data_structures.compression import LZOCompressedBlock, ZlibCompressedBlock
+from retro_data_structures.compression import (
+    LZOCompressedBlock,
+    ZlibCompressedBlock,
+    compress_lzo_segments,
+    decompress_lzo_segments,
+)
 from retro_data_structures.construct_extensions.alignment import AlignTo, AlignedPrefixed
 from retro_data_structures.construct_extensions.misc import LazyPatchedForBug
+from retro_data_structures.formats.wrapper import AssetId, AssetType
+from retro_data_structures.game_check import Game
 
 PAKHeader = Struct(
     version_major=Const(3, Int16ub),
@@ -94,6 +105,108 @@ CompressedPakResource = FocusedSeq(
 )
 
 
+def decompress_pak_resource(data, target_game: Game):
+    """
+    Same result as `CompressedPakResource.parse`, but accepts any bytes-like object (such as a memoryview slice of a
+    mmap) and decompresses without copying the input into a stream first.
+    """
+    decompressed_size = struct.unpack_from(">L", data, 0)[0]
+    compressed = memoryview(data)[4:]
+    if target_game.uses_lzo:
+        return decompress_lzo_segments(compressed, decompressed_size)
+    return zlib.decompress(compressed)
+
+
+def compress_pak_resource(data, target_game: Game) -> bytes:
+    """
+    Same result as `CompressedPakResource.build`.
+    """
+    if target_game.uses_lzo:
+        compressed = compress_lzo_segments(data)
+    else:
+        compressed = zlib.compress(data, 9)
+    return struct.pack(">L", len(data)) + compressed
+
+
+# Asset type and id, the name to list it under (if any), the data or a function that returns it, and if it's compressed
+PakEntry = Tuple[Tuple[AssetType, AssetId], Optional[str], Union[bytes, Callable[[], bytes]], bool]
+
+RESOURCE_ALIGNMENT = 32
+
+
+def _write_padding(stream: BinaryIO, length: int, pad_byte: bytes):
+    pad = -length % RESOURCE_ALIGNMENT
+    if pad:
+        stream.write(pad_byte * pad)
+    return length + pad
+
+
+def write_pak(stream: BinaryIO, entries: Iterable[PakEntry], target_game: Game,
+              named_resources: Optional[list] = None, precompressed: bool = False) -> List[construct.Container]:
+    """
+    Writes a pak with the given resources, in the same layout as `PAK.build`, without keeping the whole pak in memory.
+    The header is written first with an empty resource table, which is filled once all resources are written.
+    The resource table comes first, so all entries are read before any data is written: only entries whose data are
+    functions keep the memory bounded, with a single resource in memory at a time. Data given as bytes is kept until
+    it's written. Entries given the same data object, with the same compression, share a single copy of it.
+    :param stream: Seekable, positioned where the pak starts.
+    :param named_resources: When set, used as the names of the pak instead of the names of the entries.
+    :param precompressed: The data of compressed entries is already compressed, as stored in a pak.
+    :return: The resource table, as `PAKNoData` parses it.
+    """
+    resources = []
+    sources = []
+    names = []
+    # Index of the first entry with the same data, for the entries that reuse it
+    shared_with: Dict[int, int] = {}
+    first_entry: Dict[Tuple[int, bool], int] = {}
+    for (asset_type, asset_id), name, data, compressed in entries:
+        first = first_entry.setdefault((id(data), bool(compressed)), len(resources))
+        if first != len(resources):
+            shared_with[len(resources)] = first
+            data = None
+        resources.append(construct.Container(compressed=int(compressed),
+                                             asset=construct.Container(type=asset_type, id=asset_id),
+                                             size=0, offset=0))
+        sources.append(data)
+        if name is not None:
+            names.append({"asset": {"type": asset_type, "id": asset_id}, "name": name})
+
+    if named_resources is None:
+        named_resources = names
+
+    start = stream.tell()
+    header = PAKNoData.build({"named_resources": named_resources, "resources": resources}, target_game=target_game)
+    stream.write(header)
+    offset = _write_padding(stream, len(header), b"\x00")
+
+    for i, resource in enumerate(resources):
+        if i in shared_with:
+            first = resources[shared_with[i]]
+            resource.offset, resource.size = first.offset, first.size
+            continue
+
+        data = sources[i]
+        sources[i] = None
+        if callable(data):
+            data = data()
+        if resource.compressed and not precompressed:
+            data = compress_pak_resource(data, target_game)
+
+        stream.write(data)
+        resource.offset = offset
+        resource.size = _write_padding(stream, len(data), b"\xFF")
+        offset += resource.size
+        del data
+
+    end = stream.tell()
+    stream.seek(start)
+    stream.write(PAKNoData.build({"named_resources": named_resources, "resources": resources},
+                                 target_game=target_game))
+    stream.seek(end)
+    return resources
+
+
 def create():
     return "PAK" / Struct(
         _header=PAKHeader,
@@ -1,4 +1,5 @@
-from typing import Optional
+import struct
+from typing import Dict, Optional
 
 import construct
 from construct import (
@@ -928,3 +929,142 @@ def dependencies_for(obj, target_game: Game):
         if element.type in ("IDTS", "ICTS", "IITS"):
             if element.body is not None:
                 yield from _yield_dependency_if_valid(element.body.body, "PART", target_game)
+
+
+_ELEMENT_DEPENDENCY_TYPES = {
+    "IDTS": "PART",
+    "ICTS": "PART",
+    "IITS": "PART",
+    "PMDL": "CMDL",
+    "SSWH": "SWHC",
+    "SELC": "ELSC",
+}
+_TEXTURE_ELEMENTS_WITH_ID = {b"CNST", b"ATEX", b"TEXP"}
+
+# Fixed size of each construct, or None when it depends on the data
+_fixed_sizes: Dict[int, Optional[int]] = {}
+
+
+def _fixed_size(subcon: construct.Construct) -> Optional[int]:
+    key = id(subcon)
+    if key not in _fixed_sizes:
+        try:
+            _fixed_sizes[key] = subcon.sizeof()
+        except (construct.SizeofError, KeyError, AttributeError):
+            # Conditions that look at the context also can't be sized without data
+            _fixed_sizes[key] = None
+    return _fixed_sizes[key]
+
+
+def _value_field(subcon: construct.Construct) -> construct.Construct:
+    # The FourCC or number under renames and rebuilds, which later conditions and counts can refer to
+    while subcon is not FourCC and isinstance(subcon, construct.Subconstruct) and not isinstance(subcon, Array):
+        subcon = subcon.subcon
+    return subcon
+
+
+def _skip_element(subcon: construct.Construct, data, offset: int, context: construct.Container) -> int:
+    """
+    Walks over the given construct without building any object, reading only the fields that conditions and counts
+    need. Raises ValueError when an element type is unknown.
+    :return: The offset right after it.
+    """
+    size = _fixed_size(subcon)
+    if size is not None:
+        return offset + size
+
+    if isinstance(subcon, (Struct, construct.FocusedSeq)):
+        inner = construct.Container(_=context, _params=context._params)
+        for field in subcon.subcons:
+            value_field = _value_field(field)
+            if field.name is not None:
+                if value_field is FourCC:
+                    inner[field.name] = bytes(data[offset:offset + 4]).rstrip(b"\x00").decode("ascii")
+                elif isinstance(value_field, construct.FormatField):
+                    inner[field.name] = struct.unpack_from(value_field.fmtstr, data, offset)[0]
+            offset = _skip_element(field, data, offset, inner)
+        return offset
+
+    if isinstance(subcon, Switch):
+        key = construct.evaluate(subcon.keyfunc, context)
+        if key not in subcon.cases:
+            raise ValueError(f"Unknown element type {key}")
+        return _skip_element(subcon.cases[key], data, offset, context)
+
+    if isinstance(subcon, IfThenElse):
+        condition = construct.evaluate(subcon.condfunc, context)
+        return _skip_element(subcon.thensubcon if condition else subcon.elsesubcon, data, offset, context)
+
+    if isinstance(subcon, Array):
+        count = construct.evaluate(subcon.count, context)
+        item_size = _fixed_size(subcon.subcon)
+        if item_size is not None:
+            return offset + count * item_size
+        for _ in range(count):
+            offset = _skip_element(subcon.subcon, data, offset, context)
+        return offset
+
+    if isinstance(subcon, construct.Subconstruct):
+        return _skip_element(subcon.subcon, data, offset, context)
+
+    raise ValueError(f"Unexpected element {subcon}")
+
+
+def _element_dependencies(element: str, data, offset: int, target_game: Game):
+    id_format = target_game.asset_id_format
+    id_size = struct.calcsize(id_format)
+
+    def read_id(at):
+        return struct.unpack_from(id_format, data, at)[0]
+
+    sub_type = bytes(data[offset:offset + 4])
+    offset += 4
+
+    if element in ("TEXR", "TIND"):
+        if sub_type in _TEXTURE_ELEMENTS_WITH_ID and data[offset:offset + 4] != b"NONE":
+            yield from _yield_dependency_if_valid(read_id(offset + 4), "TXTR", target_game)
+
+    elif element == "KSSM":
+        if sub_type == b"CNST":
+            offset += 16  # unk1, unk2, endFrame, unk3
+            spawn_count = struct.unpack_from(">L", data, offset)[0]
+            offset += 4
+            for _ in range(spawn_count):
+                info_count = struct.unpack_from(">L", data, offset + 4)[0]
+                offset += 8
+                for _ in range(info_count):
+                    if target_game >= Game.ECHOES:
+                        info_type = bytes(data[offset + id_size:offset + id_size + 4]).decode("ascii")
+                    else:
+                        info_type = "PART"
+                    yield from _yield_dependency_if_valid(read_id(offset), info_type, target_game)
+                    offset += id_size + 12
+
+    elif sub_type != b"NONE":
+        yield from _yield_dependency_if_valid(read_id(offset), _ELEMENT_DEPENDENCY_TYPES[element], target_game)
+
+
+def dependencies_from_bytes(data: bytes, target_game: Game):
+    """
+    Same as `dependencies_for`, but walks over the elements of the raw data instead of parsing them, only decoding
+    the ones that reference other assets.
+    """
+    if data[:4] != b"GPSM":
+        raise ValueError("Not a particle")
+
+    context = construct.Container(_params=construct.Container(target_game=target_game))
+    offset = 4
+    while True:
+        element = bytes(data[offset:offset + 4]).decode("ascii")
+        if element == "_END":
+            return
+        if element not in PARTICLE_TYPES:
+            raise ValueError(f"Unknown particle element {element}")
+        offset += 4
+
+        if element in ("TEXR", "TIND", "KSSM") or element in _ELEMENT_DEPENDENCY_TYPES:
+            yield from _element_dependencies(element, data, offset, target_game)
+
+        offset = _skip_element(PARTICLE_TYPES[element], data, offset, context)
+        if offset > len(data):
+            raise ValueError("Particle is truncated")
@@ -1,6 +1,7 @@
 """
 https://wiki.axiodl.com/w/SCAN_(File_Format)
 """
+import struct
 
 from construct.core import Array, Byte, Check, Const, Enum, Float32b, GreedyRange, Hex, IfThenElse, Int32ub, Struct
 
@@ -55,3 +56,20 @@ def dependencies_for(obj, target_game: Game):
             yield "TXTR", image.texture
     else:
         yield from dgrp.dependencies_for(obj.dependencies, target_game)
+
+
+def dependencies_from_bytes(data: bytes, target_game: Game):
+    """
+    Same as `dependencies_for`, reading directly from the raw data.
+    """
+    if target_game == Game.PRIME:
+        frame_id, text_id = struct.unpack_from(">LL", data, 8)
+        yield "FRME", frame_id
+        yield "STRG", text_id
+        for i in range(4):
+            # scan_images starts right after the 1-byte scan_icon, and each image is 28 bytes
+            yield "TXTR", struct.unpack_from(">L", data, 25 + 28 * i)[0]
+    else:
+        # magic, unknown1, unknown2 and instance_count, followed by a size-prefixed script instance
+        instance_size = struct.unpack_from(">H", data, 13 + 4)[0]
+        yield from dgrp.dependencies_from_bytes(data, target_game, 13 + 4 + 2 + instance_size)
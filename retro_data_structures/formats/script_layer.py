@@ -1,6 +1,7 @@
 from __future__ import annotations
+import heapq
 import typing
-from typing import Optional, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 
 from construct.core import (
     Const,
@@ -77,10 +78,254 @@ SCLY = IfThenElse(game_check.current_game_at_least(game_check.Game.ECHOES), Scri
 SCGN = ScriptLayer("SCGN")
 
 
+class InstanceIdAllocator:
+    """
+    Finds the lowest instance number that isn't used by any instance of an area, in amortized constant time.
+    Instance numbers are the lower 16 bits of instance ids, and should be unique in an area.
+    """
+
+    def __init__(self, used: Iterable[int] = ()):
+        # How many instances use each number
+        self._used: Dict[int, int] = {}
+        # Every number below this one is used, except the ones released since
+        self._lowest_candidate = 0
+        self._released: List[int] = []
+        for number in used:
+            self.reserve(number)
+
+    def reserve(self, number: int):
+        self._used[number] = self._used.get(number, 0) + 1
+
+    def release(self, number: int):
+        count = self._used.get(number, 0)
+        if count > 1:
+            self._used[number] = count - 1
+        elif count == 1:
+            del self._used[number]
+            if number < self._lowest_candidate:
+                heapq.heappush(self._released, number)
+
+    def lowest_free(self) -> int:
+        while self._released:
+            if self._released[0] not in self._used:
+                return self._released[0]
+            heapq.heappop(self._released)
+
+        while self._lowest_candidate in self._used:
+            self._lowest_candidate += 1
+        if self._lowest_candidate > 0xFFFF:
+            raise ValueError("Every instance number of the area is in use")
+        return self._lowest_candidate
+
+    def allocate(self) -> int:
+        number = self.lowest_free()
+        self.reserve(number)
+        return number
+
+
+def instance_name(instance: ScriptInstanceHelper) -> Optional[str]:
+    """The name of the instance, or None when its object type has no template or no name."""
+    try:
+        return instance.name
+    except (AttributeError, KeyError, TypeError):
+        # Object types without a template, or without a name
+        return None
+
+
+class _InstanceIndex:
+    """
+    The instance helpers of a layer by id, and their ids by name. Shared by every helper of the same layer, and kept
+    in sync by `ScriptLayerHelper`. If the list of raw instances is replaced or resized by other code, the index is
+    built again.
+    """
+
+    def __init__(self, raw: Container, target_game: Game, asset_provider: AssetProvider):
+        self._raw = raw
+        self._target_game = target_game
+        self._asset_provider = asset_provider
+        self._source: Optional[list] = None
+        self._source_length = 0
+        self._version = 0
+        self._helpers: List[ScriptInstanceHelper] = []
+        self._by_id: Dict[int, ScriptInstanceHelper] = {}
+        self._ids_by_name: Optional[Dict[str, List[int]]] = None
+        # Told about the instances added and removed, so it can update its own indexes
+        self.listener: Optional[AreaInstanceIndex] = None
+
+    def _ensure(self):
+        instances = self._raw.script_instances
+        if instances is self._source and len(instances) == self._source_length:
+            return
+
+        # Keep the helpers of instances that are still there, as they hold decoded properties
+        previous = {id(helper._raw): helper for helper in self._helpers}
+        self._helpers = []
+        for raw in instances:
+            helper = previous.get(id(raw))
+            if helper is None:
+                helper = ScriptInstanceHelper(raw, self._target_game, self._asset_provider)
+                helper._on_rename = self.invalidate_names
+            self._helpers.append(helper)
+
+        self._by_id = {}
+        for helper in self._helpers:
+            self._by_id.setdefault(helper.id, helper)
+        self._source = instances
+        self._source_length = len(instances)
+        self._ids_by_name = None
+        self._version += 1
+
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever instances are added or removed.
+        """
+        self._ensure()
+        return self._version
+
+    @property
+    def helpers(self) -> List[ScriptInstanceHelper]:
+        self._ensure()
+        return self._helpers
+
+    def ids(self) -> Iterator[int]:
+        self._ensure()
+        return iter(self._by_id)
+
+    def get(self, instance_id: int) -> Optional[ScriptInstanceHelper]:
+        self._ensure()
+        return self._by_id.get(instance_id)
+
+    def _find_by_name(self, name: str) -> Optional[ScriptInstanceHelper]:
+        for instance_id in self._ids_by_name.get(name, ()):
+            helper = self._by_id[instance_id]
+            if instance_name(helper) == name:
+                return helper
+        return None
+
+    def get_by_name(self, name: str) -> Optional[ScriptInstanceHelper]:
+        self._ensure()
+        if self._ids_by_name is not None:
+            result = self._find_by_name(name)
+            if result is not None or name not in self._ids_by_name:
+                return result
+            # The instance was renamed by editing its properties directly, so the names are outdated
+
+        self._ids_by_name = {}
+        for helper in self._helpers:
+            self._ids_by_name.setdefault(instance_name(helper), []).append(helper.id)
+        return self._find_by_name(name)
+
+    def invalidate_names(self):
+        self._ids_by_name = None
+
+    def append(self, helper: ScriptInstanceHelper):
+        self._ensure()
+        helper._on_rename = self.invalidate_names
+        self._raw.script_instances.append(helper._raw)
+        self._helpers.append(helper)
+        self._by_id.setdefault(helper.id, helper)
+        self._source_length += 1
+        if self._ids_by_name is not None:
+            self._ids_by_name.setdefault(instance_name(helper), []).append(helper.id)
+        self._version += 1
+        if self.listener is not None:
+            self.listener.instance_added(self, instance_id=helper.id)
+
+    def remove(self, instance_id: int):
+        self._ensure()
+        previous_count = len(self._helpers)
+        self._helpers = [helper for helper in self._helpers if helper.id != instance_id]
+        self._raw.script_instances = [helper._raw for helper in self._helpers]
+        self._by_id.pop(instance_id, None)
+        self._source = self._raw.script_instances
+        self._source_length = len(self._source)
+        self._ids_by_name = None
+        self._version += 1
+        if self.listener is not None:
+            self.listener.instances_removed(self, instance_id, previous_count - len(self._helpers))
+
+
+class AreaInstanceIndex:
+    """
+    Which layer has each instance id, and which instance numbers are in use, for all layers of an area.
+    Updated as instances are added or removed through the layers, and built again when a layer changed in some
+    other way.
+    """
+
+    def __init__(self, layers: List[ScriptLayerHelper]):
+        self.layers = layers
+        self._indexes = [layer._instance_index for layer in layers]
+        self._positions = {id(index): position for position, index in enumerate(self._indexes)}
+        for index in self._indexes:
+            index.listener = self
+
+        self._versions = [-1] * len(layers)
+        self._layer_by_id: Dict[int, int] = {}
+        self._allocator = InstanceIdAllocator()
+
+    def _ensure(self):
+        versions = [index.version for index in self._indexes]
+        if versions == self._versions:
+            return
+
+        self._layer_by_id = {}
+        for position in reversed(range(len(self._indexes))):
+            self._layer_by_id.update(dict.fromkeys(self._indexes[position].ids(), position))
+        self._allocator = InstanceIdAllocator(
+            helper.id & 0xFFFF for index in self._indexes for helper in index.helpers
+        )
+        self._versions = versions
+
+    def _in_sync(self, index: _InstanceIndex) -> Optional[int]:
+        # The position of the layer, if the only change since the last update is the one being reported
+        position = self._positions.get(id(index))
+        if position is None or self._versions[position] != index._version - 1:
+            return None
+        self._versions[position] = index._version
+        return position
+
+    def instance_added(self, index: _InstanceIndex, instance_id: int):
+        position = self._in_sync(index)
+        if position is None:
+            return
+        if self._layer_by_id.get(instance_id, position + 1) > position:
+            self._layer_by_id[instance_id] = position
+        self._allocator.reserve(instance_id & 0xFFFF)
+
+    def instances_removed(self, index: _InstanceIndex, instance_id: int, count: int):
+        position = self._in_sync(index)
+        if position is None:
+            return
+        for _ in range(count):
+            self._allocator.release(instance_id & 0xFFFF)
+
+        if self._layer_by_id.get(instance_id) == position:
+            del self._layer_by_id[instance_id]
+            for later in range(position + 1, len(self._indexes)):
+                if self._indexes[later].get(instance_id) is not None:
+                    self._layer_by_id[instance_id] = later
+                    break
+
+    def layer_with_instance(self, instance_id: int) -> Optional[ScriptLayerHelper]:
+        self._ensure()
+        position = self._layer_by_id.get(instance_id)
+        return None if position is None else self.layers[position]
+
+    @property
+    def allocator(self) -> InstanceIdAllocator:
+        self._ensure()
+        return self._allocator
+
+
 class ScriptLayerHelper(FormatWrapper):
     _parent_area: Optional[AreaHelper] = None
     _index: Optional[int] = None
 
+    def __init__(self, raw: Container, target_game: Game, asset_provider: AssetProvider):
+        super().__init__(raw, target_game, asset_provider)
+        self._instance_index = _InstanceIndex(raw, target_game, asset_provider)
+
     def __repr__(self) -> str:
         if self.has_parent:
             return f"{self.name} ({'Active' if self.active else 'Inactive'})"
@@ -89,37 +334,34 @@ class ScriptLayerHelper(FormatWrapper):
     @classmethod
     def with_parent(cls, child: "ScriptLayerHelper", parent: AreaHelper, index: int):
         new = cls(child._raw, child.target_game, child.asset_provider)
+        new._instance_index = child._instance_index
         new._parent_area = parent
         new._index = index
         return new
     
     @property
-    def instances(self):
-        for instance in self._raw.script_instances:
-            yield ScriptInstanceHelper(instance, self.target_game, self.asset_provider)
+    def instances(self) -> Iterator[ScriptInstanceHelper]:
+        yield from tuple(self._instance_index.helpers)
 
     def get_instance(self, instance_id: int) -> Optional[ScriptInstanceHelper]:
-        for instance in self.instances:
-            if instance.id == instance_id:
-                return instance
-
-    def get_instance_by_name(self, name: str) -> ScriptInstanceHelper:
-        for instance in self.instances:
-            if instance.name == name:
-                return instance
+        return self._instance_index.get(instance_id)
+
+    def get_instance_by_name(self, name: str) -> Optional[ScriptInstanceHelper]:
+        """
+        The first instance with the given name. Instances renamed by editing their properties in place, instead of
+        with `ScriptInstanceHelper.name`, may not be found by their new name.
+        """
+        return self._instance_index.get_by_name(name)
     
     def add_instance(self, instance_type: str, name: Optional[str] = None) -> ScriptInstanceHelper:
         instance = ScriptInstanceHelper.new_instance(self.target_game, instance_type, self)
         if name is not None:
             instance.name = name
-        self._raw.script_instances.append(instance._raw)
-        return self.get_instance(instance.id)
+        self._instance_index.append(instance)
+        return instance
     
     def remove_instance(self, instance_id: int):
-        self._raw.script_instances = [
-            i for i in self._raw.script_instances
-            if i.id.raw != instance_id
-        ]
+        self._instance_index.remove(instance_id)
 
     def remove_instances(self):
         self._raw.script_instances = []
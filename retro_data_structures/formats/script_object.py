@@ -3,7 +3,7 @@ https://wiki.axiodl.com/w/Scriptable_Layers_(File_Format)
 """
 from __future__ import annotations
 import io
-from typing import TYPE_CHECKING, Iterator
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
 
 import construct
 from construct import Container
@@ -16,7 +16,9 @@ from retro_data_structures import game_check
 from retro_data_structures.common_types import FourCC
 from retro_data_structures.formats.wrapper import FormatWrapper
 from retro_data_structures.game_check import Game, current_game_at_least_else
+from retro_data_structures.property_codegen import get_property_codec
 from retro_data_structures.property_template import GetPropertyConstruct
+from retro_data_structures.property_view import PropertyView
 
 if TYPE_CHECKING:
     from retro_data_structures.formats.script_layer import ScriptLayerHelper
@@ -81,6 +83,9 @@ ScriptInstance = Struct(
 
 class ScriptInstanceHelper(FormatWrapper):
     _properties: Container = None
+    _view: Optional[PropertyView] = None
+    # Called when the name might have changed, so the layer can update its index
+    _on_rename: Optional[Callable[[], None]] = None
 
     def __str__(self):
         return "<ScriptInstance {} 0x{:08x}>".format(self.type_name, self.id)
@@ -129,7 +134,15 @@ class ScriptInstanceHelper(FormatWrapper):
 
     @property
     def name(self) -> str:
-        return self.properties.EditorProperties.Name
+        return self.get_property("EditorProperties").Name
+
+    @name.setter
+    def name(self, value: str):
+        editor_properties = self.get_property("EditorProperties")
+        editor_properties.Name = value
+        self.set_property("EditorProperties", editor_properties)
+        if self._on_rename is not None:
+            self._on_rename()
 
     @property
     def _property_construct(self):
@@ -138,23 +151,79 @@ class ScriptInstanceHelper(FormatWrapper):
     @property
     def properties(self):
         if self._properties is None:
+            self._flush_view()
             self._properties = self._get_raw_properties()
         return self._properties
     
     @properties.setter
     def properties(self, value):
         self._properties = value
+        self._view = None
+        if value is not None and self._on_rename is not None:
+            self._on_rename()
+
+    def _property_view(self) -> Optional[PropertyView]:
+        if self._view is None:
+            try:
+                self._view = PropertyView(self._raw.instance.base_property, self.target_game, self.type)
+            except ValueError:
+                return None
+        return self._view
+
+    def _flush_view(self):
+        if self._view is not None:
+            self._raw.instance.base_property = self._view.build()
+            self._view = None
+
+    def get_property(self, name: str):
+        """
+        A single top-level property. Unless all properties were already decoded, only that one is.
+        """
+        view = self._property_view() if self._properties is None else None
+        if view is None:
+            return self._parsed_properties(name)[name]
+        return view[name]
+
+    def set_property(self, name: str, value):
+        """
+        Changes a single top-level property. Unless all properties were already decoded, saving only encodes the
+        properties used with `get_property` and `set_property`.
+        """
+        view = self._property_view() if self._properties is None else None
+        if view is None:
+            self._parsed_properties(name)[name] = value
+        else:
+            view[name] = value
+
+    def _parsed_properties(self, name: str):
+        properties = self.properties
+        if not isinstance(properties, dict):
+            # Object types without a template only have the raw bytes
+            raise KeyError(name)
+        return properties
 
     def _get_raw_properties(self):
+        codec = get_property_codec(self.target_game, self.type)
+        if codec is not None:
+            return codec.parse(self._raw.instance.base_property)
         return self._property_construct.parse(
             self._raw.instance.base_property,
             target_game=self.target_game,
         )
 
     def _set_raw_properties(self):
-        self._raw.instance.base_property = self._property_construct.build(
-            self.properties, target_game=self.target_game,
-        )
+        if self._properties is None:
+            # Nothing was decoded, or only single properties
+            self._flush_view()
+            return
+
+        codec = get_property_codec(self.target_game, self.type)
+        if codec is not None:
+            self._raw.instance.base_property = codec.build(self.properties)
+        else:
+            self._raw.instance.base_property = self._property_construct.build(
+                self.properties, target_game=self.target_game,
+            )
         self.properties = None
 
     @property
@@ -32,6 +32,7 @@ class FormatWrapper:
             raw = provider.get_asset(asset_id)
         wrapper = cls(raw, target_game, asset_provider, *args)
         wrapper._asset_id = asset_id
+        return wrapper
     
     @classmethod
     def construct_class(cls) -> Construct:
@@ -38,6 +38,13 @@ class Game(Enum):
     def uses_asset_id_32(self):
         return self <= Game.ECHOES
 
+    @property
+    def asset_id_format(self) -> str:
+        """
+        The `struct` format of an asset id, for code that reads raw bytes directly.
+        """
+        return ">L" if self.uses_asset_id_32 else ">Q"
+
     @property
     def uses_lzo(self):
         return self in {Game.ECHOES, Game.CORRUPTION}
@@ -0,0 +1,281 @@
+"""
+Compact, array-backed index of the resources of a pak.
+
+Parsing the header of every pak is a noticeable part of the startup of an AssetProvider, so the index can be persisted
+in a sidecar file and reused as long as the pak's size, modification time and header bytes are unchanged.
+"""
+import array
+import bisect
+import hashlib
+import logging
+import struct
+import sys
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from construct import Container
+
+from retro_data_structures.formats.pak import PAKNoData
+from retro_data_structures.game_check import Game
+
+logger = logging.getLogger(__name__)
+
+# The array.array typecode of unsigned 32-bit integers on this platform
+UINT32_TYPECODE = "I" if array.array("I").itemsize == 4 else "L"
+_INDEX_HEADER = struct.Struct(">4sIQQ20sII")
+_INDEX_MAGIC = b"RDSI"
+_INDEX_VERSION = 1
+
+
+def hash_pak_header(pak_file: BinaryIO, header_length: int) -> bytes:
+    pak_file.seek(0)
+    return hashlib.sha1(pak_file.read(header_length)).digest()
+
+
+def fourcc_to_int(fourcc: str) -> int:
+    """The four characters of an asset type or similar tag, packed in an int for compact storage."""
+    return int.from_bytes(fourcc.encode("ascii"), "big")
+
+
+def int_to_fourcc(value: int) -> str:
+    """The tag packed by `fourcc_to_int`."""
+    return value.to_bytes(4, "big").decode("ascii")
+
+
+class PakIndex:
+    """
+    The resource table of a pak, stored as parallel arrays.
+    """
+
+    def __init__(self, compressed: array.array, types: array.array, ids: array.array,
+                 sizes: array.array, offsets: array.array, header_length: int, header_hash: bytes,
+                 pak_size: int = 0, pak_mtime: int = 0):
+        self.compressed = compressed
+        self.types = types
+        self.ids = ids
+        self.sizes = sizes
+        self.offsets = offsets
+        self.header_length = header_length
+        self.header_hash = header_hash
+        self.pak_size = pak_size
+        self.pak_mtime = pak_mtime
+        self._resources = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_resources(cls, resources, header_length: int, header_hash: bytes) -> "PakIndex":
+        return cls(
+            compressed=array.array("B", (resource.compressed for resource in resources)),
+            types=array.array(UINT32_TYPECODE, (fourcc_to_int(resource.asset.type) for resource in resources)),
+            ids=array.array(UINT32_TYPECODE, (resource.asset.id for resource in resources)),
+            sizes=array.array(UINT32_TYPECODE, (resource.size for resource in resources)),
+            offsets=array.array(UINT32_TYPECODE, (resource.offset for resource in resources)),
+            header_length=header_length,
+            header_hash=header_hash,
+        )
+
+    @property
+    def resources(self) -> List[Container]:
+        """
+        The resources as the same containers that `PAKNoData` produces.
+        """
+        if self._resources is None:
+            self._resources = [
+                Container(
+                    compressed=self.compressed[i],
+                    asset=Container(type=int_to_fourcc(self.types[i]), id=self.ids[i]),
+                    size=self.sizes[i],
+                    offset=self.offsets[i],
+                )
+                for i in range(len(self))
+            ]
+        return self._resources
+
+    def is_valid_for(self, pak_size: int, pak_mtime: int, pak_file: BinaryIO) -> bool:
+        return (self.pak_size == pak_size
+                and self.pak_mtime == pak_mtime
+                and hash_pak_header(pak_file, self.header_length) == self.header_hash)
+
+    def to_bytes(self) -> bytes:
+        result = [_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, self.pak_size, self.pak_mtime,
+                                     self.header_hash, self.header_length, len(self))]
+        for column in (self.compressed, self.types, self.ids, self.sizes, self.offsets):
+            if sys.byteorder == "little" and column.itemsize > 1:
+                column = array.array(column.typecode, column)
+                column.byteswap()
+            result.append(column.tobytes())
+        return b"".join(result)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PakIndex":
+        magic, version, pak_size, pak_mtime, header_hash, header_length, count = _INDEX_HEADER.unpack_from(data, 0)
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            raise ValueError("Not a pak index, or from an unsupported version")
+
+        offset = _INDEX_HEADER.size
+        columns = []
+        for typecode in ("B", UINT32_TYPECODE, UINT32_TYPECODE, UINT32_TYPECODE, UINT32_TYPECODE):
+            column = array.array(typecode)
+            end = offset + count * column.itemsize
+            if end > len(data):
+                raise ValueError("Truncated pak index")
+            column.frombytes(data[offset:end])
+            if sys.byteorder == "little" and column.itemsize > 1:
+                column.byteswap()
+            columns.append(column)
+            offset = end
+
+        return cls(*columns, header_length=header_length, header_hash=header_hash,
+                   pak_size=pak_size, pak_mtime=pak_mtime)
+
+
+class AssetLocations:
+    """
+    Where each asset is in a set of paks, including every duplicate, stored as parallel arrays sorted by asset id.
+    The copies of an asset are sorted by pak, then by offset.
+    """
+
+    def __init__(self, paks: List[PakIndex]):
+        self.paks = paks
+
+        pak_ids = array.array("H")
+        entries = array.array(UINT32_TYPECODE)
+        for pak_id, pak in enumerate(paks):
+            pak_ids.extend([pak_id] * len(pak))
+            entries.extend(range(len(pak)))
+
+        def sort_key(k):
+            pak = paks[pak_ids[k]]
+            return pak.ids[entries[k]], pak_ids[k], pak.offsets[entries[k]]
+
+        order = sorted(range(len(entries)), key=sort_key)
+
+        self.ids = array.array(UINT32_TYPECODE)
+        self.starts = array.array(UINT32_TYPECODE)
+        self.pak_ids = array.array("H", (pak_ids[k] for k in order))
+        self.entries = array.array(UINT32_TYPECODE, (entries[k] for k in order))
+        for i, k in enumerate(order):
+            asset_id = paks[pak_ids[k]].ids[entries[k]]
+            if not self.ids or self.ids[-1] != asset_id:
+                self.ids.append(asset_id)
+                self.starts.append(i)
+        self.starts.append(len(order))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _range(self, asset_id: int) -> range:
+        i = bisect.bisect_left(self.ids, asset_id)
+        if i == len(self.ids) or self.ids[i] != asset_id:
+            return range(0)
+        return range(self.starts[i], self.starts[i + 1])
+
+    def locations(self, asset_id: int) -> List[Tuple[int, int]]:
+        """
+        Every copy of the asset, as (pak id, index in the pak's resource table).
+        """
+        return [(self.pak_ids[k], self.entries[k]) for k in self._range(asset_id)]
+
+    def copies(self, asset_id: int) -> int:
+        return len(self._range(asset_id))
+
+    def duplicated_asset_ids(self) -> List[int]:
+        return [asset_id for i, asset_id in enumerate(self.ids) if self.starts[i + 1] - self.starts[i] > 1]
+
+    def _redundant_copies(self):
+        # Every copy of an asset besides the first one
+        for i in range(len(self.ids)):
+            for k in range(self.starts[i] + 1, self.starts[i + 1]):
+                yield self.pak_ids[k], self.entries[k]
+
+    def duplication_stats(self) -> Dict[str, int]:
+        """
+        How much space the paks would save by storing each asset only once. Sizes are as stored, so compressed.
+        """
+        redundant_bytes = 0
+        redundant_copies = 0
+        for pak_id, entry in self._redundant_copies():
+            redundant_bytes += self.paks[pak_id].sizes[entry]
+            redundant_copies += 1
+
+        return {
+            "resources": len(self.entries),
+            "assets": len(self.ids),
+            "duplicated_assets": len(self.duplicated_asset_ids()),
+            "redundant_copies": redundant_copies,
+            "redundant_bytes": redundant_bytes,
+        }
+
+    def redundant_bytes_by_type(self) -> Dict[str, int]:
+        result = {}
+        for pak_id, entry in self._redundant_copies():
+            pak = self.paks[pak_id]
+            asset_type = int_to_fourcc(pak.types[entry])
+            result[asset_type] = result.get(asset_type, 0) + pak.sizes[entry]
+        return result
+
+    def shared_bytes_by_pak(self) -> List[int]:
+        """
+        For each pak, the size of its resources that are also in some other pak.
+        """
+        result = [0] * len(self.paks)
+        for i in range(len(self.ids)):
+            copies = range(self.starts[i], self.starts[i + 1])
+            if len({self.pak_ids[k] for k in copies}) > 1:
+                for k in copies:
+                    result[self.pak_ids[k]] += self.paks[self.pak_ids[k]].sizes[self.entries[k]]
+        return result
+
+
+def read_pak_index(pak_file: BinaryIO, target_game: Game) -> PakIndex:
+    pak_file.seek(0)
+    header = PAKNoData.parse_stream(pak_file, target_game=target_game)
+    header_length = pak_file.tell()
+    return PakIndex.from_resources(header.resources, header_length, hash_pak_header(pak_file, header_length))
+
+
+def index_cache_path(cache_dir: Path, pak_path: Path) -> Path:
+    path_hash = hashlib.sha1(str(pak_path.absolute()).encode("utf-8")).hexdigest()[:16]
+    return cache_dir.joinpath(f"{pak_path.name}.{path_hash}.rdsidx")
+
+
+def load_cached_pak_index(pak_file: BinaryIO, pak_path: Path, target_game: Game, cache_dir: Path) -> PakIndex:
+    """
+    Returns the index stored in `cache_dir` for the given pak, or parses the pak and stores a new index
+    when there's no index or it's outdated.
+    """
+    stat = pak_path.stat()
+    cache_path = index_cache_path(cache_dir, pak_path)
+
+    index: Optional[PakIndex] = None
+    try:
+        index = PakIndex.from_bytes(cache_path.read_bytes())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning("Ignoring invalid pak index at %s: %s", str(cache_path), e)
+
+    if index is not None and index.is_valid_for(stat.st_size, stat.st_mtime_ns, pak_file):
+        return index
+
+    logger.info("Parsing PAK at %s", str(pak_path))
+    index = read_pak_index(pak_file, target_game)
+    save_cached_pak_index(index, pak_path, cache_dir)
+    return index
+
+
+def save_cached_pak_index(index: PakIndex, pak_path: Path, cache_dir: Path):
+    """
+    Stores the index in `cache_dir`, stamped with the current size and modification time of the pak.
+    """
+    stat = pak_path.stat()
+    index.pak_size = stat.st_size
+    index.pak_mtime = stat.st_mtime_ns
+    cache_path = index_cache_path(cache_dir, pak_path)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_path.write_bytes(index.to_bytes())
+    except OSError as e:
+        logger.warning("Unable to write pak index to %s: %s", str(cache_path), e)
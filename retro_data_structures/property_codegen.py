@@ -0,0 +1,571 @@
+"""
+Generated code for parsing and building the properties of script objects.
+
+The constructs of `property_template` interpret a deep tree of `Struct`, `FocusedSeq` and `Prefixed` for every
+instance. For each script object type, this module generates Python source that reads and writes the same layout with
+a flat sequence of `struct` calls, merging consecutive fixed-size properties into a single call, and compiles it the
+first time that type is used.
+
+The constructs remain the reference implementation. Object types using features the generated code doesn't replicate,
+such as properties only cooked when modified, have no codec. Data the generated code doesn't expect, such as a property
+with an unusual size, is handed to the construct instead, so the results and errors are always the construct's.
+"""
+import logging
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+from construct import Container, Enum, Int32ub, ListContainer, MappingError
+from construct.lib import HexDisplayedInteger
+
+from retro_data_structures import property_template
+from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import PropertyCountFields, PropertyFieldName
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">LH")
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">L")
+
+
+class UnsupportedProperty(Exception):
+    pass
+
+
+class _Mismatch(Exception):
+    """
+    The data doesn't have the layout the generated code expects.
+    """
+
+
+def _hex8(value):
+    return HexDisplayedInteger.new(value, "08X")
+
+
+def _hex16(value):
+    return HexDisplayedInteger.new(value, "016X")
+
+
+def _proportion(value):
+    if not 0.0 <= value <= 1.0:
+        raise _Mismatch()
+    return value
+
+
+def _color(r, g, b, a):
+    return Container(R=_proportion(r), G=_proportion(g), B=_proportion(b), A=_proportion(a))
+
+
+def _color_args(color):
+    alpha = color.get("A")
+    return (_proportion(color["R"]), _proportion(color["G"]), _proportion(color["B"]),
+            _proportion(1.0 if alpha is None else alpha))
+
+
+def _vector(x, y, z):
+    return Container(X=x, Y=y, Z=z)
+
+
+def _vector_args(vector):
+    return vector["X"], vector["Y"], vector["Z"]
+
+
+def _animation_set(asset, character, anim):
+    return Container(AnimationCharacterSet=asset, Character=character, DefaultAnim=anim)
+
+
+def _animation_set_args(value):
+    return value["AnimationCharacterSet"], value["Character"], value["DefaultAnim"]
+
+
+_RUNTIME = {
+    "Container": Container,
+    "ListContainer": ListContainer,
+    "_HEADER": _HEADER,
+    "_U16": _U16,
+    "_U32": _U32,
+    "_Mismatch": _Mismatch,
+    "_hex8": _hex8,
+    "_hex16": _hex16,
+    "_color": _color,
+    "_color_args": _color_args,
+    "_vector": _vector,
+    "_vector_args": _vector_args,
+    "_animation_set": _animation_set,
+    "_animation_set_args": _animation_set_args,
+}
+
+
+class _Fixed:
+    """
+    A property with a constant size, read with a single struct format.
+    """
+
+    def __init__(self, fmt: str, decode: Callable[[List[str]], str], encode: Callable[[str], str],
+                 expected: Optional[Dict[int, int]] = None, needs_value: bool = True):
+        """
+        :param decode: The expression for the property, from the names holding the unpacked values.
+        :param encode: The arguments to pack, from the name holding the property.
+        :param expected: Values that must be present at the given positions, such as property ids.
+        """
+        self.fmt = fmt
+        self.size = struct.calcsize(">" + fmt)
+        self.count = len(struct.unpack(">" + fmt, bytes(self.size)))
+        self.decode = decode
+        self.encode = encode
+        self.expected = expected or {}
+        self.needs_value = needs_value
+
+
+def _plain(fmt: str) -> _Fixed:
+    return _Fixed(fmt, lambda v: v[0], lambda x: x)
+
+
+_NEVER = _Fixed("", lambda v: "None", lambda x: "", needs_value=False)
+
+
+class _CString:
+    pass
+
+
+class _Greedy:
+    pass
+
+
+class _Array:
+    def __init__(self, item):
+        self.item = item
+
+
+class _IdPrefixed:
+    def __init__(self, property_id: int, inner):
+        self.property_id = property_id
+        self.inner = inner
+
+
+class _Struct:
+    def __init__(self, fields: Dict[str, object], name: Optional[str], count: Optional[Tuple[str, int, List[str]]],
+                 header: Optional[int], atomic_with_header: bool):
+        self.fields = fields
+        self.name = name
+        self.count = count
+        self.header = header
+        self.atomic_with_header = atomic_with_header
+
+
+def _id_prefixed(property_id: int, inner):
+    if not isinstance(inner, _Fixed):
+        return _IdPrefixed(property_id, inner)
+
+    expected = {0: property_id, 1: inner.size}
+    expected.update({i + 2: value for i, value in inner.expected.items()})
+    return _Fixed(
+        "LH" + inner.fmt,
+        lambda v: inner.decode(v[2:]),
+        lambda x: f"{property_id}, {inner.size}, {inner.encode(x)}",
+        expected,
+        inner.needs_value,
+    )
+
+
+class _TemplateReader:
+    """
+    Describes the layout of a script object, following exactly what `CreatePropertyConstructs` does.
+    """
+
+    def __init__(self, game: Game, namespace: dict):
+        self.game = game
+        self.template = property_template.GetGameTemplate(game)
+        self.enums = property_template._ENUMS_BY_GAME[game]
+        self.namespace = namespace
+
+    def script_object(self, obj_type: str) -> _Struct:
+        obj = self.template.script_objects[obj_type]
+        return self.struct(obj.properties, False, 0xFFFFFFFF, False, obj.name)
+
+    def struct(self, properties, atomic: bool, property_id, in_array: bool, name: Optional[str] = None) -> _Struct:
+        names = {prop.id: property_template.GetPropertyName(self.game, prop.id) for prop in properties}
+        fields = {PropertyFieldName(prop, names): self.property(prop, atomic) for prop in properties}
+
+        count = None
+        if not atomic:
+            fixed_count, optionals = PropertyCountFields(properties, names)
+            count = ("H" if self.game >= Game.ECHOES else "L", fixed_count, optionals)
+
+        header = None
+        atomic_with_header = False
+        if self.game >= Game.ECHOES and not (atomic and in_array):
+            if property_id is None:
+                raise UnsupportedProperty("Struct property without an id")
+            header = property_id
+            atomic_with_header = atomic
+
+        # An atomic struct only has a header when the parent has no field named "count"
+        if "count" in fields and any(isinstance(field, _Struct) and field.atomic_with_header
+                                     for field in fields.values()):
+            raise UnsupportedProperty("Atomic struct next to a field named count")
+
+        return _Struct(fields, name, count, header, atomic_with_header)
+
+    def property(self, prop, atomic: bool, in_array: bool = False):
+        if prop.type == "Struct":
+            archetype = self.template.property_archetypes.get(prop.archetype)
+            if archetype is None or archetype.type != "Struct":
+                raise UnsupportedProperty(f"Unknown archetype {prop.archetype}")
+
+            prop_id = prop.id if not atomic else None
+            if not prop.properties:
+                return self.struct(archetype.properties, archetype.atomic, prop_id, in_array)
+
+            properties = {p.id: p for p in archetype.properties}
+            properties.update({p.id: p for p in prop.properties})
+            return self.struct(list(properties.values()), atomic, prop_id, in_array)
+
+        if prop.type == "Array":
+            data = _Array(self.property(prop.item_archetype, True, True))
+        elif prop.get("archetype") is not None and prop.type in ("Choice", "Enum"):
+            data = self.enum(prop.archetype)
+        else:
+            data = self.primitive(prop.type)
+
+        if not atomic and self.game >= Game.ECHOES:
+            data = _id_prefixed(prop.id, data)
+
+        if prop.cook_preference == "Never":
+            return _NEVER
+        if prop.cook_preference in ("OnlyIfModified", "Default"):
+            raise UnsupportedProperty(f"Cook preference {prop.cook_preference}")
+        return data
+
+    def enum(self, archetype: str) -> _Fixed:
+        enum_class = getattr(self.enums, archetype, None)
+        if enum_class is None:
+            raise UnsupportedProperty(f"Unknown enum {archetype}")
+
+        name = f"_enum_{archetype}"
+        self.namespace[name] = Enum(Int32ub, enum_class)
+        return _Fixed("L", lambda v: f"{name}._decode({v[0]}, None, None)",
+                      lambda x: f"{name}._encode({x}, None, None)")
+
+    def primitive(self, prop_type: str):
+        if self.game.uses_asset_id_32:
+            asset_fmt, to_hex = "L", "_hex8"
+        else:
+            asset_fmt, to_hex = "Q", "_hex16"
+
+        if prop_type in ("Int", "Choice", "Flags", "Enum"):
+            return _plain("L")
+        if prop_type == "Short":
+            return _plain("H")
+        if prop_type == "Float":
+            return _plain("f")
+        if prop_type == "Bool":
+            return _Fixed("B", lambda v: f"{v[0]} != 0", lambda x: f"1 if {x} else 0")
+        if prop_type == "Asset":
+            return _Fixed(asset_fmt, lambda v: f"{to_hex}({v[0]})", lambda x: x)
+        if prop_type == "Sound":
+            return _Fixed("L", lambda v: f"_hex8({v[0]})", lambda x: x)
+        if prop_type == "Color":
+            return _Fixed("ffff", lambda v: f"_color({', '.join(v)})", lambda x: f"*_color_args({x})")
+        if prop_type == "Vector":
+            return _Fixed("fff", lambda v: f"_vector({', '.join(v)})", lambda x: f"*_vector_args({x})")
+        if prop_type == "AnimationSet":
+            return _Fixed(asset_fmt + "LL", lambda v: f"_animation_set({to_hex}({v[0]}), {v[1]}, {v[2]})",
+                          lambda x: f"*_animation_set_args({x})")
+        if prop_type == "String":
+            return _CString()
+        return _Greedy()
+
+
+class _Emitter:
+    def __init__(self, namespace: dict):
+        self.namespace = namespace
+        self.lines: List[str] = []
+        self.indent = 0
+        self._names = 0
+        self._formats: Dict[str, str] = {}
+
+    def var(self, prefix: str = "v") -> str:
+        self._names += 1
+        return f"{prefix}{self._names}"
+
+    def line(self, text: str):
+        self.lines.append("    " * self.indent + text)
+
+    def struct_format(self, fmt: str) -> str:
+        name = self._formats.get(fmt)
+        if name is None:
+            name = self._formats[fmt] = f"_S{len(self._formats)}"
+            self.namespace[name] = struct.Struct(">" + fmt)
+        return name
+
+    # Parsing: `data` is the buffer, `p` the position and the given `end` the end of the current Prefixed
+
+    def parse(self, node, end: str) -> str:
+        if isinstance(node, _Fixed):
+            return self.parse_fixed([node], end)[0]
+        if isinstance(node, _Struct):
+            return self.parse_struct(node, end)
+        if isinstance(node, _IdPrefixed):
+            region = self.parse_header(node.property_id, end)
+            value = self.parse(node.inner, region)
+            self.line(f"if p > {region}: raise _Mismatch()")
+            self.line(f"p = {region}")
+            return value
+        if isinstance(node, _Array):
+            count = self.var("n")
+            self.line(f"{count}, = _U32.unpack_from(data, p)")
+            self.line("p += 4")
+            self.line(f"if p > {end}: raise _Mismatch()")
+            items = self.var("a")
+            self.line(f"{items} = ListContainer()")
+            self.line(f"for _ in range({count}):")
+            self.indent += 1
+            self.line(f"{items}.append({self.parse(node.item, end)})")
+            self.indent -= 1
+            return items
+        if isinstance(node, _CString):
+            terminator = self.var("t")
+            value = self.var()
+            self.line(f"{terminator} = data.find(b'\\x00', p, {end})")
+            self.line(f"if {terminator} < 0: raise _Mismatch()")
+            self.line(f"{value} = data[p:{terminator}].decode('utf-8')")
+            self.line(f"p = {terminator} + 1")
+            return value
+        if isinstance(node, _Greedy):
+            value = self.var()
+            self.line(f"{value} = data[p:{end}]")
+            self.line(f"p = {end}")
+            return value
+        raise TypeError(node)
+
+    def parse_fixed(self, nodes: List[_Fixed], end: str) -> List[str]:
+        values = [self.var() for _ in range(sum(node.count for node in nodes))]
+        if not values:
+            return [node.decode([]) for node in nodes]
+
+        self.line(f"{', '.join(values)}, = {self.struct_format(''.join(node.fmt for node in nodes))}"
+                  f".unpack_from(data, p)")
+        self.line(f"p += {sum(node.size for node in nodes)}")
+
+        conditions = [f"p > {end}"]
+        result = []
+        offset = 0
+        for node in nodes:
+            node_values = values[offset:offset + node.count]
+            conditions.extend(f"{node_values[i]} != {expected}" for i, expected in node.expected.items())
+            result.append(node.decode(node_values))
+            offset += node.count
+
+        self.line(f"if {' or '.join(conditions)}: raise _Mismatch()")
+        return result
+
+    def parse_header(self, property_id: int, end: str) -> str:
+        header_id = self.var("h")
+        size = self.var("s")
+        region = self.var("e")
+        self.line(f"{header_id}, {size} = _HEADER.unpack_from(data, p)")
+        self.line("p += 6")
+        self.line(f"{region} = p + {size}")
+        self.line(f"if {header_id} != {property_id} or {region} > {end}: raise _Mismatch()")
+        return region
+
+    def parse_struct(self, node: _Struct, end: str) -> str:
+        region = end if node.header is None else self.parse_header(node.header, end)
+
+        container = self.var("c")
+        self.line(f"{container} = Container()")
+        if node.name is not None:
+            self.line(f"{container}['_name'] = {node.name!r}")
+
+        fields = list(node.fields.items())
+        if node.count is not None:
+            fields.insert(0, ("_prop_count", _plain(node.count[0])))
+
+        run = []
+        for name, field in fields + [(None, None)]:
+            if isinstance(field, _Fixed):
+                run.append((name, field))
+                continue
+
+            if run:
+                values = self.parse_fixed([f for _, f in run], region)
+                for (run_name, _), value in zip(run, values):
+                    self.line(f"{container}[{run_name!r}] = {value}")
+                run = []
+
+            if field is not None:
+                self.line(f"{container}[{name!r}] = {self.parse(field, region)}")
+
+        if node.header is not None:
+            self.line(f"if p > {region}: raise _Mismatch()")
+            self.line(f"p = {region}")
+        return container
+
+    # Building: everything is appended to the bytearray `out`
+
+    def build(self, node, value: str):
+        if isinstance(node, _Fixed):
+            if node.count:
+                self.line(f"out += {self.struct_format(node.fmt)}.pack({node.encode(value)})")
+        elif isinstance(node, _Struct):
+            self.build_struct(node, value)
+        elif isinstance(node, _IdPrefixed):
+            start = self.build_header(node.property_id)
+            self.build(node.inner, value)
+            self.line(f"_U16.pack_into(out, {start} - 2, len(out) - {start})")
+        elif isinstance(node, _Array):
+            item = self.var("item")
+            self.line(f"out += _U32.pack(len({value}))")
+            self.line(f"for {item} in {value}:")
+            self.indent += 1
+            if isinstance(node.item, _Struct):
+                self.line(f"if {item} is None: {item} = {{}}")
+            self.build(node.item, item)
+            self.line("pass")
+            self.indent -= 1
+        elif isinstance(node, _CString):
+            self.line(f"out += {value}.encode('utf-8')")
+            self.line("out += b'\\x00'")
+        elif isinstance(node, _Greedy):
+            self.line(f"out += bytes({value})")
+        else:
+            raise TypeError(node)
+
+    def build_header(self, property_id: int) -> str:
+        start = self.var("s")
+        self.line(f"out += _HEADER.pack({property_id}, 0)")
+        self.line(f"{start} = len(out)")
+        return start
+
+    def build_struct(self, node: _Struct, value: str):
+        start = None if node.header is None else self.build_header(node.header)
+
+        fields = [(name, field, None) for name, field in node.fields.items()]
+        if node.count is not None:
+            count_fmt, fixed_count, optionals = node.count
+            count = " + ".join([str(fixed_count)] + [f"({value}.get({name!r}) is not None)" for name in optionals])
+            fields.insert(0, ("_prop_count", _plain(count_fmt), count))
+
+        run = []
+        for name, field, computed in fields + [(None, None, None)]:
+            if isinstance(field, _Fixed):
+                run.append((name, field, computed))
+                continue
+
+            if run:
+                args = []
+                for run_name, run_field, run_computed in run:
+                    if run_computed is not None:
+                        args.append(run_field.encode(run_computed))
+                    elif run_field.needs_value:
+                        field_value = self.var("f")
+                        self.line(f"{field_value} = {value}[{run_name!r}]")
+                        args.append(run_field.encode(field_value))
+                if args:
+                    fmt = "".join(run_field.fmt for _, run_field, _ in run)
+                    self.line(f"out += {self.struct_format(fmt)}.pack({', '.join(args)})")
+                run = []
+
+            if field is not None:
+                field_value = self.var("f")
+                if isinstance(field, _Struct):
+                    self.line(f"{field_value} = {value}.get({name!r})")
+                    self.line(f"if {field_value} is None: {field_value} = {{}}")
+                else:
+                    self.line(f"{field_value} = {value}[{name!r}]")
+                self.build(field, field_value)
+
+        if start is not None:
+            self.line(f"_U16.pack_into(out, {start} - 2, len(out) - {start})")
+
+
+def generate_codec_source(game: Game, obj_type: str, namespace: dict) -> str:
+    """
+    The source of the `parse(data)` and `build(obj)` functions for the given script object type.
+    The objects the source refers to are added to `namespace`.
+    :raises UnsupportedProperty: When the object uses features the generated code doesn't replicate.
+    """
+    node = _TemplateReader(game, namespace).script_object(obj_type)
+    emitter = _Emitter(namespace)
+
+    emitter.line("def parse(data):")
+    emitter.indent = 1
+    emitter.line("p = 0")
+    emitter.line("end = len(data)")
+    emitter.line(f"return {emitter.parse_struct(node, 'end')}")
+
+    emitter.indent = 0
+    emitter.line("")
+    emitter.line("def build(obj):")
+    emitter.indent = 1
+    emitter.line("if obj is None: obj = {}")
+    emitter.line("out = bytearray()")
+    emitter.build_struct(node, "obj")
+    emitter.line("return bytes(out)")
+
+    return "\n".join(emitter.lines) + "\n"
+
+
+# What the generated code raises for data it doesn't expect: a different layout, truncated data or invalid strings
+_PARSE_FALLBACK_ERRORS = (_Mismatch, struct.error, UnicodeDecodeError)
+
+# What the generated code raises for objects it doesn't expect: missing fields, values of the wrong type or out of
+# range, and unknown enum names
+_BUILD_FALLBACK_ERRORS = (_Mismatch, struct.error, KeyError, TypeError, AttributeError, UnicodeEncodeError,
+                          MappingError)
+
+
+class PropertyCodec:
+    """
+    Parses and builds the properties of a script object type with generated code, using the construct from
+    `GetPropertyConstruct` for any data the generated code doesn't handle.
+    """
+
+    def __init__(self, game: Game, obj_type: str):
+        self.game = game
+        self.obj_type = obj_type
+        namespace = dict(_RUNTIME)
+        self.source = generate_codec_source(game, obj_type, namespace)
+        exec(compile(self.source, f"<properties of {obj_type}>", "exec"), namespace)
+        self._parse = namespace["parse"]
+        self._build = namespace["build"]
+
+    @property
+    def _reference(self):
+        return property_template.GetPropertyConstruct(self.game, self.obj_type)
+
+    def parse(self, data) -> Container:
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        try:
+            return self._parse(data)
+        except _PARSE_FALLBACK_ERRORS as e:
+            logger.debug("Parsing %s with the construct instead: %r", self.obj_type, e)
+            return self._reference.parse(data, target_game=self.game)
+
+    def build(self, obj) -> bytes:
+        try:
+            return self._build(obj)
+        except _BUILD_FALLBACK_ERRORS as e:
+            logger.debug("Building %s with the construct instead: %r", self.obj_type, e)
+            return self._reference.build(obj, target_game=self.game)
+
+
+_codecs: Dict[Tuple[Game, str], Optional[PropertyCodec]] = {}
+
+
+def get_property_codec(game: Game, obj_type) -> Optional[PropertyCodec]:
+    """
+    The codec for the given script object type, or None if the generated code can't be used for it.
+    """
+    key = (game, obj_type)
+    if key not in _codecs:
+        codec = None
+        if obj_type in property_template.GetGameTemplate(game).script_objects:
+            try:
+                codec = PropertyCodec(game, obj_type)
+            except UnsupportedProperty:
+                pass
+        _codecs[key] = codec
+    return _codecs[key]
@@ -1,6 +1,21 @@
+"""
+Constructs for the properties of script objects, created from the templates in the `properties` directory.
+
+Parsing a template is slow, so the parsed template is also pickled to a cache directory and that's loaded instead while
+the template is unchanged. The construct of each script object is only created when first requested.
+"""
+import collections.abc
 import enum
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import typing
 from pathlib import Path
-from typing import Dict
+from typing import Callable, Dict, Iterable, NamedTuple
+
+import construct
 
 from construct.core import (
     Adapter,
@@ -43,6 +58,8 @@ from retro_data_structures.construct_extensions.dict import DictAdapter, DictStr
 from retro_data_structures.construct_extensions.misc import ErrorWithMessage, LabeledOptional
 from retro_data_structures.game_check import AssetIdCorrect, Game
 
+logger = logging.getLogger(__name__)
+
 Proportion = FocusedSeq("value", "value" / Float32b, Check(lambda t: 0.0 <= t.value <= 1.0))
 
 
@@ -193,18 +210,92 @@ GameList = DictAdapter(ListGameTemplate)
 
 PropertyNames = Prefixed(VarInt, Compressed(DictAdapter(String, objisdict=False), "zlib"))
 
-_game_template_cache = {}
+_PROPERTIES_PATH = Path(__file__).parent.joinpath("properties")
+_TEMPLATE_CACHE_VERSION = 2
 
 
-def GetGameTemplate(game: Game):
-    prop_path = Path(__file__).parent.joinpath("properties")
+def _default_template_cache_dir() -> Path:
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home().joinpath("AppData", "Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")
+    return Path(base).joinpath("retro_data_structures")
+
+
+_template_cache_dir: typing.Optional[Path] = _default_template_cache_dir()
+
+
+def set_template_cache_dir(cache_dir: typing.Optional[Path]):
+    """
+    Changes where the parsed templates are cached. None disables the cache.
+    The default is a `retro_data_structures` directory in the user's cache directory.
+    """
+    global _template_cache_dir
+    _template_cache_dir = cache_dir
+
+
+def _template_cache_path(source: Path) -> typing.Optional[Path]:
+    if _template_cache_dir is None:
+        return None
+    path_hash = hashlib.sha1(str(source.absolute()).encode("utf-8")).hexdigest()[:16]
+    return _template_cache_dir.joinpath(f"{source.name}.{path_hash}.pickle")
+
 
+def _template_cache_key(data: bytes) -> tuple:
+    # Pickles of construct containers depend on the construct and Python versions
+    return (
+        _TEMPLATE_CACHE_VERSION, construct.version_string, tuple(sys.version_info[:2]), hashlib.sha1(data).digest(),
+    )
+
+
+def _parse_with_cache(source: Path, construct_class):
+    """
+    Parses the given file, or loads the result from the cache if that was made from the same file.
+    """
+    data = source.read_bytes()
+    cache_path = _template_cache_path(source)
+    if cache_path is None:
+        return construct_class.parse(data)
+    key = _template_cache_key(data)
+
+    try:
+        with cache_path.open("rb") as cache_file:
+            cached_key, result = pickle.load(cache_file)
+        if cached_key == key:
+            return result
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("Ignoring invalid template cache at %s: %s", str(cache_path), e)
+
+    result = construct_class.parse(data)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with cache_path.open("wb") as cache_file:
+            pickle.dump((key, result), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logger.debug("Unable to write template cache to %s: %s", str(cache_path), e)
+
+    return result
+
+
+def _game_template_path(game: Game) -> Path:
     game_id = {Game.PRIME: "Prime", Game.ECHOES: "Echoes", Game.CORRUPTION: "Corruption"}[game]
+    return _PROPERTIES_PATH.joinpath(game_id + ".prop")
 
-    if not game_id in _game_template_cache.keys():
-        _game_template_cache[game_id] = GameTemplate.parse_file(prop_path / (game_id + ".prop"))
 
-    return _game_template_cache[game_id]
+def _property_names_path() -> Path:
+    return _PROPERTIES_PATH.joinpath("property_names.pname")
+
+
+_game_template_cache = {}
+
+
+def GetGameTemplate(game: Game):
+    if game not in _game_template_cache:
+        _game_template_cache[game] = _parse_with_cache(_game_template_path(game), GameTemplate)
+
+    return _game_template_cache[game]
 
 
 _property_names_cache = {}
@@ -216,12 +307,21 @@ def GetPropertyName(game_id: Game, prop_id):
 
     global _property_names_cache
 
-    prop_path = Path(__file__).parent.joinpath("properties")
     if not _property_names_cache:
-        _property_names_cache = PropertyNames.parse_file(prop_path / "property_names.pname")
+        _property_names_cache = _parse_with_cache(_property_names_path(), PropertyNames)
     return _property_names_cache.get(prop_id, "")
 
 
+def write_template_caches(games: Iterable[Game] = (Game.PRIME, Game.ECHOES, Game.CORRUPTION)):
+    """
+    Creates the template caches ahead of time, so the first use of each template doesn't need to parse it.
+    Never called by the library or its build: it's meant for applications that want to warm the cache up front.
+    """
+    _parse_with_cache(_property_names_path(), PropertyNames)
+    for game in games:
+        _parse_with_cache(_game_template_path(game), GameTemplate)
+
+
 PropertyConstructs: Dict[Game, Dict[str, Subconstruct]] = {}
 
 _ENUMS_BY_GAME = {
@@ -231,6 +331,26 @@ _ENUMS_BY_GAME = {
 }
 
 
+def PropertyFieldName(prop, names: Dict[int, str]) -> str:
+    """
+    The name of the field for the given property, in a struct with properties whose names are `names`.
+    """
+    name = names.get(prop.id) or prop.name
+    occurences = len([n for n in names.values() if n == name])
+    if not name or occurences > 1:
+        name += f"0x{prop.id:X}"
+    return name
+
+
+def PropertyCountFields(props, names: Dict[int, str]):
+    """
+    How many of the properties are always written, and the field names of the ones only written when set.
+    """
+    fixed_count = len([prop for prop in props if prop.cook_preference == "Always" or prop.cook_preference == "Default"])
+    optionals = [PropertyFieldName(prop, names) for prop in props if prop.cook_preference == "OnlyIfModified"]
+    return fixed_count, optionals
+
+
 class OnlyIfModified(Adapter):
     def __init__(self, subcon, default):
         super().__init__(Optional(subcon))
@@ -243,12 +363,42 @@ class OnlyIfModified(Adapter):
         return None if obj == self.default else obj
 
 
+class LazyPropertyConstructs(collections.abc.Mapping):
+    """
+    The construct of each script object, or anything else made from its template, created when first requested.
+    """
+
+    def __init__(self, names: Iterable[str], create: Callable[[str], Subconstruct]):
+        self._names = frozenset(names)
+        self._create = create
+        self._constructs: Dict[str, Subconstruct] = {}
+
+    def __getitem__(self, name: str) -> Subconstruct:
+        result = self._constructs.get(name)
+        if result is None:
+            if name not in self._names:
+                raise KeyError(name)
+            result = self._constructs[name] = self._create(name)
+        return result
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name) -> bool:
+        return name in self._names
+
+
 def CreatePropertyConstructs(game_id: Game):
     enums = _ENUMS_BY_GAME[game_id]
     game_template = GetGameTemplate(game_id)
 
     archetypes = Container()
     default_archetypes = Container()
+    # Constructs don't hold any state, so the ones for an archetype are shared by every property using it
+    archetype_constructs = {}
 
     def get_subcon(prop, atomic=False, default=False):
         if prop.type == "Struct":
@@ -257,8 +407,11 @@ def CreatePropertyConstructs(game_id: Game):
             if not prop.properties:
                 # no changes to defaults or cook preferences
                 add_archetype(prop.archetype, archetype)
-                arch = default_archetypes[prop.archetype] if default else archetypes[prop.archetype]
-                return arch(prop_id)
+                key = (prop.archetype, default, prop_id)
+                if key not in archetype_constructs:
+                    arch = default_archetypes[prop.archetype] if default else archetypes[prop.archetype]
+                    archetype_constructs[key] = arch(prop_id)
+                return archetype_constructs[key]
             else:
                 properties = {p.id: p for p in archetype.properties.copy()}
                 properties.update({p.id: p for p in prop.properties})
@@ -297,16 +450,8 @@ def CreatePropertyConstructs(game_id: Game):
 
         return data
 
-    def get_property_name(prop, names):
-        name = names.get(prop.id) or prop.name
-        occurences = len([n for n in names.values() if n == name])
-        if not name or occurences > 1:
-            name += f"0x{prop.id:X}"
-        return name
-
     def rebuild_count(props, names):
-        fixed_count = len([prop for prop in props if prop.cook_preference == "Always" or prop.cook_preference == "Default"])
-        optionals = [get_property_name(prop, names) for prop in props if prop.cook_preference == "OnlyIfModified"]
+        fixed_count, optionals = PropertyCountFields(props, names)
         def _(context):
             optional_count = len([name for name in optionals if context.get(name) is not None])
             return fixed_count + optional_count
@@ -317,7 +462,7 @@ def CreatePropertyConstructs(game_id: Game):
             prefix = Int16ub if game_id >= Game.ECHOES else Int32ub
             
             property_names = {prop.id: GetPropertyName(game_id, prop.id) for prop in _properties}
-            properties = Container({get_property_name(prop, property_names): get_subcon(prop, atomic, default) for prop in _properties})
+            properties = Container({PropertyFieldName(prop, property_names): get_subcon(prop, atomic, default) for prop in _properties})
             
             id_field = []
             count_field = ["_prop_count" / Rebuild(prefix, rebuild_count(_properties, property_names))] if not atomic else []
@@ -345,17 +490,26 @@ def CreatePropertyConstructs(game_id: Game):
         default_archetypes[name] = property_struct(archetype.properties, archetype.atomic, True)
         archetypes[name] = property_struct(archetype.properties, archetype.atomic, False)
 
-    for arch_name, archetype in game_template.property_archetypes.items():
-        add_archetype(arch_name, archetype)
+    def script_object(default):
+        def create(script_name):
+            obj = game_template.script_objects[script_name]
+            return property_struct(obj.properties, False, default, "_name" / Computed(obj.name))(0xFFFFFFFF)
+        return create
 
-    script_objects = {}
-    script_objects_default = {}
+    def script_object_fields(script_name):
+        properties = game_template.script_objects[script_name].properties
+        names = {prop.id: GetPropertyName(game_id, prop.id) for prop in properties}
+        return {
+            PropertyFieldName(prop, names): PropertyField(prop.id, str(prop.cook_preference), get_subcon(prop))
+            for prop in properties
+        }
 
-    for script_name, obj in game_template.script_objects.items():
-        script_objects[script_name] = property_struct(obj.properties, False, False, "_name" / Computed(obj.name))(0xFFFFFFFF)
-        script_objects_default[script_name] = property_struct(obj.properties, False, True, "_name" / Computed(obj.name))(0xFFFFFFFF)
-
-    PropertyConstructs[game_id] = {"standard": script_objects, "default": script_objects_default}
+    script_names = game_template.script_objects.keys()
+    PropertyConstructs[game_id] = {
+        "standard": LazyPropertyConstructs(script_names, script_object(False)),
+        "default": LazyPropertyConstructs(script_names, script_object(True)),
+        "fields": LazyPropertyConstructs(script_names, script_object_fields),
+    }
 
 
 def GetPropertyConstruct(game: Game, obj_type: str, default: bool = False) -> Subconstruct:
@@ -363,3 +517,20 @@ def GetPropertyConstruct(game: Game, obj_type: str, default: bool = False) -> Su
         CreatePropertyConstructs(game)
 
     return PropertyConstructs[game]["default" if default else "standard"].get(obj_type, GreedyBytes)
+
+
+class PropertyField(NamedTuple):
+    id: int
+    cook_preference: str
+    construct: Subconstruct
+
+
+def GetPropertyFields(game: Game, obj_type: str) -> Dict[str, PropertyField]:
+    """
+    The properties of a script object by field name, in order, with the constructs used by `GetPropertyConstruct`.
+    :raises KeyError: If there's no template for the object type.
+    """
+    if game not in PropertyConstructs:
+        CreatePropertyConstructs(game)
+
+    return PropertyConstructs[game]["fields"][obj_type]
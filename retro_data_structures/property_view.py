@@ -0,0 +1,147 @@
+"""
+Access to single properties of a script instance, without decoding all of them.
+
+Since Echoes, each property of a script object is written with its id and size. `PropertyView` finds where each
+property is once, decodes a property only when it's requested, and when building, only encodes the properties that
+were accessed and splices the ones that changed into the original bytes.
+"""
+import struct
+from typing import Dict, Iterator, Tuple
+
+from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import GetPropertyFields, PropertyField
+
+_OBJECT_HEADER = struct.Struct(">LHH")
+_PROPERTY_HEADER = struct.Struct(">LH")
+
+
+class PropertyView:
+    """
+    The top-level properties of a script instance, decoded when requested.
+    Values are cached, so properties can be edited in place. `build` returns the updated bytes.
+    """
+
+    def __init__(self, data: bytes, target_game: Game, obj_type: str):
+        """
+        :raises ValueError: For games before Echoes, object types without a template, or data that doesn't have
+        the expected layout.
+        """
+        if target_game < Game.ECHOES:
+            raise ValueError(f"{target_game} doesn't have ids for properties")
+        try:
+            self._fields = GetPropertyFields(target_game, obj_type)
+        except KeyError:
+            raise ValueError(f"No template for {obj_type}")
+
+        self.target_game = target_game
+        self._data = bytes(data)
+        self._values = {}
+        self._spans: Dict[int, Tuple[int, int]] = {}
+        self._end = 0
+        self._scan()
+
+    def _scan(self):
+        data = self._data
+        try:
+            object_id, size, count = _OBJECT_HEADER.unpack_from(data, 0)
+            end = 6 + size
+            if object_id != 0xFFFFFFFF or end > len(data):
+                raise ValueError("Not the properties of a script object")
+
+            spans = {}
+            offset = _OBJECT_HEADER.size
+            for _ in range(count):
+                prop_id, prop_size = _PROPERTY_HEADER.unpack_from(data, offset)
+                spans[prop_id] = (offset, offset + _PROPERTY_HEADER.size + prop_size)
+                offset += _PROPERTY_HEADER.size + prop_size
+        except struct.error as e:
+            raise ValueError(f"Truncated properties: {e}")
+
+        if offset > end:
+            raise ValueError("Properties are larger than the object")
+        self._spans = spans
+        self._end = end
+
+    def _raw_property(self, field: PropertyField) -> bytes:
+        span = self._spans.get(field.id)
+        return b"" if span is None else self._data[span[0]:span[1]]
+
+    def __getitem__(self, name: str):
+        if name in self._values:
+            return self._values[name]
+
+        field = self._fields[name]
+        value = field.construct.parse(self._raw_property(field), target_game=self.target_game)
+        self._values[name] = value
+        return value
+
+    def __setitem__(self, name: str, value):
+        if name not in self._fields:
+            raise KeyError(name)
+        self._values[name] = value
+
+    def __contains__(self, name) -> bool:
+        return name in self._fields
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def keys(self):
+        return self._fields.keys()
+
+    @property
+    def decoded(self) -> Tuple[str, ...]:
+        """
+        The properties that were requested or set.
+        """
+        return tuple(self._values)
+
+    def build(self) -> bytes:
+        """
+        The properties with every change applied. Only properties that were requested or set are encoded.
+        """
+        changes = []
+        count_change = 0
+        order = list(self._fields.values())
+        positions = {name: position for position, name in enumerate(self._fields)}
+
+        for name, value in self._values.items():
+            field = self._fields[name]
+            if field.cook_preference == "Never":
+                continue
+
+            encoded = field.construct.build(value, target_game=self.target_game)
+            span = self._spans.get(field.id)
+            if span is not None:
+                if encoded != self._data[span[0]:span[1]]:
+                    changes.append((span, positions[name], encoded))
+                    if not encoded:
+                        count_change -= 1
+                continue
+
+            if encoded:
+                # Properties that were skipped are inserted before the next one that's present
+                position = positions[name]
+                offset = next((self._spans[later.id][0] for later in order[position + 1:] if later.id in self._spans),
+                              self._end)
+                changes.append(((offset, offset), position, encoded))
+                count_change += 1
+
+        if not changes:
+            return self._data
+
+        changes.sort(key=lambda change: (change[0][0], change[1]))
+        result = bytearray()
+        offset = 0
+        for (start, end), _, encoded in changes:
+            result += self._data[offset:start]
+            result += encoded
+            offset = end
+        result += self._data[offset:]
+
+        object_id, size, count = _OBJECT_HEADER.unpack_from(self._data, 0)
+        _OBJECT_HEADER.pack_into(result, 0, object_id, size + len(result) - len(self._data), count + count_change)
+
+        self._data = bytes(result)
+        self._scan()
+        return self._data
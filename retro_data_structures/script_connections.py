@@ -0,0 +1,256 @@
+"""
+Columnar view of the connections between the script instances of an area or a world.
+
+Going through `ScriptInstanceHelper.connections` creates a helper and containers for every instance and connection.
+`ScriptConnections` instead reads the connections straight from the bytes of the script layers into parallel arrays,
+and sorts them by source and by target so the connections of an instance are found with a binary search.
+"""
+import array
+import bisect
+import struct
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+from retro_data_structures.construct_extensions.misc import LazyFieldsContainer
+from retro_data_structures.formats.mlvl import Mlvl
+from retro_data_structures.formats.mrea import Mrea
+from retro_data_structures.game_check import Game
+from retro_data_structures.pak_index import UINT32_TYPECODE, fourcc_to_int, int_to_fourcc
+
+# Magic, unknown, layer index, version and instance count
+_ECHOES_LAYER = struct.Struct(">4sBLBL")
+# Type, size, id and connection count
+_ECHOES_INSTANCE = struct.Struct(">4sHLH")
+# Magic, unknown and layer count, followed by the size of each layer
+_PRIME_HEADER = struct.Struct(">4sLL")
+# Unknown and instance count
+_PRIME_LAYER = struct.Struct(">BL")
+# Type, size, id and connection count
+_PRIME_INSTANCE = struct.Struct(">BLLL")
+# State, message and target
+_CONNECTION_SIZE = 12
+
+
+class ScriptConnection(NamedTuple):
+    area: int
+    layer: int
+    source: int
+    target: int
+    state: Union[str, int]
+    message: Union[str, int]
+
+
+class _Columns:
+    """
+    The connections read so far. Connections are kept as the raw bytes of their (state, message, target) triplets,
+    which are split into columns at the end.
+    """
+
+    def __init__(self):
+        self.areas = array.array("H")
+        self.layers = array.array("H")
+        self.sources = array.array(UINT32_TYPECODE)
+        self.triplets = bytearray()
+
+    def add_raw(self, area: int, layer: int, source: int, data):
+        count = len(data) // _CONNECTION_SIZE
+        self.areas.extend([area] * count)
+        self.layers.extend([layer] * count)
+        self.sources.extend([source] * count)
+        self.triplets += data
+
+    def add(self, area: int, layer: int, source: int, state: int, message: int, target: int):
+        self.areas.append(area)
+        self.layers.append(layer)
+        self.sources.append(source)
+        self.triplets += struct.pack(">LLL", state, message, target)
+
+    def split(self):
+        values = array.array(UINT32_TYPECODE)
+        values.frombytes(self.triplets)
+        if sys.byteorder == "little":
+            values.byteswap()
+        return values[0::3], values[1::3], values[2::3]
+
+
+def _scan_echoes_layer(data, columns: _Columns, area: int, layer: int):
+    magic, _, _, _, count = _ECHOES_LAYER.unpack_from(data, 0)
+    if magic != b"SCLY":
+        raise ValueError(f"Expected a SCLY layer, got {magic}")
+
+    offset = _ECHOES_LAYER.size
+    for _ in range(count):
+        _, size, instance_id, connection_count = _ECHOES_INSTANCE.unpack_from(data, offset)
+        start = offset + _ECHOES_INSTANCE.size
+        end = start + connection_count * _CONNECTION_SIZE
+        if end > offset + 6 + size:
+            raise ValueError(f"Instance 0x{instance_id:08X} has more connections than fit in its size")
+        columns.add_raw(area, layer, instance_id, data[start:end])
+        offset += 6 + size
+
+
+def _scan_prime_layers(data, columns: _Columns, area: int):
+    magic, _, layer_count = _PRIME_HEADER.unpack_from(data, 0)
+    if magic != b"SCLY":
+        raise ValueError(f"Expected a SCLY section, got {magic}")
+
+    sizes = struct.unpack_from(f">{layer_count}L", data, _PRIME_HEADER.size)
+    layer_start = _PRIME_HEADER.size + 4 * layer_count
+    for layer, layer_size in enumerate(sizes):
+        _, count = _PRIME_LAYER.unpack_from(data, layer_start)
+        offset = layer_start + _PRIME_LAYER.size
+        for _ in range(count):
+            _, size, instance_id, connection_count = _PRIME_INSTANCE.unpack_from(data, offset)
+            start = offset + _PRIME_INSTANCE.size
+            end = start + connection_count * _CONNECTION_SIZE
+            if end > offset + 5 + size:
+                raise ValueError(f"Instance 0x{instance_id:08X} has more connections than fit in its size")
+            columns.add_raw(area, layer, instance_id, data[start:end])
+            offset += 5 + size
+        layer_start += layer_size
+
+
+def _add_instances(columns: _Columns, instances, area: int, layer: int, target_game: Game):
+    for instance in instances:
+        source = instance.instance.id.raw
+        for connection in instance.instance.connections:
+            state, message = connection.state, connection.message
+            if target_game >= Game.ECHOES:
+                state, message = fourcc_to_int(state), fourcc_to_int(message)
+            columns.add(area, layer, source, state, message, connection.target)
+
+
+def _add_area(columns: _Columns, mrea: Mrea, area: int):
+    """
+    Reads the script layers that weren't parsed yet from their bytes, and the other ones from their containers,
+    so changes not saved yet are included.
+    """
+    target_game = mrea.target_game
+    for layer, section in enumerate(mrea._raw.sections.script_layers_section):
+        if section["size"] == 0:
+            continue
+
+        lazy = section.get_lazy("data") if isinstance(section, LazyFieldsContainer) else None
+        if lazy is not None and lazy.raw is not None:
+            data = memoryview(lazy.raw)
+            try:
+                if target_game >= Game.ECHOES:
+                    _scan_echoes_layer(data, columns, area, layer)
+                else:
+                    _scan_prime_layers(data, columns, area)
+            except struct.error as e:
+                raise ValueError(f"Truncated script layer {layer} of area {area}: {e}")
+        elif target_game >= Game.ECHOES:
+            _add_instances(columns, section["data"].script_instances, area, layer, target_game)
+        else:
+            for prime_layer, layer_data in enumerate(section["data"].layers):
+                _add_instances(columns, layer_data.objects, area, prime_layer, target_game)
+
+
+class ScriptConnections:
+    """
+    Every connection of an area or a world, as parallel arrays with one entry per connection, in the order they're
+    in the areas. For Echoes onwards, states and messages are FourCCs stored as integers.
+    """
+
+    def __init__(self, target_game: Game, areas: array.array, layers: array.array, sources: array.array,
+                 targets: array.array, states: array.array, messages: array.array):
+        self.target_game = target_game
+        self.areas = areas
+        self.layers = layers
+        self.sources = sources
+        self.targets = targets
+        self.states = states
+        self.messages = messages
+        self._sorted: Dict[str, tuple] = {}
+
+    def __len__(self):
+        return len(self.sources)
+
+    @classmethod
+    def _from_columns(cls, target_game: Game, columns: _Columns) -> "ScriptConnections":
+        states, messages, targets = columns.split()
+        return cls(target_game, columns.areas, columns.layers, columns.sources, targets, states, messages)
+
+    @classmethod
+    def from_mrea(cls, mrea: Mrea, area_index: int = 0) -> "ScriptConnections":
+        """
+        :param area_index: Stored as the area of every connection.
+        """
+        columns = _Columns()
+        _add_area(columns, mrea, area_index)
+        return cls._from_columns(mrea.target_game, columns)
+
+    @classmethod
+    def from_mlvl(cls, mlvl: Mlvl, max_workers: Optional[int] = None) -> "ScriptConnections":
+        """
+        The connections of every area of the world. The areas are read and decompressed by the asset provider's
+        thread pool.
+        :param max_workers: Passed to `AssetProvider.get_assets`.
+        """
+        areas = list(mlvl.areas)
+        mreas = {
+            mrea_id: Mrea(raw, mlvl.target_game, mlvl.asset_provider)
+            for mrea_id, raw in mlvl.asset_provider.get_assets({area.mrea_asset_id for area in areas}, max_workers)
+        }
+
+        columns = _Columns()
+        for area in areas:
+            _add_area(columns, mreas[area.mrea_asset_id], area.index)
+        return cls._from_columns(mlvl.target_game, columns)
+
+    @classmethod
+    def concatenate(cls, target_game: Game, parts: Iterable["ScriptConnections"]) -> "ScriptConnections":
+        result = cls(target_game, array.array("H"), array.array("H"),
+                     *(array.array(UINT32_TYPECODE) for _ in range(4)))
+        for part in parts:
+            for name in ("areas", "layers", "sources", "targets", "states", "messages"):
+                getattr(result, name).extend(getattr(part, name))
+        return result
+
+    def _sorted_by(self, column_name: str):
+        # The rows sorted by the given column, along with the sorted values for searching
+        if column_name not in self._sorted:
+            column = getattr(self, column_name)
+            order = array.array(UINT32_TYPECODE, sorted(range(len(column)), key=column.__getitem__))
+            self._sorted[column_name] = (order, array.array(UINT32_TYPECODE, (column[k] for k in order)))
+        return self._sorted[column_name]
+
+    def _rows(self, column_name: str, value: int) -> List[int]:
+        order, values = self._sorted_by(column_name)
+        start = bisect.bisect_left(values, value)
+        end = bisect.bisect_right(values, value, start)
+        return list(order[start:end])
+
+    def rows_to(self, target_id: int) -> List[int]:
+        """
+        The index of each connection that sends a message to the given instance, in order.
+        """
+        return self._rows("targets", target_id)
+
+    def rows_from(self, source_id: int) -> List[int]:
+        """
+        The index of each connection of the given instance, in order.
+        """
+        return self._rows("sources", source_id)
+
+    def _decode(self, value: int) -> Union[str, int]:
+        return int_to_fourcc(value) if self.target_game >= Game.ECHOES else value
+
+    def connection(self, row: int) -> ScriptConnection:
+        return ScriptConnection(
+            self.areas[row], self.layers[row], self.sources[row], self.targets[row],
+            self._decode(self.states[row]), self._decode(self.messages[row]),
+        )
+
+    def connections_to(self, target_id: int) -> List[ScriptConnection]:
+        return [self.connection(row) for row in self.rows_to(target_id)]
+
+    def connections_from(self, source_id: int) -> List[ScriptConnection]:
+        return [self.connection(row) for row in self.rows_from(source_id)]
+
+    def senders_to(self, target_id: int) -> List[int]:
+        """
+        The ids of the instances that send messages to the given instance, without duplicates.
+        """
+        return list(dict.fromkeys(self.sources[row] for row in self.rows_to(target_id)))
@@ -0,0 +1,376 @@
+"""
+Persistent index of the script instances of every area of a game.
+
+Finding instances across a game means parsing every MREA, so the index keeps the id, type, layer, name, connections
+and a chosen set of property values of each instance in a SQLite database. Each area is stored with a hash of its MREA
+resource, so `ScriptIndex.update` only reads the areas that actually changed.
+"""
+import atexit
+import enum
+import hashlib
+import json
+import logging
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from construct import ConstructError
+
+from retro_data_structures.asset_provider import AssetProvider, InvalidAssetId, UnknownAssetId
+from retro_data_structures.dependency_graph import asset_id_from_db, asset_id_to_db
+from retro_data_structures.formats import AssetId
+from retro_data_structures.formats.mlvl import Mlvl
+from retro_data_structures.formats.mrea import Mrea
+from retro_data_structures.formats.script_layer import instance_name
+from retro_data_structures.formats.script_object import ScriptInstanceHelper
+from retro_data_structures.game_check import Game
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS areas (
+    mrea_id INTEGER PRIMARY KEY,
+    mlvl_id INTEGER NOT NULL,
+    area_index INTEGER NOT NULL,
+    area_name TEXT,
+    data_hash BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS layers (
+    mrea_id INTEGER NOT NULL,
+    layer_index INTEGER NOT NULL,
+    name TEXT,
+    active INTEGER,
+    PRIMARY KEY (mrea_id, layer_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS instances (
+    mrea_id INTEGER NOT NULL,
+    layer_index INTEGER NOT NULL,
+    instance_id INTEGER NOT NULL,
+    type NOT NULL,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS instances_by_area ON instances (mrea_id);
+CREATE INDEX IF NOT EXISTS instances_by_id ON instances (instance_id);
+CREATE INDEX IF NOT EXISTS instances_by_type ON instances (type);
+CREATE INDEX IF NOT EXISTS instances_by_name ON instances (name);
+CREATE TABLE IF NOT EXISTS connections (
+    mrea_id INTEGER NOT NULL,
+    source_id INTEGER NOT NULL,
+    target_id INTEGER NOT NULL,
+    state NOT NULL,
+    message NOT NULL
+);
+CREATE INDEX IF NOT EXISTS connections_by_area ON connections (mrea_id);
+CREATE INDEX IF NOT EXISTS connections_by_source ON connections (source_id);
+CREATE INDEX IF NOT EXISTS connections_by_target ON connections (target_id);
+CREATE TABLE IF NOT EXISTS properties (
+    mrea_id INTEGER NOT NULL,
+    instance_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value
+);
+CREATE INDEX IF NOT EXISTS properties_by_area ON properties (mrea_id);
+CREATE INDEX IF NOT EXISTS properties_by_value ON properties (name, value);
+"""
+
+_TABLES = ("meta", "areas", "layers", "instances", "connections", "properties")
+_AREA_TABLES = ("areas", "instances", "connections", "properties")
+
+
+class IndexedInstance(NamedTuple):
+    mlvl_id: AssetId
+    mrea_id: AssetId
+    area_name: Optional[str]
+    layer_index: int
+    layer_name: Optional[str]
+    instance_id: int
+    type: Union[str, int]
+    name: Optional[str]
+
+
+class IndexedConnection(NamedTuple):
+    mrea_id: AssetId
+    source_id: int
+    target_id: int
+    state: Union[str, int]
+    message: Union[str, int]
+
+
+# Instances, connections and property values of an area, without the area's id
+_AreaRows = Tuple[List[tuple], List[tuple], List[tuple]]
+
+
+def _to_db_value(value):
+    """
+    The value of a property as stored in the database, or None for values that aren't a single number or string.
+    """
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if isinstance(value, int):
+        return asset_id_to_db(int(value))
+    if isinstance(value, (float, str)):
+        return value
+    return None
+
+
+def _property_value(instance: ScriptInstanceHelper, path: str):
+    first, *rest = path.split(".")
+    try:
+        value = instance.get_property(first)
+        for name in rest:
+            value = value[name]
+    except (KeyError, TypeError, AttributeError, ConstructError):
+        # Object types without the property or without a template, or a path into a value that isn't a struct
+        return None
+    return _to_db_value(value)
+
+
+def _area_rows(mrea: Mrea, property_names: Iterable[str]) -> _AreaRows:
+    instances, connections, properties = [], [], []
+    for layer_index, layer in enumerate(mrea.script_layers):
+        for instance in layer.instances:
+            instance_id = instance.id
+            instances.append((layer_index, instance_id, instance.type, instance_name(instance)))
+            connections.extend(
+                (instance_id, connection.target, connection.state, connection.message)
+                for connection in instance.connections
+            )
+            for name in property_names:
+                value = _property_value(instance, name)
+                if value is not None:
+                    properties.append((instance_id, name, value))
+    return instances, connections, properties
+
+
+# The AssetProvider and property names of each worker process of `ScriptIndex.update`
+_worker_asset_provider: Optional[AssetProvider] = None
+_worker_property_names: Tuple[str, ...] = ()
+
+
+def _init_worker(target_game: Game, pak_paths: List[Path], use_mmap: bool, index_cache_dir: Optional[Path],
+                 property_names: Tuple[str, ...]):
+    global _worker_asset_provider, _worker_property_names
+    asset_provider = AssetProvider(target_game, pak_paths, use_mmap=use_mmap, index_cache_dir=index_cache_dir)
+    asset_provider.__enter__()
+    atexit.register(asset_provider.__exit__, None, None, None)
+    _worker_asset_provider = asset_provider
+    _worker_property_names = property_names
+
+
+def _read_area_rows(asset_provider: AssetProvider, mrea_id: AssetId, property_names: Tuple[str, ...],
+                    raw=None) -> Optional[_AreaRows]:
+    try:
+        if raw is None:
+            raw = asset_provider.get_asset(mrea_id)
+        return _area_rows(Mrea(raw, asset_provider.target_game, asset_provider), property_names)
+    except (UnknownAssetId, InvalidAssetId, ConstructError) as e:
+        logger.warning("Unable to index area 0x%08X: %s", mrea_id, e)
+        return None
+
+
+def _worker_area_rows(mrea_id: AssetId) -> Tuple[AssetId, Optional[_AreaRows]]:
+    return mrea_id, _read_area_rows(_worker_asset_provider, mrea_id, _worker_property_names)
+
+
+class ScriptIndex:
+    """
+    The script instances of every area of a game, with their connections and selected property values.
+    Use as a context manager, or call `close` when done.
+    """
+
+    def __init__(self, path: Union[Path, str], target_game: Game, property_names: Iterable[str] = ()):
+        """
+        :param path: The database file. Created if missing, and emptied if it was built for another game or with
+        other property names.
+        :param property_names: Properties to store for each instance that has them, such as "Model" or
+        "EditorProperties.Active". Only values that are a single number, string or enum are stored.
+        """
+        self.target_game = target_game
+        self.property_names = tuple(property_names)
+        self._db = sqlite3.connect(str(path))
+        self._db.executescript(_SCHEMA)
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        expected = {
+            "version": str(_SCHEMA_VERSION),
+            "game": target_game.name,
+            "properties": json.dumps(self.property_names),
+        }
+        if meta != expected:
+            with self._db:
+                for table in _TABLES:
+                    self._db.execute(f"DELETE FROM {table}")
+                self._db.executemany("INSERT INTO meta VALUES (?, ?)", expected.items())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _world_areas(self, asset_provider: AssetProvider) -> Dict[AssetId, tuple]:
+        """
+        The mlvl id, area index, area name and layers of every area of every world.
+        """
+        mlvl_ids = [resource.asset.id for resource in asset_provider.all_resource_headers
+                    if resource.asset.type == "MLVL"]
+
+        areas = {}
+        for mlvl_id in sorted(mlvl_ids):
+            mlvl = Mlvl.from_asset(mlvl_id, self.target_game, asset_provider)
+            for area in mlvl.areas:
+                if not asset_provider.asset_id_exists(area.mrea_asset_id):
+                    logger.warning("Area %d of world 0x%08X uses missing MREA 0x%08X",
+                                   area.index, mlvl_id, area.mrea_asset_id)
+                    continue
+                layers = [(i, name, active) for i, (name, active) in enumerate(zip(area._layer_names, area._flags))]
+                areas[area.mrea_asset_id] = (mlvl_id, area.index, area.name, layers)
+        return areas
+
+    def _index_areas(self, asset_provider: AssetProvider, mrea_ids: List[AssetId],
+                     max_workers: Optional[int]) -> Iterator[Tuple[AssetId, Optional[_AreaRows]]]:
+        if max_workers is not None and max_workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(self.target_game, list(asset_provider.pak_paths), asset_provider.use_mmap,
+                          asset_provider.index_cache_dir, self.property_names),
+            ) as pool:
+                yield from pool.map(_worker_area_rows, mrea_ids)
+            return
+
+        # Reading, decompressing and parsing the MREAs happens in the provider's thread pool
+        done = set()
+        try:
+            for mrea_id, raw in asset_provider.get_assets(mrea_ids):
+                done.add(mrea_id)
+                yield mrea_id, _read_area_rows(asset_provider, mrea_id, self.property_names, raw)
+        except (UnknownAssetId, InvalidAssetId):
+            # The batch stops at the first area that can't be read, so the remaining ones are read one at a time
+            for mrea_id in mrea_ids:
+                if mrea_id not in done:
+                    yield mrea_id, _read_area_rows(asset_provider, mrea_id, self.property_names)
+
+    def update(self, asset_provider: AssetProvider, max_workers: Optional[int] = None) -> int:
+        """
+        Brings the index in sync with the worlds of the given provider, which must be open.
+        Every MREA is hashed, but only the ones that changed are parsed.
+        :param max_workers: When greater than 1, the areas are parsed by that many processes, each one with its own
+        AssetProvider for the same paks.
+        :return: How many areas were indexed.
+        """
+        areas = self._world_areas(asset_provider)
+        stored_hashes = {
+            asset_id_from_db(mrea_id): data_hash
+            for mrea_id, data_hash in self._db.execute("SELECT mrea_id, data_hash FROM areas")
+        }
+
+        hashes = {}
+        to_index = []
+        for mrea_id in areas:
+            hashes[mrea_id] = hashlib.sha1(asset_provider.get_raw_asset(mrea_id)).digest()
+            if stored_hashes.get(mrea_id) != hashes[mrea_id]:
+                to_index.append(mrea_id)
+
+        removed = [asset_id_to_db(mrea_id) for mrea_id in stored_hashes.keys() - areas.keys()]
+        indexed = {}
+        for mrea_id, rows in self._index_areas(asset_provider, to_index, max_workers):
+            if rows is not None:
+                indexed[mrea_id] = rows
+
+        with self._db:
+            for mrea_id in removed + [asset_id_to_db(mrea_id) for mrea_id in indexed]:
+                for table in _AREA_TABLES:
+                    self._db.execute(f"DELETE FROM {table} WHERE mrea_id = ?", (mrea_id,))
+
+            for mrea_id, (instances, connections, properties) in indexed.items():
+                db_id = asset_id_to_db(mrea_id)
+                self._db.execute("INSERT INTO areas VALUES (?, ?, ?, ?, ?)",
+                                 (db_id, asset_id_to_db(areas[mrea_id][0]), areas[mrea_id][1], areas[mrea_id][2],
+                                  hashes[mrea_id]))
+                self._db.executemany("INSERT INTO instances VALUES (?, ?, ?, ?, ?)",
+                                     ((db_id, *row) for row in instances))
+                self._db.executemany("INSERT INTO connections VALUES (?, ?, ?, ?, ?)",
+                                     ((db_id, *row) for row in connections))
+                self._db.executemany("INSERT INTO properties VALUES (?, ?, ?, ?)",
+                                     ((db_id, *row) for row in properties))
+
+            # Names and layers come from the worlds, so they're updated even for areas that didn't change
+            self._db.executemany("UPDATE areas SET mlvl_id = ?, area_index = ?, area_name = ? WHERE mrea_id = ?",
+                                 ((asset_id_to_db(mlvl_id), area_index, area_name, asset_id_to_db(mrea_id))
+                                  for mrea_id, (mlvl_id, area_index, area_name, _) in areas.items()))
+            self._db.execute("DELETE FROM layers")
+            self._db.executemany("INSERT INTO layers VALUES (?, ?, ?, ?)",
+                                 ((asset_id_to_db(mrea_id), *layer)
+                                  for mrea_id, (_, _, _, layers) in areas.items() for layer in layers))
+
+        return len(indexed)
+
+    def find_instances(self, instance_type: Union[str, int, None] = None, name: Optional[str] = None,
+                       properties: Optional[Dict[str, Any]] = None,
+                       mrea_id: Optional[AssetId] = None) -> List[IndexedInstance]:
+        """
+        The instances that match all of the given filters.
+        :param properties: Values the instance's properties must have. Each property must be one of the index's
+        `property_names`.
+        """
+        conditions, args = [], []
+        if instance_type is not None:
+            conditions.append("i.type = ?")
+            args.append(instance_type)
+        if name is not None:
+            conditions.append("i.name = ?")
+            args.append(name)
+        if mrea_id is not None:
+            conditions.append("i.mrea_id = ?")
+            args.append(asset_id_to_db(mrea_id))
+        for property_name, value in (properties or {}).items():
+            if property_name not in self.property_names:
+                raise ValueError(f"{property_name} is not stored in this index")
+            conditions.append("EXISTS (SELECT 1 FROM properties p WHERE p.mrea_id = i.mrea_id "
+                              "AND p.instance_id = i.instance_id AND p.name = ? AND p.value = ?)")
+            args.extend((property_name, _to_db_value(value)))
+
+        query = (
+            "SELECT a.mlvl_id, i.mrea_id, a.area_name, i.layer_index, l.name, i.instance_id, i.type, i.name "
+            "FROM instances i JOIN areas a ON a.mrea_id = i.mrea_id "
+            "LEFT JOIN layers l ON l.mrea_id = i.mrea_id AND l.layer_index = i.layer_index"
+        )
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY a.mlvl_id, a.area_index, i.layer_index, i.rowid"
+
+        return [
+            IndexedInstance(asset_id_from_db(mlvl_id), asset_id_from_db(area_id), *rest)
+            for mlvl_id, area_id, *rest in self._db.execute(query, args)
+        ]
+
+    def _connections(self, column: str, instance_id: int, mrea_id: Optional[AssetId]) -> List[IndexedConnection]:
+        query = f"SELECT mrea_id, source_id, target_id, state, message FROM connections WHERE {column} = ?"
+        args = [instance_id]
+        if mrea_id is not None:
+            query += " AND mrea_id = ?"
+            args.append(asset_id_to_db(mrea_id))
+
+        return [
+            IndexedConnection(asset_id_from_db(area_id), *rest)
+            for area_id, *rest in self._db.execute(query + " ORDER BY rowid", args)
+        ]
+
+    def connections_from(self, instance_id: int, mrea_id: Optional[AssetId] = None) -> List[IndexedConnection]:
+        """
+        The connections the given instance sends messages through.
+        """
+        return self._connections("source_id", instance_id, mrea_id)
+
+    def connections_to(self, instance_id: int, mrea_id: Optional[AssetId] = None) -> List[IndexedConnection]:
+        """
+        The connections that send messages to the given instance.
+        """
+        return self._connections("target_id", instance_id, mrea_id)
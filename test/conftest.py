@@ -1,8 +1,12 @@
 import os
 from pathlib import Path
+from typing import Dict, Optional
 
 import pytest
 
+from retro_data_structures.game_check import Game
+from test.test_lib import template_property, template_struct
+
 
 def get_env_or_skip(env_name):
     if env_name not in os.environ:
@@ -38,3 +42,69 @@ def prime2_paks_path():
 @pytest.fixture()
 def prime3_paks_path():
     return Path(get_env_or_skip("PRIME3_PAKS"))
+
+
+@pytest.fixture(autouse=True)
+def _template_cache_dir(tmp_path_factory, monkeypatch):
+    # Keeps the tests from writing template caches to the user's cache directory
+    try:
+        from retro_data_structures import property_template
+    except ImportError:
+        # Without the generated enums
+        return
+    monkeypatch.setattr(property_template, "_template_cache_dir", tmp_path_factory.mktemp("template_cache"))
+
+
+@pytest.fixture()
+def property_templates(tmp_path, monkeypatch):
+    """
+    Returns a function that replaces the property templates of the given games, and optionally the property names,
+    with the given ones. Returns the directory with the templates.
+    Every call also clears everything created from the previous templates.
+    """
+    from retro_data_structures import property_codegen, property_template
+
+    path = tmp_path.joinpath("properties")
+    path.mkdir()
+    monkeypatch.setattr(property_template, "_PROPERTIES_PATH", path)
+
+    def replace(templates: Dict[Game, dict], property_names: Optional[Dict[int, str]] = None) -> Path:
+        for game, template in templates.items():
+            property_template._game_template_path(game).write_bytes(property_template.GameTemplate.build(template))
+        property_template._property_names_path().write_bytes(
+            property_template.PropertyNames.build(property_names or {}),
+        )
+
+        monkeypatch.setattr(property_template, "_game_template_cache", {})
+        monkeypatch.setattr(property_template, "_property_names_cache", {})
+        monkeypatch.setattr(property_template, "PropertyConstructs", {})
+        monkeypatch.setattr(property_codegen, "_codecs", {})
+        return path
+
+    return replace
+
+
+@pytest.fixture()
+def echoes_script_template(property_templates):
+    """
+    Replaces the Echoes property template with one that only has an Actor, with a name, a health and a scale.
+    """
+    template = {
+        "script_objects": {
+            "ACTR": template_struct(
+                "Actor",
+                template_property("Struct", "EditorProperties", 0x255, archetype="EditorProperties"),
+                template_property("Float", "Health", 0x10, default=5.0),
+                template_property("Vector", "Scale", 0x20, default={"X": 1.0, "Y": 1.0, "Z": 1.0}),
+            ),
+        },
+        "property_archetypes": {
+            "EditorProperties": template_struct(
+                "EditorProperties",
+                template_property("String", "Name", 0x1, default=""),
+                template_property("Bool", "Active", 0x2, default=True),
+            ),
+        },
+    }
+    property_templates({Game.ECHOES: template})
+    return template
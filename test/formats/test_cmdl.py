@@ -1,6 +1,7 @@
 import construct
 
-from retro_data_structures.formats.cmdl import CMDL
+from retro_data_structures.formats import cmdl
+from retro_data_structures.formats.cmdl import CMDL, LazyCMDL
 from retro_data_structures.common_types import AABox
 from retro_data_structures.construct_extensions.json import convert_to_raw_python
 from retro_data_structures.game_check import Game
@@ -36,3 +37,89 @@ def test_compare(prime2_pwe_project):
 
     assert custom_header == raw_header
     assert [int.from_bytes(c, "big") for c in chunks(encoded, 4)] == [int.from_bytes(c, "big") for c in chunks(raw, 4)]
+
+
+def _vertex(position):
+    return {
+        "matrix": {"position": None, "tex": {str(i): None for i in range(7)}},
+        "position": position,
+        "normal": None,
+        "color_0": None,
+        "color_1": None,
+        "tex": {str(i): None for i in range(8)},
+    }
+
+
+def _model(game: Game) -> bytes:
+    material = {
+        "flags": 0,
+        "texture_indices": [0],
+        "vertex_attribute_flags": 0x3,
+        "unk_1": 0,
+        "unk_2": 0,
+        "group_index": 0,
+        "konst_colors": None,
+        "blend_destination_factor": 0,
+        "blend_source_factor": 1,
+        "reflection_indirect_texture_slot_index": None,
+        "color_channel_flags": [0],
+        "tev_stages": [],
+        "tev_inputs": [],
+        "texgen_flags": [],
+        "material_animations_section_size": 4,
+        "uv_animations": [],
+    }
+    surface = {
+        "header": {
+            "center_point": [0.0, 0.0, 0.0],
+            "material_index": 0,
+            "mantissa": 0x8000,
+            "parent_model_pointer_storage": 0,
+            "next_surface_pointer_storage": 0,
+            "extra_data": b"",
+            "surface_normal": [0.0, 0.0, 1.0],
+            "unk_1": 0,
+            "unk_2": 0,
+        },
+        "primitives": [{"type": 0x90, "vertices": [_vertex(i) for i in range(3)]}],
+    }
+    return CMDL.build({
+        "version": 4,
+        "flags": 0,
+        "aabox": {"min": [0.0, 0.0, 0.0], "max": [1.0, 1.0, 1.0]},
+        "material_sets": [{"texture_file_ids": [0x1234, 0x5678], "materials": [material]}],
+        "attrib_arrays": {
+            "positions": [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]],
+            "normals": [],
+            "colors": [],
+            "uvs": [],
+            "lightmap_uvs": None,
+        },
+        "surfaces": [surface, surface],
+    }, target_game=game)
+
+
+def test_lazy_cmdl():
+    game = Game.ECHOES
+    raw = _model(game)
+
+    full = CMDL.parse(raw, target_game=game)
+    lazy = LazyCMDL.parse(raw, target_game=game)
+
+    assert list(lazy.material_sets[0].texture_file_ids) == [0x1234, 0x5678]
+    assert not lazy.is_loaded("surfaces")
+    assert not lazy.is_loaded("attrib_arrays")
+
+    assert lazy.surfaces == full.surfaces
+    assert lazy.is_loaded("surfaces")
+    assert lazy.attrib_arrays == full.attrib_arrays
+    assert LazyCMDL.build(LazyCMDL.parse(raw, target_game=game), target_game=game) == raw
+
+
+def test_dependencies_from_bytes():
+    game = Game.ECHOES
+    raw = _model(game)
+
+    expected = list(cmdl.dependencies_for(CMDL.parse(raw, target_game=game), game))
+    assert expected == [("TXTR", 0x1234), ("TXTR", 0x5678)]
+    assert list(cmdl.dependencies_from_bytes(raw, game)) == expected
@@ -1,8 +1,13 @@
+import hashlib
+import zlib
 from pathlib import Path
 
 import pytest
+from construct import Container, ListContainer
 
-from retro_data_structures.formats.mrea import MREA
+from retro_data_structures import compression
+from retro_data_structures.formats import mrea
+from retro_data_structures.formats.mrea import MREA, _all_categories
 from retro_data_structures.game_check import Game
 from test.test_lib import parse_and_build_compare, parse_and_build_compare_parsed
 
@@ -31,3 +36,82 @@ def test_compare_p1_parsed(p1_mrea_path):
 
 def test_compare_p2(p2_mrea_path):
     parse_and_build_compare_parsed(MREA, Game.ECHOES, p2_mrea_path)
+
+
+def _section(section_id, data):
+    return Container(data=data, size=len(data), id=section_id, hash=hashlib.sha256(data).hexdigest())
+
+
+_PATH_ID = 0x12345678
+
+
+def _synthetic_mrea() -> bytes:
+    # Only the geometry, which is kept as raw bytes, and the path have data. The other categories are empty sections.
+    sections = Container(geometry_section=ListContainer([
+        _section(0, bytes(range(256)) * 0x80),
+        _section(1, b"\x01" * 0x100),
+    ]))
+    for label in _all_categories[1:]:
+        if label == "path_section":
+            sections[label] = ListContainer([Container(data=_PATH_ID, size=32, id=len(sections) + 1)])
+        elif label != "area_octree_section":
+            sections[label] = ListContainer([_section(len(sections) + 1, b"")])
+
+    return MREA.build(Container(
+        header=Container(version="Echoes", area_transform=[1.0, 0, 0, 0, 0, 1.0, 0, 0, 0, 0, 1.0, 0],
+                         world_model_count=0),
+        data_section_sizes=Container(value=[0] * (len(sections) + 1)),
+        sections=sections,
+    ), target_game=Game.ECHOES)
+
+
+def test_untouched_blocks_are_not_recompressed(monkeypatch):
+    raw = _synthetic_mrea()
+    compressed_groups = []
+
+    def compress_lzo_blocks(groups):
+        compressed_groups.extend(groups)
+        return compression.compress_lzo_blocks(groups)
+
+    monkeypatch.setattr(mrea, "compress_lzo_blocks", compress_lzo_blocks)
+
+    assert MREA.build(MREA.parse(raw, target_game=Game.ECHOES), target_game=Game.ECHOES) == raw
+    assert compressed_groups == []
+
+    decoded = MREA.parse(raw, target_game=Game.ECHOES)
+    decoded.sections.geometry_section[1].data = b"\x02" * 0x100
+    modified = MREA.build(decoded, target_game=Game.ECHOES)
+
+    assert compressed_groups == [bytes(range(256)) * 0x80 + b"\x02" * 0x100]
+    assert MREA.parse(modified, target_game=Game.ECHOES).sections.geometry_section[1].data == b"\x02" * 0x100
+
+
+@pytest.mark.parametrize("section_hash", ["sha256", "crc32"])
+def test_section_hash(section_hash):
+    raw = _synthetic_mrea()
+    decoded = MREA.parse(raw, target_game=Game.ECHOES, section_hash=section_hash)
+    section = decoded.sections.geometry_section[1]
+    data = b"\x01" * 0x100
+
+    assert not section.is_loaded("hash")
+    if section_hash == "crc32":
+        assert section.hash == f"{zlib.crc32(data):08x}"
+    else:
+        assert section.hash == hashlib.sha256(data).hexdigest()
+
+    assert MREA.build(decoded, target_game=Game.ECHOES) == raw
+
+
+def test_categories_are_decoded_lazily():
+    raw = _synthetic_mrea()
+
+    decoded = MREA.parse(raw, target_game=Game.ECHOES)
+    path_section = decoded.sections.path_section[0]
+    assert not path_section.is_loaded("data")
+    assert MREA.build(decoded, target_game=Game.ECHOES) == raw
+
+    decoded = MREA.parse(raw, target_game=Game.ECHOES)
+    path_section = decoded.sections.path_section[0]
+    assert path_section.data == _PATH_ID
+    assert path_section.is_loaded("data")
+    assert MREA.build(decoded, target_game=Game.ECHOES) == raw
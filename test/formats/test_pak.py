@@ -1,7 +1,16 @@
+import io
+
 import pytest
 
 from retro_data_structures.construct_extensions.json import convert_to_raw_python
-from retro_data_structures.formats.pak import PAK, CompressedPakResource, PAKNoData
+from retro_data_structures.formats.pak import (
+    PAK,
+    CompressedPakResource,
+    PAKNoData,
+    compress_pak_resource,
+    decompress_pak_resource,
+    write_pak,
+)
 from retro_data_structures.game_check import Game
 
 
@@ -500,3 +509,44 @@ def test_compare_from_build():
         resource["contents"] = {"value": resource["contents"]["value"]}
 
     assert decoded == source
+
+
+@pytest.mark.parametrize("game", [Game.PRIME, Game.ECHOES])
+def test_decompress_pak_resource(game):
+    raw = bytes(range(256)) * 200
+    encoded = CompressedPakResource.build(raw, target_game=game) + b"\xFF" * 20
+
+    assert decompress_pak_resource(encoded, game) == raw
+    assert decompress_pak_resource(memoryview(encoded), game) == raw
+
+
+@pytest.mark.parametrize("game", [Game.PRIME, Game.ECHOES])
+def test_write_pak_matches_build(game):
+    contents = [
+        (("TXTR", 0x10), "TXTR_Name", bytes(range(256)) * 300, True),
+        (("STRG", 0x20), None, b"abc" * 7, False),
+        (("TXTR", 0x30), "Other", b"\x01" * 33, True),
+    ]
+    called = []
+
+    def lazy(data, asset_id):
+        def get():
+            called.append(asset_id)
+            return data
+        return get
+
+    stream = io.BytesIO()
+    resources = write_pak(stream, [(tag, name, lazy(data, tag[1]), compressed)
+                                   for tag, name, data, compressed in contents], game)
+
+    expected = PAK.build({
+        "named_resources": [{"asset": {"type": t, "id": i}, "name": name}
+                            for (t, i), name, _, _ in contents if name is not None],
+        "resources": [{"asset": {"type": t, "id": i}, "compressed": int(compressed), "contents": {"value": data}}
+                      for (t, i), _, data, compressed in contents],
+    }, target_game=game)
+
+    assert called == [0x10, 0x20, 0x30]
+    assert stream.getvalue() == expected
+    assert resources == PAKNoData.parse(expected, target_game=game).resources
+    assert compress_pak_resource(contents[0][2], game) == CompressedPakResource.build(contents[0][2], target_game=game)
@@ -0,0 +1,165 @@
+from construct import Container, ListContainer
+
+import pytest
+
+from retro_data_structures.formats.mlvl import AreaHelper
+from retro_data_structures.formats.mrea import Mrea
+from retro_data_structures.formats.script_layer import InstanceIdAllocator, ScriptLayerHelper
+from retro_data_structures.formats.script_object import ScriptInstance, ScriptInstanceHelper
+from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import GetPropertyConstruct
+
+
+def _instance(instance_id: int, name: str) -> Container:
+    game = Game.ECHOES
+    properties = GetPropertyConstruct(game, "ACTR", True).build({"EditorProperties": {"Name": name}},
+                                                                target_game=game)
+    return ScriptInstance.parse(ScriptInstance.build({
+        "type": "ACTR",
+        "instance": {"id": {"raw": instance_id}, "connections": [], "base_property": properties},
+    }, target_game=game), target_game=game)
+
+
+def _layer(*instances) -> Container:
+    return Container(magic="SCLY", unknown=0, layer_index=0, version=1,
+                     script_instances=ListContainer(_instance(i, name) for i, name in instances))
+
+
+def _count_parses(monkeypatch) -> list:
+    parsed = []
+    original = ScriptInstanceHelper._get_raw_properties
+
+    def get_raw_properties(self):
+        parsed.append(self.id)
+        return original(self)
+
+    monkeypatch.setattr(ScriptInstanceHelper, "_get_raw_properties", get_raw_properties)
+    return parsed
+
+
+def test_layer_lookups(echoes_script_template, monkeypatch):
+    parsed = _count_parses(monkeypatch)
+    layer = ScriptLayerHelper(_layer((1, "A"), (2, "B"), (3, "B")), Game.ECHOES, None)
+
+    assert layer.get_instance(2).id == 2
+    assert layer.get_instance(4) is None
+    assert parsed == []
+
+    assert layer.get_instance_by_name("B").id == 2
+    assert layer.get_instance_by_name("C") is None
+    assert layer.get_instance_by_name("A") is layer.get_instance(1)
+    # Names are read without decoding all properties
+    assert parsed == []
+
+    # Shared with the helpers of the same layer
+    assert ScriptLayerHelper.with_parent(layer, None, 0).get_instance(3) is layer.get_instance(3)
+    assert list(layer.instances) == [layer.get_instance(1), layer.get_instance(2), layer.get_instance(3)]
+
+
+def test_instances_without_template(echoes_script_template):
+    game = Game.ECHOES
+    unknown = ScriptInstance.parse(ScriptInstance.build({
+        "type": "ZZZZ",
+        "instance": {"id": {"raw": 4}, "connections": [], "base_property": b"\x01\x02\x03"},
+    }, target_game=game), target_game=game)
+    layer_data = _layer((1, "A"))
+    layer_data.script_instances.insert(0, unknown)
+    layer = ScriptLayerHelper(layer_data, game, None)
+
+    instance = layer.get_instance(4)
+    with pytest.raises(KeyError):
+        instance.get_property("EditorProperties")
+    with pytest.raises(KeyError):
+        instance.set_property("EditorProperties", {})
+    assert layer.get_instance_by_name("A").id == 1
+    assert layer.get_instance_by_name("B") is None
+
+
+def test_layer_updates(echoes_script_template):
+    layer = ScriptLayerHelper(_layer((1, "A"), (2, "B"), (3, "B")), Game.ECHOES, None)
+    assert layer.get_instance_by_name("B").id == 2
+
+    layer.get_instance(2).name = "Renamed"
+    assert layer.get_instance_by_name("B").id == 3
+    assert layer.get_instance_by_name("Renamed").id == 2
+
+    layer.get_instance(1).properties.EditorProperties.Name = "Edited"
+    assert layer.get_instance_by_name("A") is None
+    assert layer.get_instance_by_name("Edited").id == 1
+
+    layer.remove_instance(2)
+    assert layer.get_instance(2) is None
+    assert layer.get_instance_by_name("Renamed") is None
+    assert [instance.instance.id.raw for instance in layer._raw.script_instances] == [1, 3]
+
+    # Changes made directly to the raw layer are noticed
+    layer._raw.script_instances.append(_instance(4, "D"))
+    assert layer.get_instance_by_name("D").id == 4
+    layer.remove_instances()
+    assert layer.get_instance(1) is None
+
+
+def _mrea(*layers) -> Mrea:
+    return Mrea(Container(sections=Container(script_layers_section=ListContainer(
+        Container(data=layer) for layer in layers
+    ))), Game.ECHOES, None)
+
+
+def test_area_lookups(echoes_script_template):
+    area = _mrea(_layer((1, "A"), (2, "B")), _layer((0x04000003, "C"), (2, "Duplicate")))
+
+    assert area.get_instance(0x04000003).name == "C"
+    assert area.get_instance(2).name == "B"
+    assert area.get_instance_by_name("Duplicate").id == 2
+    assert area.get_instance(5) is None
+
+    first, second = area.script_layers
+    assert list(area.script_layers) == [first, second]
+
+    first.remove_instance(2)
+    assert area.get_instance(2).name == "Duplicate"
+    second.remove_instance(0x04000003)
+    assert area.get_instance(0x04000003) is None
+
+
+def test_instance_id_allocator():
+    allocator = InstanceIdAllocator([0, 1, 3, 3])
+    assert allocator.lowest_free() == 2
+    assert allocator.allocate() == 2
+    assert allocator.allocate() == 4
+
+    allocator.release(1)
+    allocator.release(3)
+    assert allocator.lowest_free() == 1
+    allocator.reserve(1)
+    assert allocator.lowest_free() == 5
+
+    # 3 was used twice
+    allocator.release(3)
+    assert allocator.allocate() == 3
+
+    with pytest.raises(ValueError):
+        InstanceIdAllocator(range(0x10000)).lowest_free()
+
+
+def test_add_instances(echoes_script_template):
+    area = AreaHelper(Container(), Game.ECHOES, None, ListContainer([True, True]), ListContainer(["A", "B"]), 5)
+    area._mrea = _mrea(_layer((0x00050000, "A"), (0x00050001, "B")), _layer((0x04050005, "C")))
+    first, second = area.layers
+    assert area.next_instance_id == 2
+    allocator = area.mrea.instance_id_allocator
+
+    added = [(first if i % 2 else second).add_instance("ACTR", f"New {i}") for i in range(6)]
+    assert [instance.id_struct.instance for instance in added] == [2, 3, 4, 6, 7, 8]
+    assert added[0].id == 0x04050002
+    assert added[1].id == 0x00050003
+    assert added[0].name == "New 0"
+    assert area.mrea.instance_id_allocator is allocator
+
+    assert area.mrea.get_instance(0x04050002) is added[0]
+    assert second.get_instance_by_name("New 4") is added[4]
+
+    second.remove_instance(0x04050005)
+    assert area.next_instance_id == 5
+    assert area.mrea.get_instance(0x04050005) is None
+    assert area.mrea.instance_id_allocator is allocator
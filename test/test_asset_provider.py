@@ -0,0 +1,407 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from retro_data_structures.asset_provider import AssetCache, AssetProvider, InvalidAssetId, UnknownAssetId
+from retro_data_structures.formats.dgrp import DGRP
+from retro_data_structures.formats.pak import PAK, PAKNoData, decompress_pak_resource, write_pak
+from retro_data_structures.game_check import Game
+from retro_data_structures.pak_index import PakIndex
+
+_GAME = Game.ECHOES
+
+
+def _dgrp(*asset_ids):
+    return DGRP.build([{"asset_type": "TXTR", "asset_id": asset_id} for asset_id in asset_ids], target_game=_GAME)
+
+
+@pytest.fixture(name="pak_path")
+def _pak_path(tmp_path):
+    resources = [
+        (0x1000, 1, _dgrp(0x2000, 0x2001)),
+        (0x1001, 0, _dgrp(0x2002)),
+        (0x1002, 1, _dgrp(*range(0x3000, 0x3400))),
+        (0x1003, 0, _dgrp()),
+    ]
+    path = tmp_path.joinpath("Test.pak")
+    path.write_bytes(PAK.build({
+        "named_resources": [
+            {"asset": {"type": "DGRP", "id": 0x1000}, "name": "First"},
+        ],
+        "resources": [
+            {
+                "asset": {"type": "DGRP", "id": asset_id},
+                "compressed": compressed,
+                "contents": {"value": data},
+            }
+            for asset_id, compressed, data in resources
+        ],
+    }, target_game=_GAME))
+    return path
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_get_asset(pak_path, use_mmap):
+    with AssetProvider(_GAME, [pak_path], use_mmap=use_mmap) as provider:
+        first = provider.get_asset(0x1000)
+        big = provider.get_asset(0x1002)
+        empty = provider.get_asset(0x1003)
+
+        with pytest.raises(UnknownAssetId):
+            provider.get_asset(0x9999)
+
+    assert [dep.asset_id for dep in first] == [0x2000, 0x2001]
+    assert [dep.asset_id for dep in big] == list(range(0x3000, 0x3400))
+    assert list(empty) == []
+
+
+def test_mmap_matches_file_reads(pak_path):
+    with AssetProvider(_GAME, [pak_path]) as provider:
+        expected = {resource.asset.id: bytes(provider._get_asset_data(resource.asset.id))
+                    for resource in provider.all_resource_headers}
+
+    with AssetProvider(_GAME, [pak_path], use_mmap=True) as provider:
+        uncompressed = provider._get_asset_data(0x1001)
+        assert isinstance(uncompressed, memoryview)
+
+        result = {resource.asset.id: bytes(provider._get_asset_data(resource.asset.id))
+                  for resource in provider.all_resource_headers}
+        del uncompressed
+
+    assert result == expected
+
+
+def test_index_cache(pak_path, tmp_path):
+    cache_dir = tmp_path.joinpath("cache")
+
+    with AssetProvider(_GAME, [pak_path]) as provider:
+        expected = list(provider.all_resource_headers)
+
+    with AssetProvider(_GAME, [pak_path], index_cache_dir=cache_dir) as provider:
+        assert list(provider.all_resource_headers) == expected
+
+    cache_files = list(cache_dir.iterdir())
+    assert len(cache_files) == 1
+    index = PakIndex.from_bytes(cache_files[0].read_bytes())
+    assert index.resources == expected
+
+    # Warm start uses the stored index
+    with AssetProvider(_GAME, [pak_path], index_cache_dir=cache_dir) as provider:
+        assert provider._paks[0].pak_mtime == index.pak_mtime
+        assert [dep.asset_id for dep in provider.get_asset(0x1000)] == [0x2000, 0x2001]
+
+    # A changed pak is parsed again
+    pak_path.write_bytes(pak_path.read_bytes() + b"\x00" * 32)
+    with AssetProvider(_GAME, [pak_path], index_cache_dir=cache_dir) as provider:
+        assert provider._paks[0].pak_size == pak_path.stat().st_size
+        assert list(provider.all_resource_headers) == expected
+
+
+def test_asset_cache_eviction():
+    cache = AssetCache(max_entries=2, max_bytes=100)
+
+    cache.put(1, "one", 10)
+    cache.put(2, "two", 10)
+    assert cache.get(1) == "one"
+    cache.put(3, "three", 10)
+
+    # 2 was the least recently used
+    assert 2 not in cache
+    assert cache.get(2) is None
+    assert cache.get(3) == "three"
+
+    cache.put(4, "big", 95)
+    assert list(cache._entries) == [4]
+    assert cache.total_bytes == 95
+
+    cache.put(5, "world", 1000, "MLVL")
+    cache.put(6, "six", 10)
+    assert cache.get(5) == "world"
+    assert cache.stats == {
+        "entries": 1,
+        "pinned": 1,
+        "bytes": 10,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 4,
+    }
+
+
+def test_bounded_asset_cache(pak_path):
+    cache = AssetCache(max_entries=1)
+    with AssetProvider(_GAME, [pak_path], asset_cache=cache) as provider:
+        first = provider.get_asset(0x1000)
+        assert provider.get_asset(0x1000) is first
+        provider.get_asset(0x1001)
+        assert provider.get_asset(0x1000) is not first
+
+    assert cache.hits == 1
+    assert cache.misses == 3
+    assert cache.evictions == 2
+
+
+@pytest.mark.parametrize("mode", ["pread", "mmap", "stream"])
+def test_concurrent_get_asset(pak_path, mode):
+    kwargs = {}
+    if mode == "mmap":
+        kwargs["use_mmap"] = True
+    elif mode == "stream":
+        kwargs["pak_files"] = [io.BytesIO(pak_path.read_bytes())]
+
+    asset_ids = [0x1000, 0x1001, 0x1002, 0x1003] * 5
+    with AssetProvider(_GAME, [pak_path], asset_cache=AssetCache(max_entries=1), **kwargs) as provider:
+        expected = {asset_id: provider.get_asset(asset_id) for asset_id in set(asset_ids)}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(provider.get_asset, asset_ids))
+
+    assert results == [expected[asset_id] for asset_id in asset_ids]
+
+
+def test_reentrant_provider(pak_path):
+    provider = AssetProvider(_GAME, [pak_path])
+    with provider:
+        paks = provider._paks
+        with provider as inner:
+            assert inner._paks is paks
+            inner.get_asset(0x1000)
+        # still open after the inner block
+        provider.get_asset(0x1001)
+
+    assert provider._pak_files is None
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_get_assets(pak_path, use_mmap):
+    asset_ids = [0x1003, 0x1000, 0x1002, 0x1001, 0x1000]
+
+    with AssetProvider(_GAME, [pak_path], use_mmap=use_mmap) as provider:
+        expected = {asset_id: bytes(provider._get_asset_data(asset_id)) for asset_id in asset_ids}
+        cached = provider.get_asset(0x1001)
+
+        assets = dict(provider.get_assets(asset_ids, max_workers=2))
+        raw = dict(provider.get_assets_bytes(asset_ids, max_workers=2))
+
+        with pytest.raises(UnknownAssetId):
+            list(provider.get_assets([0x1000, 0x9999]))
+
+    assert assets.keys() == set(asset_ids)
+    assert assets[0x1001] is cached
+    assert [dep.asset_id for dep in assets[0x1000]] == [0x2000, 0x2001]
+    assert raw == expected
+
+
+def test_batched_reads_are_coalesced(pak_path):
+    with AssetProvider(_GAME, [pak_path]) as provider:
+        reads = []
+        original = provider._read_range
+
+        def read_range(pak_id, offset, size):
+            reads.append((offset, size))
+            return original(pak_id, offset, size)
+
+        provider._read_range = read_range
+        order = [asset_id for asset_id, _, _, _ in provider._batched_reads([0x1003, 0x1001, 0x1000])]
+
+    assert len(reads) == 1
+    assert order == [0x1000, 0x1001, 0x1003]
+
+
+def test_raw_and_decompressed_bytes(pak_path):
+    with AssetProvider(_GAME, [pak_path], use_mmap=True) as provider:
+        compressed = provider.get_raw_asset(0x1000)
+        decompressed = provider.get_decompressed_bytes(0x1000)
+        uncompressed = provider.get_raw_asset(0x1001)
+
+        assert provider.get_decompressed_bytes(0x1000) is decompressed
+        assert provider.bytes_cache.stats["hits"] == 1
+        assert 0x1000 not in provider.loaded_assets
+
+    assert isinstance(decompressed, bytes)
+    assert decompress_pak_resource(compressed, _GAME) == decompressed
+    assert DGRP.parse(decompressed, target_game=_GAME)[1].asset_id == 0x2001
+    assert DGRP.parse(uncompressed, target_game=_GAME)[0].asset_id == 0x2002
+
+
+def test_decompressed_bytes_of_unknown_format(tmp_path):
+    path = tmp_path.joinpath("Unknown.pak")
+    path.write_bytes(PAK.build({
+        "named_resources": [],
+        "resources": [
+            {"asset": {"type": "ABCD", "id": 0x50}, "compressed": 1, "contents": {"value": b"Hello" * 20}},
+        ],
+    }, target_game=_GAME))
+
+    with AssetProvider(_GAME, [path]) as provider:
+        with pytest.raises(InvalidAssetId):
+            provider.get_asset(0x50)
+        assert provider.get_decompressed_bytes(0x50) == b"Hello" * 20
+
+
+@pytest.mark.parametrize("mode", ["pread", "mmap", "stream"])
+def test_save_asset(pak_path, tmp_path, mode):
+    kwargs = {"index_cache_dir": tmp_path.joinpath("cache")}
+    if mode == "mmap":
+        kwargs["use_mmap"] = True
+    elif mode == "stream":
+        kwargs["pak_files"] = [io.BytesIO(pak_path.read_bytes())]
+
+    original_size = pak_path.stat().st_size
+    with AssetProvider(_GAME, [pak_path], **kwargs) as provider:
+        old_offsets = {r.asset.id: r.offset for r in provider.all_resource_headers}
+        provider.get_asset(0x1000)
+
+        # Smaller, so it's written over the old one
+        provider.save_asset(0x1000, _dgrp(0x2005))
+        # Larger, so it's appended
+        provider.save_asset(0x1001, _dgrp(*range(0x4000, 0x4100)))
+
+        assert [dep.asset_id for dep in provider.get_asset(0x1000)] == [0x2005]
+        assert [dep.asset_id for dep in provider.get_asset(0x1001)] == list(range(0x4000, 0x4100))
+        assert provider._locate(0x1000)[0].offset == old_offsets[0x1000]
+        assert provider._locate(0x1001)[0].offset >= original_size
+
+        if mode == "stream":
+            pak_bytes = provider._pak_files[0].getvalue()
+
+    if mode != "stream":
+        pak_bytes = pak_path.read_bytes()
+        # The index cache was updated, and the patched pak reads the same
+        with AssetProvider(_GAME, [pak_path], index_cache_dir=tmp_path.joinpath("cache")) as provider:
+            assert [dep.asset_id for dep in provider.get_asset(0x1001)] == list(range(0x4000, 0x4100))
+            assert [dep.asset_id for dep in provider.get_asset(0x1002)] == list(range(0x3000, 0x3400))
+
+    header = PAKNoData.parse(pak_bytes, target_game=_GAME)
+    assert [r.offset for r in header.resources][2:] == [old_offsets[0x1002], old_offsets[0x1003]]
+    assert header.named_resources[0].name == "First"
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_compact(pak_path, use_mmap):
+    original_size = pak_path.stat().st_size
+    with AssetProvider(_GAME, [pak_path], use_mmap=use_mmap) as provider:
+        assert provider.compact() == 0
+
+        provider.save_asset(0x1000, _dgrp(*range(0x4000, 0x4100)))
+        provider.save_asset(0x1002, _dgrp(0x2009))
+        patched_size = pak_path.stat().st_size
+        assert patched_size > original_size
+
+        reclaimed = provider.compact()
+        assert reclaimed > 0
+        assert pak_path.stat().st_size == patched_size - reclaimed
+        assert [dep.asset_id for dep in provider.get_asset(0x1000)] == list(range(0x4000, 0x4100))
+        assert [dep.asset_id for dep in provider.get_asset(0x1002)] == [0x2009]
+
+    # Back to the layout of a freshly built pak
+    decoded = PAK.parse(pak_path.read_bytes(), target_game=_GAME)
+    assert PAK.build(decoded, target_game=_GAME) == pak_path.read_bytes()
+    assert decoded.named_resources[0].name == "First"
+
+
+def test_compact_keeps_shared_data(tmp_path):
+    shared = _dgrp(*range(0x5000, 0x5040))
+    pak_path = tmp_path.joinpath("shared.pak")
+    with pak_path.open("wb") as f:
+        write_pak(f, [(("DGRP", 0x1000), None, _dgrp(0x2000), False),
+                      (("DGRP", 0x1001), None, shared, False),
+                      (("DGRP", 0x1003), None, shared, False)], _GAME)
+    original_size = pak_path.stat().st_size
+
+    with AssetProvider(_GAME, [pak_path]) as provider:
+        assert provider._paks[0].offsets[1] == provider._paks[0].offsets[2]
+        provider.save_asset(0x1000, _dgrp(*range(0x4000, 0x4100)))
+        provider.save_asset(0x1000, _dgrp(0x2001))
+        assert provider.compact() > 0
+        assert pak_path.stat().st_size == original_size
+
+        pak = provider._paks[0]
+        assert pak.offsets[1] == pak.offsets[2]
+        assert [dep.asset_id for dep in provider.get_asset(0x1003)] == list(range(0x5000, 0x5040))
+
+
+def test_compact_needs_pak_paths(pak_path):
+    with AssetProvider(_GAME, [pak_path], pak_files=[io.BytesIO(pak_path.read_bytes())]) as provider:
+        with pytest.raises(ValueError):
+            provider.compact()
+
+
+def _write_pak(path, resources):
+    path.write_bytes(PAK.build({
+        "named_resources": [],
+        "resources": [
+            {"asset": {"type": "DGRP", "id": asset_id}, "compressed": compressed, "contents": {"value": data}}
+            for asset_id, compressed, data in resources
+        ],
+    }, target_game=_GAME))
+    return path
+
+
+@pytest.fixture(name="duplicated_paks")
+def _duplicated_paks(tmp_path):
+    shared = _dgrp(*range(0x5000, 0x5040))
+    return [
+        _write_pak(tmp_path.joinpath("A.pak"), [(0x1000, 0, _dgrp(0x2000)), (0x1001, 0, shared)]),
+        _write_pak(tmp_path.joinpath("B.pak"), [(0x1002, 1, _dgrp(0x2002)), (0x1001, 0, shared), (0x1003, 1, shared),
+                                                (0x1000, 1, _dgrp(0x2000))]),
+    ]
+
+
+def test_asset_locations(duplicated_paks):
+    with AssetProvider(_GAME, duplicated_paks) as provider:
+        locations = provider.asset_locations
+        a, b = provider._paks
+        assert list(locations.ids) == [0x1000, 0x1001, 0x1002, 0x1003]
+        assert locations.locations(0x1001) == [(0, 1), (1, 1)]
+        assert locations.locations(0x1004) == []
+        assert locations.duplicated_asset_ids() == [0x1000, 0x1001]
+
+        stats = locations.duplication_stats()
+        redundant = b.sizes[1] + b.sizes[3]
+        assert stats == {"resources": 6, "assets": 4, "duplicated_assets": 2,
+                         "redundant_copies": 2, "redundant_bytes": redundant}
+        assert locations.redundant_bytes_by_type() == {"DGRP": redundant}
+        assert locations.shared_bytes_by_pak() == [a.sizes[0] + a.sizes[1], redundant]
+
+
+def test_duplicates_read_from_current_pak(duplicated_paks):
+    with AssetProvider(_GAME, duplicated_paks) as provider:
+        provider.get_asset(0x1000)
+        assert provider._locate_for_read(0x1001)[1] == 0
+
+        provider.get_asset(0x1002)
+        assert provider._locate_for_read(0x1001)[1] == 1
+        assert provider._locate(0x1001)[1] == 0
+
+        # In a batch, the copy in the pak with the other requested assets is used
+        batch = [pak_id for _, _, pak_id, _ in provider._batched_reads([0x1002, 0x1001, 0x1003])]
+        assert batch == [1, 1, 1]
+        batch = [pak_id for _, _, pak_id, _ in provider._batched_reads([0x1000, 0x1001])]
+        assert batch == [0, 0]
+
+        # 0x1000 is compressed in B, so it's always read from A
+        assert provider._locate_for_read(0x1000)[1] == 0
+        assert provider.get_decompressed_bytes(0x1001) == bytes(provider._read_resource(*provider._locate(0x1001)))
+
+
+def test_resource_entries_and_fingerprints(duplicated_paks):
+    with AssetProvider(_GAME, duplicated_paks) as provider:
+        a, b = duplicated_paks
+        entries = {asset_id: pak_path for asset_id, _, pak_path in provider.resource_entries()}
+        assert entries == {0x1000: a, 0x1001: a, 0x1002: b, 0x1003: b}
+
+        fingerprints = provider.pak_fingerprints()
+        assert list(fingerprints) == [a, b]
+        assert fingerprints[a][0] == a.stat().st_size
+        assert fingerprints[a][2:] == (provider._paks[0].header_length, provider._paks[0].header_hash)
+
+
+def test_save_asset_replaces_every_copy(duplicated_paks):
+    with AssetProvider(_GAME, duplicated_paks) as provider:
+        provider.save_asset(0x1001, _dgrp(*range(0x6000, 0x6100)))
+
+    for path in duplicated_paks:
+        with AssetProvider(_GAME, [path]) as provider:
+            assert [dep.asset_id for dep in provider.get_asset(0x1001)] == list(range(0x6000, 0x6100))
+    with AssetProvider(_GAME, duplicated_paks[1:]) as provider:
+        assert [dep.asset_id for dep in provider.get_asset(0x1003)] == list(range(0x5000, 0x5040))
@@ -1,4 +1,5 @@
 import construct
+import pytest
 from construct import Bytes, Struct, Prefixed, VarInt, GreedyBytes
 
 from retro_data_structures import compression
@@ -22,3 +23,44 @@ def test_build_parse_lzo():
 
     assert data == decoded
 
+
+def _segmented_data():
+    # Mix of compressible and incompressible segments, and a short last segment
+    data = b"".join(
+        bytes(range(256)) * 64 if i % 3 else bytes((i * 7919 + j * 31) % 251 for j in range(0x4000))
+        for i in range(12)
+    ) + b"\x02" * 100
+    return data, compression.LZOCompressedBlock(len(data)).build(data)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_decompress_lzo_segments(parallel):
+    data, encoded = _segmented_data()
+
+    assert compression.decompress_lzo_segments(encoded, len(data), parallel=parallel) == data
+
+
+def test_decompress_lzo_segments_truncated():
+    data, encoded = _segmented_data()
+
+    with pytest.raises(construct.StreamError):
+        compression.decompress_lzo_segments(encoded[:-10], len(data))
+
+
+def test_lzo_block_matches_segment_parsing():
+    data, encoded = _segmented_data()
+    block = compression.LZOCompressedBlock(len(data))
+
+    assert block.parse(encoded) == b"".join(block.subcon.parse(encoded)) == data
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_compress_lzo_segments(parallel):
+    data, encoded = _segmented_data()
+    block = compression.LZOCompressedBlock(len(data))
+
+    assert encoded == block.subcon.build(block._encode(data, None, ""))
+    assert compression.compress_lzo_segments(data, parallel=parallel) == encoded
+    assert compression.compress_lzo_blocks([data, b"", data[:100]], parallel=parallel) == [
+        encoded, b"", compression.compress_lzo_segments(data[:100]),
+    ]
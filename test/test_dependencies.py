@@ -0,0 +1,261 @@
+import struct
+
+import pytest
+from construct import Container
+
+from retro_data_structures import dependencies
+from retro_data_structures.asset_provider import AssetProvider
+from retro_data_structures.formats import dgrp, evnt, part, scan
+from retro_data_structures.formats.dgrp import DGRP
+from retro_data_structures.formats.evnt import EVNT
+from retro_data_structures.formats.pak import PAK
+from retro_data_structures.formats.part import PART
+from retro_data_structures.game_check import Game
+
+
+def _poi_base(name):
+    return {
+        "unk_1": 1,
+        "name": name,
+        "type": 0,
+        "timestamp": {"time": 0.5, "differential_state": 0},
+        "index": 0,
+        "unk_2": 0,
+        "unique": 0,
+        "weight": 1.0,
+        "character_index": -1,
+        "flags": 0,
+        "unk_extra": None,
+    }
+
+
+def _evnt(game, particles):
+    return EVNT.build({
+        "version": 1,
+        "bool_poi_nodes": [{"base": _poi_base("bool"), "value": 1}],
+        "int32_poi_nodes": [{"base": _poi_base("int"), "value": -2, "locator_name": "locator"}],
+        "particle_poi_nodes": [
+            {
+                "base": _poi_base(f"particle_{i}"),
+                "duration": 0,
+                "particle": {"type": asset_type, "id": asset_id},
+                "bone_name": "bone",
+                "bone_id": 3,
+                "effect_scale": 1.0,
+                "transform_type": 0,
+            }
+            for i, (asset_type, asset_id) in enumerate(particles)
+        ],
+        "sound_poi_nodes": None,
+    }, target_game=game)
+
+
+def _id_element(element, asset_id):
+    if asset_id is None:
+        return {"type": element, "body": {"type": "NONE", "body": None}}
+    return {"type": element, "body": {"type": "CNST", "body": asset_id}}
+
+
+def _part(game):
+    invalid = game.invalid_asset_id
+    return PART.build({
+        "elements": [Container(element) for element in [
+            {"type": "MAXP", "body": {"type": "CNST", "body": 20}},
+            {"type": "TEXR", "body": {"type": "CNST", "body": {"sub_id": "TXTR", "id": 0x100}}},
+            {"type": "TIND", "body": {"type": "CNST", "body": {"sub_id": "NONE", "id": None}}},
+            {"type": "SORT", "body": {"magic": "CNST", "value": True}},
+            _id_element("PMDL", 0x200),
+            _id_element("SSWH", None),
+            _id_element("SELC", invalid),
+            _id_element("IDTS", 0x300),
+            {"type": "KSSM", "body": {"magic": "CNST", "value": {
+                "unk1": 0, "unk2": 0, "endFrame": 1, "unk3": 0,
+                "spawns": [
+                    {"v1": 0, "v2": [{"id": 0x400, "type": "PART" if game >= Game.ECHOES else 0,
+                                      "unk2": 0, "unk3": 0}]},
+                    {"v1": 1, "v2": []},
+                ],
+            }}},
+            {"type": "_END", "body": None},
+        ]],
+    }, target_game=game)
+
+
+@pytest.mark.parametrize("game", [Game.PRIME, Game.ECHOES, Game.CORRUPTION])
+def test_part_dependencies_from_bytes(game):
+    raw = _part(game)
+    expected = list(part.dependencies_for(PART.parse(raw, target_game=game), game))
+
+    assert expected == [("TXTR", 0x100), ("CMDL", 0x200), ("PART", 0x300), ("PART", 0x400)]
+    assert list(part.dependencies_from_bytes(raw, game)) == expected
+
+
+def test_part_dependencies_from_bytes_values_like_elements():
+    game = Game.ECHOES
+    # The x of the offset is a float spelling "PMDL", followed by the "CNST" of y
+    pmdl = struct.unpack(">f", b"PMDL")[0]
+    raw = PART.build({
+        "elements": [Container(element) for element in [
+            {"type": "POFS", "body": {"type": "CNST", "body": {
+                "a": {"type": "CNST", "body": pmdl},
+                "b": {"type": "CNST", "body": 1.0},
+                "c": {"type": "CNST", "body": 2.0},
+            }}},
+            _id_element("IDTS", 0x300),
+            {"type": "_END", "body": None},
+        ]],
+    }, target_game=game)
+
+    expected = list(part.dependencies_for(PART.parse(raw, target_game=game), game))
+    assert expected == [("PART", 0x300)]
+    assert list(part.dependencies_from_bytes(raw, game)) == expected
+
+    with pytest.raises(ValueError):
+        list(part.dependencies_from_bytes(raw.replace(b"IDTS", b"XXXX"), game))
+
+
+@pytest.mark.parametrize("game", [Game.PRIME, Game.ECHOES])
+def test_evnt_dependencies_from_bytes(game):
+    raw = _evnt(game, [("PART", 0x10), ("ELSC", 0x20)])
+    expected = list(evnt.dependencies_for(EVNT.parse(raw, target_game=game), game))
+
+    assert expected == [("PART", 0x10), ("ELSC", 0x20)]
+    assert list(evnt.dependencies_from_bytes(raw, game)) == expected
+
+
+@pytest.mark.parametrize("game", [Game.PRIME, Game.CORRUPTION])
+def test_dgrp_dependencies_from_bytes(game):
+    raw = DGRP.build([{"asset_type": "TXTR", "asset_id": 1}, {"asset_type": "CMDL", "asset_id": 2}],
+                     target_game=game)
+
+    expected = list(dgrp.dependencies_for(DGRP.parse(raw, target_game=game), game))
+    assert list(dgrp.dependencies_from_bytes(raw, game)) == expected
+
+
+def test_scan_dependencies_from_bytes_p1():
+    raw = scan.SCAN.build({
+        "version": "final",
+        "frame_id": 0x10,
+        "text_id": 0x20,
+        "scan_speed": "fast",
+        "logbook_category": "none",
+        "scan_icon": "orange",
+        "scan_images": [
+            {"texture": 0x30 + i, "appearance_threshold": 0.5, "image_position": 0, "width": 0, "height": 0,
+             "interval": 0.0, "duration": 0.0}
+            for i in range(4)
+        ],
+        "junk": [],
+    }, target_game=Game.PRIME)
+
+    expected = list(scan.dependencies_for(scan.SCAN.parse(raw, target_game=Game.PRIME), Game.PRIME))
+    assert list(scan.dependencies_from_bytes(raw, Game.PRIME)) == expected
+
+
+
+def test_scan_dependencies_from_bytes_echoes():
+    game = Game.ECHOES
+    raw = scan.SCAN.build({
+        "magic": "SCAN",
+        "unknown1": 2,
+        "unknown2": 0,
+        "instance_count": 1,
+        "scannable_object_info": {
+            "type": "SNFO",
+            "instance": {"id": {"raw": 0x1}, "connections": [], "base_property": b"\x00" * 6},
+        },
+        "dependencies": [{"asset_type": "TXTR", "asset_id": 0x10}, {"asset_type": "STRG", "asset_id": 0x20}],
+        "junk": [0xFF] * 3,
+    }, target_game=game)
+
+    expected = list(scan.dependencies_for(scan.SCAN.parse(raw, target_game=game), game))
+    assert expected == [("TXTR", 0x10), ("STRG", 0x20)]
+    assert list(scan.dependencies_from_bytes(raw, game)) == expected
+
+def _write_pak(path, game, resources):
+    path.write_bytes(PAK.build({
+        "named_resources": [],
+        "resources": [
+            {"asset": {"type": asset_type, "id": asset_id}, "compressed": 1, "contents": {"value": data}}
+            for asset_type, asset_id, data in resources
+        ],
+    }, target_game=game))
+    return path
+
+
+def _dgrp_chain(game, length):
+    # Each DGRP depends on the next one, and the last one on an asset that doesn't exist
+    return [
+        ("DGRP", 0x1000 + i, DGRP.build([{"asset_type": "DGRP", "asset_id": 0x1000 + i + 1},
+                                         {"asset_type": "TXTR", "asset_id": 0x9000 + i}], target_game=game))
+        for i in range(length)
+    ]
+
+
+def test_recursive_dependencies_cross_check(tmp_path):
+    game = Game.ECHOES
+    resources = [
+        ("DGRP", 0x1000, DGRP.build([{"asset_type": "EVNT", "asset_id": 0x1001},
+                                     {"asset_type": "PART", "asset_id": 0x1002}], target_game=game)),
+        ("EVNT", 0x1001, _evnt(game, [("PART", 0x1002)])),
+        ("PART", 0x1002, _part(game)),
+    ]
+    pak_path = _write_pak(tmp_path.joinpath("Test.pak"), game, resources)
+
+    with AssetProvider(game, [pak_path]) as provider:
+        scanned = dependencies.recursive_dependencies_for(provider, [0x1000], cross_check=True)
+        parsed = dependencies.recursive_dependencies_for(provider, [0x1000], use_scanners=False)
+
+    assert scanned == parsed
+    assert dependencies.Dependency("CMDL", 0x200) in scanned
+
+
+def test_recursive_dependencies_deep_chain(tmp_path, caplog):
+    game = Game.ECHOES
+    pak_path = _write_pak(tmp_path.joinpath("Test.pak"), game, _dgrp_chain(game, 2000))
+
+    with AssetProvider(game, [pak_path]) as provider:
+        result = dependencies.recursive_dependencies_for(provider, [0x1000])
+
+    assert len(result) == 2 * 2000 + 1
+    assert dependencies.Dependency("DGRP", 0x1000 + 2000) in result
+    assert "Asset id 0x000017CF has dependency 0x000017D0 (DGRP) that doesn't exist." in caplog.text
+
+
+def test_recursive_dependencies_fetches_levels_in_batches(tmp_path, monkeypatch):
+    game = Game.ECHOES
+    resources = [
+        ("DGRP", 0x1000, DGRP.build([{"asset_type": "EVNT", "asset_id": 0x1001},
+                                     {"asset_type": "PART", "asset_id": 0x1002},
+                                     {"asset_type": "CMDL", "asset_id": 0x1003}], target_game=game)),
+        ("EVNT", 0x1001, _evnt(game, [("PART", 0x1002)])),
+        ("PART", 0x1002, _part(game)),
+    ]
+    pak_path = _write_pak(tmp_path.joinpath("Test.pak"), game, resources)
+
+    batches, single_reads = [], []
+    get_assets_bytes = AssetProvider.get_assets_bytes
+    get_decompressed_bytes = AssetProvider.get_decompressed_bytes
+    monkeypatch.setattr(AssetProvider, "get_assets_bytes",
+                        lambda self, ids, max_workers=None: batches.append(sorted(ids)) or get_assets_bytes(self, ids))
+    monkeypatch.setattr(AssetProvider, "get_decompressed_bytes",
+                        lambda self, asset_id: single_reads.append(asset_id) or get_decompressed_bytes(self, asset_id))
+
+    with AssetProvider(game, [pak_path]) as provider:
+        result = dependencies.recursive_dependencies_for(provider, [0x1000, 0x1001])
+
+    # PART 0x1002 is only fetched once, and the missing assets are read on their own to report them
+    assert batches == [[0x1000, 0x1001], [0x1002]]
+    assert single_reads == [0x1003, 0x200, 0x300, 0x400]
+    assert dependencies.Dependency("CMDL", 0x200) in result
+
+
+def test_recursive_dependencies_process_pool(tmp_path):
+    game = Game.ECHOES
+    pak_path = _write_pak(tmp_path.joinpath("Test.pak"), game, _dgrp_chain(game, 50))
+
+    with AssetProvider(game, [pak_path]) as provider:
+        serial = dependencies.recursive_dependencies_for(provider, [0x1000, 0x1010])
+        parallel = dependencies.recursive_dependencies_for(provider, [0x1000, 0x1010], max_workers=2)
+
+    assert parallel == serial
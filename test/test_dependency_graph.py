@@ -0,0 +1,70 @@
+import os
+
+from retro_data_structures import dependencies, dependency_graph
+from retro_data_structures.asset_provider import AssetProvider
+from retro_data_structures.dependencies import Dependency
+from retro_data_structures.dependency_graph import DependencyGraph
+from retro_data_structures.formats.dgrp import DGRP
+from retro_data_structures.formats.pak import PAK
+from retro_data_structures.game_check import Game
+
+
+def _write_pak(path, game, groups):
+    path.write_bytes(PAK.build({
+        "named_resources": [],
+        "resources": [
+            {
+                "asset": {"type": "DGRP", "id": asset_id},
+                "compressed": 0,
+                "contents": {"value": DGRP.build([{"asset_type": t, "asset_id": i} for t, i in deps],
+                                                 target_game=game)},
+            }
+            for asset_id, deps in groups.items()
+        ],
+    }, target_game=game))
+    return path
+
+
+def test_build_and_update(tmp_path):
+    game = Game.ECHOES
+    groups = {
+        0x10: [("DGRP", 0x11), ("TXTR", 0x50)],
+        0x11: [("DGRP", 0x12), ("TXTR", 0x51)],
+        0x12: [("TXTR", 0x50)],
+        0x13: [],
+    }
+    pak_path = _write_pak(tmp_path.joinpath("Test.pak"), game, groups)
+
+    with DependencyGraph(tmp_path.joinpath("graph.db"), game) as graph:
+        assert not graph.is_up_to_date([pak_path])
+        with AssetProvider(game, [pak_path]) as provider:
+            assert graph.update(provider) == 4
+            assert graph.update(provider) == 0
+            assert graph.recursive_dependencies([0x10]) == dependencies.recursive_dependencies_for(provider, [0x10])
+
+        assert graph.is_up_to_date([pak_path])
+        assert graph.direct_dependencies(0x11) == {Dependency("DGRP", 0x12), Dependency("TXTR", 0x51)}
+        assert graph.dependents(0x50) == {Dependency("DGRP", 0x10), Dependency("DGRP", 0x12)}
+
+    # Only 0x12 changes, and a new asset is added
+    groups[0x12] = [("TXTR", 0x52)]
+    groups[0x14] = [("DGRP", 0x12)]
+    _write_pak(pak_path, game, groups)
+    stat = pak_path.stat()
+    os.utime(pak_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    with DependencyGraph(tmp_path.joinpath("graph.db"), game) as graph:
+        assert not graph.is_up_to_date([pak_path])
+        with AssetProvider(game, [pak_path]) as provider:
+            assert graph.update(provider) == 2
+            assert graph.recursive_dependencies([0x10]) == dependencies.recursive_dependencies_for(provider, [0x10])
+
+        assert graph.dependents(0x50) == {Dependency("DGRP", 0x10)}
+        assert graph.dependents(0x12) == {Dependency("DGRP", 0x11), Dependency("DGRP", 0x14)}
+        assert graph.asset_ids_of_type("dgrp") == [0x10, 0x11, 0x12, 0x13, 0x14]
+
+
+def test_64_bit_asset_ids():
+    for asset_id in (0, 0x7FFFFFFFFFFFFFFF, 0x8000000000000000, 0xFFFFFFFFFFFFFFFF):
+        assert -(1 << 63) <= dependency_graph.asset_id_to_db(asset_id) < (1 << 63)
+        assert dependency_graph.asset_id_from_db(dependency_graph.asset_id_to_db(asset_id)) == asset_id
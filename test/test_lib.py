@@ -2,9 +2,15 @@ import json
 from pathlib import Path
 import construct
 
-from construct.lib.containers import Container
+from construct.lib.containers import Container, ListContainer
 
+from retro_data_structures.formats.mlvl import MLVL
+from retro_data_structures.formats.mrea import MREA, _all_categories
+from retro_data_structures.formats.pak import PAK
+from retro_data_structures.formats.script_layer import SCLY
+from retro_data_structures.formats.script_object import ScriptInstance
 from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import GetPropertyConstruct
 
 
 def _parse_and_build_compare(module, game: Game, file_path: Path, print_data=False, save_file=True):
@@ -40,4 +46,117 @@ def parse_and_build_compare_parsed(module, game: Game, file_path: Path, print_da
 
 def purge_hidden(data: Container) -> Container:
     data = {k: v for k, v in data.items() if not k.startswith("_")}
-    return {k: purge_hidden(v) if isinstance(v, Container) else v for k, v in data.items()}
\ No newline at end of file
+    return {k: purge_hidden(v) if isinstance(v, Container) else v for k, v in data.items()}
+
+
+def template_property(prop_type, name, prop_id, cook_preference="Always", **extra):
+    """
+    A property of a script object template, as `GameTemplate` builds it.
+    Properties other than structs and arrays have a default only when `default` is given.
+    """
+    result = {"type": prop_type, "name": name, "cook_preference": cook_preference, "id": prop_id}
+    if prop_type == "Struct":
+        result.update(archetype=extra["archetype"], properties=extra.get("properties", []))
+    elif prop_type == "Array":
+        result.update(item_archetype=extra["item"])
+    else:
+        if prop_type == "Asset":
+            result.update(type_filter=["TXTR"])
+        elif prop_type in ("Choice", "Enum"):
+            result.update(archetype=extra.get("archetype"))
+        result.update(has_default="default" in extra, default_value=extra.get("default"))
+    return result
+
+
+def template_struct(name, *properties, atomic=False):
+    return {"type": "Struct", "atomic": atomic, "name": name, "properties": list(properties)}
+
+
+def actor_instance(instance_id, name, health, connections=()):
+    """
+    An Echoes actor, for the template of the `echoes_script_template` fixture.
+    """
+    properties = GetPropertyConstruct(Game.ECHOES, "ACTR", True).build(
+        {"EditorProperties": {"Name": name}, "Health": health}, target_game=Game.ECHOES,
+    )
+    return ScriptInstance.parse(ScriptInstance.build({
+        "type": "ACTR",
+        "instance": {
+            "id": {"raw": instance_id},
+            "connections": [{"state": state, "message": message, "target": target}
+                            for state, message, target in connections],
+            "base_property": properties,
+        },
+    }, target_game=Game.ECHOES), target_game=Game.ECHOES)
+
+
+def echoes_mrea(*layers) -> bytes:
+    # Only the script layers and the path have data. The other categories are empty sections.
+    sections = Container()
+    for label in _all_categories:
+        section_id = sum(len(category) for category in sections.values())
+        if label == "script_layers_section":
+            sections[label] = ListContainer()
+            for i, instances in enumerate(layers):
+                layer = Container(magic="SCLY", unknown=0, layer_index=i, version=1,
+                                  script_instances=ListContainer(instances))
+                sections[label].append(Container(data=layer, size=len(SCLY.build(layer, target_game=Game.ECHOES)),
+                                                 id=section_id + i))
+        elif label == "path_section":
+            sections[label] = ListContainer([Container(data=0, size=32, id=section_id)])
+        elif label != "area_octree_section":
+            sections[label] = ListContainer([Container(data=b"", size=0, id=section_id)])
+
+    return MREA.build(Container(
+        header=Container(version="Echoes", area_transform=[1.0, 0, 0, 0, 0, 1.0, 0, 0, 0, 0, 1.0, 0],
+                         world_model_count=0),
+        data_section_sizes=Container(value=[0] * (sum(len(category) for category in sections.values()))),
+        sections=sections,
+    ), target_game=Game.ECHOES)
+
+
+def echoes_mlvl(areas) -> bytes:
+    layer_names = [name for _, layers in areas for name in layers]
+    offsets = [sum(len(layers) for _, layers in areas[:i]) for i in range(len(areas))]
+    return MLVL.build(Container(
+        version=0x17, world_name_id=0xFFFFFFFF, dark_world_name_id=0xFFFFFFFF, temple_key_world_index=0,
+        world_save_info_id=0xFFFFFFFF, default_skybox_id=0xFFFFFFFF, world_map_id=0xFFFFFFFF,
+        areas=[
+            Container(area_name_id=0xFFFFFFFF, area_transform=[0.0] * 12, area_bounding_box=[0.0] * 6,
+                      area_mrea_id=mrea_id, internal_area_id=i, attached_area_index=[], docks=[],
+                      dependencies=Container(dependencies_a=[], dependencies_b=[], dependencies_offset=[]),
+                      module_dependencies=Container(rel_module=[], rel_offset=[]), internal_area_name=f"Area {i}")
+            for i, (mrea_id, _) in enumerate(areas)
+        ],
+        area_layer_flags=[[True] * len(layers) for _, layers in areas],
+        layer_names=layer_names,
+        area_layer_name_offset=offsets,
+    ), target_game=Game.ECHOES)
+
+
+def write_echoes_pak(path, resources):
+    path.write_bytes(PAK.build({
+        "named_resources": [],
+        "resources": [
+            {"asset": {"type": asset_type, "id": asset_id}, "compressed": 0, "contents": {"value": data}}
+            for asset_type, asset_id, data in resources
+        ],
+    }, target_game=Game.ECHOES))
+    return path
+
+
+def write_echoes_world(path, second_area):
+    """
+    A pak with world 0x10, whose area 0x20 has a few connected actors. When `second_area` is set, the world also has
+    area 0x21 with an actor of that name.
+    """
+    areas = [(0x20, ["Default", "Second"]), (0x21, ["Default"])][:1 + (second_area is not None)]
+    return write_echoes_pak(path, [
+        ("MLVL", 0x10, echoes_mlvl(areas)),
+        ("MREA", 0x20, echoes_mrea(
+            [actor_instance(0x1, "Pickup", 10.0, [("ZERO", "ACTV", 0x2)]), actor_instance(0x2, "Door", 5.0)],
+            [actor_instance(0x04000003, "Relay", 5.0, [("ZERO", "DCTV", 0x2)])],
+        )),
+        *([("MREA", 0x21, echoes_mrea([actor_instance(0x00010001, second_area, 20.0)]))]
+          if second_area is not None else []),
+    ])
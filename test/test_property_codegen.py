@@ -0,0 +1,189 @@
+import enum
+import math
+import random
+import types
+
+import pytest
+from construct import ConstructError
+
+from retro_data_structures import property_codegen, property_template
+from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import GetPropertyConstruct
+from test.test_lib import template_property as _prop
+from test.test_lib import template_struct
+
+
+_TEMPLATE = {
+    "script_objects": {
+        "TEST": template_struct(
+            "Everything",
+            _prop("Int", "Int", 0x01),
+            _prop("Bool", "Bool", 0x02),
+            _prop("Float", "Float", 0x03),
+            _prop("String", "String", 0x04),
+            _prop("Short", "Short", 0x05),
+            _prop("Asset", "Asset", 0x06),
+            _prop("Choice", "Choice", 0x07),
+            _prop("Flags", "Flags", 0x08),
+            _prop("Color", "Color", 0x09),
+            _prop("Vector", "Vector", 0x0A),
+            _prop("AnimationSet", "AnimationSet", 0x0B),
+            _prop("Sound", "Sound", 0x0D),
+            _prop("Enum", "Enum", 0x0E, archetype="Mode"),
+            _prop("Array", "Ints", 0x0F, item=_prop("Int", "Item", None)),
+            _prop("Array", "Pairs", 0x10, item=_prop("Struct", "Item", None, archetype="AtomicPair")),
+            _prop("Struct", "Pair", 0x11, archetype="Pair"),
+            _prop("Struct", "Overridden", 0x12, archetype="Pair",
+                  properties=[_prop("Float", "C", 0x2), _prop("Int", "Unused", 0x3)]),
+            _prop("Struct", "Atomic", 0x13, archetype="AtomicPair"),
+            # Reads until the end, so it must be last in Prime
+            _prop("Spline", "Spline", 0x0C),
+            _prop("Int", "Hidden", 0x14, "Never"),
+        ),
+        "OPTN": template_struct("Optional", _prop("Int", "Int", 0x01, "OnlyIfModified")),
+    },
+    "property_archetypes": {
+        "Pair": template_struct("Pair", _prop("Float", "A", 0x1), _prop("Float", "B", 0x2),
+                                _prop("Int", "Unused", 0x3, "Never")),
+        "AtomicPair": template_struct("AtomicPair", _prop("Float", "A", 0x1), _prop("Float", "B", 0x2), atomic=True),
+        "Mode": {"type": "Enum"},
+    },
+}
+
+_GAMES = [Game.PRIME, Game.ECHOES, Game.CORRUPTION]
+
+
+class Mode(enum.IntEnum):
+    Off = 0
+    On = 1
+
+
+@pytest.fixture(name="properties_path")
+def _properties_path(property_templates, monkeypatch):
+    for game in _GAMES:
+        monkeypatch.setitem(property_template._ENUMS_BY_GAME, game, types.SimpleNamespace(Mode=Mode))
+    return property_templates({game: _TEMPLATE for game in _GAMES})
+
+
+def _pair(rng):
+    return {"A": rng.uniform(-10, 10), "B": rng.uniform(-10, 10)}
+
+
+def _random_object(rng: random.Random):
+    color = {"R": rng.random(), "G": rng.random(), "B": rng.random()}
+    if rng.random() < 0.5:
+        color["A"] = rng.random()
+
+    return {
+        "Int": rng.randrange(1 << 32),
+        "Bool": rng.random() < 0.5,
+        "Float": rng.uniform(-1000, 1000),
+        "String": "".join(rng.choice("abcé ") for _ in range(rng.randrange(10))),
+        "Short": rng.randrange(1 << 16),
+        "Asset": rng.randrange(1 << 32),
+        "Choice": rng.randrange(1 << 32),
+        "Flags": rng.randrange(1 << 32),
+        "Color": color,
+        "Vector": {"X": rng.random(), "Y": rng.random(), "Z": rng.random()},
+        "AnimationSet": {"AnimationCharacterSet": rng.randrange(1 << 32), "Character": 1, "DefaultAnim": 2},
+        "Spline": rng.randbytes(rng.randrange(8)),
+        "Sound": rng.randrange(1 << 32),
+        "Enum": rng.choice(["Off", "On"]),
+        "Ints": [rng.randrange(1 << 32) for _ in range(rng.randrange(4))],
+        "Pairs": [_pair(rng) for _ in range(rng.randrange(4))],
+        "Pair": _pair(rng),
+        "Overridden": {"A": 1.0, "C": 2.0, "Unused": rng.randrange(1 << 32)},
+        "Atomic": _pair(rng),
+    }
+
+
+def _normalize(value):
+    # Strict comparison, including the type of every value
+    if isinstance(value, dict):
+        return type(value).__name__, [(k, _normalize(v)) for k, v in value.items() if k != "_io"]
+    if isinstance(value, list):
+        return type(value).__name__, [_normalize(v) for v in value]
+    if isinstance(value, float) and math.isnan(value):
+        return "float", "nan"
+    return type(value).__name__, value
+
+
+def _try(function, *args):
+    try:
+        return True, _normalize(function(*args))
+    except Exception:
+        return False, None
+
+
+@pytest.mark.parametrize("game", _GAMES)
+def test_codec_matches_construct(properties_path, game):
+    reference = GetPropertyConstruct(game, "TEST")
+    codec = property_codegen.get_property_codec(game, "TEST")
+    rng = random.Random(1234)
+
+    for _ in range(20):
+        obj = _random_object(rng)
+        encoded = reference.build(obj, target_game=game)
+        assert codec._build(obj) == encoded
+
+        parsed = reference.parse(encoded, target_game=game)
+        assert _normalize(codec._parse(encoded)) == _normalize(parsed)
+        assert codec._build(parsed) == encoded
+
+    with pytest.raises(KeyError):
+        codec.build({})
+
+
+@pytest.mark.parametrize("game", _GAMES)
+def test_codec_fuzz(properties_path, game):
+    reference = GetPropertyConstruct(game, "TEST")
+    codec = property_codegen.get_property_codec(game, "TEST")
+    rng = random.Random(5678)
+    generated_parses = 0
+
+    for _ in range(400):
+        data = bytearray(reference.build(_random_object(rng), target_game=game))
+        if rng.random() < 0.2:
+            del data[rng.randrange(len(data)):]
+        else:
+            for _ in range(rng.randrange(1, 3)):
+                data[rng.randrange(len(data))] = rng.randrange(256)
+        data = bytes(data)
+
+        expected = _try(lambda d: reference.parse(d, target_game=game), data)
+        generated = _try(codec._parse, data)
+        if generated[0]:
+            generated_parses += 1
+            assert generated == expected
+        assert _try(codec.parse, data) == expected
+
+    assert generated_parses > 50
+
+
+def test_unsupported_objects(properties_path):
+    assert property_codegen.get_property_codec(Game.ECHOES, "OPTN") is None
+    assert property_codegen.get_property_codec(Game.ECHOES, "ZZZZ") is None
+    assert property_codegen.get_property_codec(Game.ECHOES, "TEST") is property_codegen.get_property_codec(
+        Game.ECHOES, "TEST")
+
+
+def test_codec_errors_propagate(properties_path, monkeypatch, caplog):
+    codec = property_codegen.get_property_codec(Game.ECHOES, "TEST")
+    data = GetPropertyConstruct(Game.ECHOES, "TEST").build(_random_object(random.Random(1)), target_game=Game.ECHOES)
+
+    # Data the generated code doesn't expect is handed to the construct
+    with caplog.at_level("DEBUG", logger=property_codegen.__name__):
+        with pytest.raises(ConstructError):
+            codec.parse(data[:-3])
+    assert "Parsing TEST with the construct instead" in caplog.text
+
+    # But a bug in the generated code isn't hidden
+    def broken(_):
+        raise RuntimeError("bug")
+
+    monkeypatch.setattr(codec, "_parse", broken)
+    monkeypatch.setattr(codec, "_build", broken)
+    with pytest.raises(RuntimeError):
+        codec.parse(data)
+    with pytest.raises(RuntimeError):
+        codec.build({})
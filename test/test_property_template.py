@@ -0,0 +1,80 @@
+import construct
+import pytest
+from construct import GreedyBytes
+
+from retro_data_structures import property_template
+from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import GameTemplate, GetPropertyConstruct, PropertyNames
+from test.test_lib import template_property, template_struct
+
+
+_TEMPLATE = {
+    "script_objects": {
+        "ABCD": template_struct("Thing", template_property("Int", "Health", 0x10, default=5),
+                                template_property("Struct", "Pair", 0x20, archetype="Pair")),
+        "EFGH": template_struct("Other", template_property("Struct", "Pair", 0x30, archetype="Pair")),
+    },
+    "property_archetypes": {
+        "Pair": template_struct("Pair", template_property("Float", "A", 0x1, default=1.0),
+                                template_property("Float", "B", 0x2, default=2.0)),
+    },
+}
+
+
+@pytest.fixture(name="properties_path")
+def _properties_path(property_templates):
+    return property_templates({Game.ECHOES: _TEMPLATE}, {0x10: "HP"})
+
+
+def test_constructs_created_lazily(properties_path):
+    thing = GetPropertyConstruct(Game.ECHOES, "ABCD")
+    constructs = property_template.PropertyConstructs[Game.ECHOES]
+
+    assert set(constructs["standard"]) == {"ABCD", "EFGH"}
+    assert list(constructs["standard"]._constructs) == ["ABCD"]
+    assert list(constructs["default"]._constructs) == []
+    assert GetPropertyConstruct(Game.ECHOES, "ABCD") is thing
+    assert GetPropertyConstruct(Game.ECHOES, "ZZZZ") is GreedyBytes
+
+    encoded = thing.build({"HP": 3, "Pair": {"A": 1.5, "B": 2.5}})
+    assert thing.parse(encoded).HP == 3
+    assert GetPropertyConstruct(Game.ECHOES, "EFGH", True).build({}) == bytes.fromhex(
+        "ffffffff001e000100000030001600020000000100043f80000000000002000440000000"
+    )
+
+
+def test_template_cache(properties_path, property_templates, tmp_path_factory, monkeypatch):
+    cache_dir = tmp_path_factory.mktemp("cache")
+    property_template.set_template_cache_dir(cache_dir)
+
+    expected = GetPropertyConstruct(Game.ECHOES, "ABCD").build({"HP": 3, "Pair": {"A": 1.5, "B": 2.5}})
+    assert [path.name.split(".")[:2] for path in sorted(cache_dir.iterdir())] == [
+        ["Echoes", "prop"], ["property_names", "pname"],
+    ]
+    assert list(properties_path.glob("*.pickle")) == []
+
+    # The cache is used instead of parsing the template again
+    property_templates({Game.ECHOES: _TEMPLATE}, {0x10: "HP"})
+    with monkeypatch.context() as m:
+        m.setattr(GameTemplate, "parse", lambda data: pytest.fail("Template was parsed"))
+        m.setattr(PropertyNames, "parse", lambda data: pytest.fail("Names were parsed"))
+        assert GetPropertyConstruct(Game.ECHOES, "ABCD").build({"HP": 3, "Pair": {"A": 1.5, "B": 2.5}}) == expected
+
+    # Until the template changes
+    changed = dict(_TEMPLATE, script_objects={"ABCD": _TEMPLATE["script_objects"]["EFGH"]})
+    property_templates({Game.ECHOES: changed})
+    assert property_template.GetGameTemplate(Game.ECHOES).script_objects["ABCD"].name == "Other"
+
+    # Or the construct version changes
+    property_templates({Game.ECHOES: changed})
+    parsed = []
+    parse = GameTemplate.parse
+    monkeypatch.setattr(construct, "version_string", "0.0.0")
+    monkeypatch.setattr(GameTemplate, "parse", lambda data: parsed.append(data) or parse(data))
+    property_template.GetGameTemplate(Game.ECHOES)
+    assert len(parsed) == 1
+
+
+def test_template_cache_disabled(properties_path):
+    property_template.set_template_cache_dir(None)
+    assert property_template.GetGameTemplate(Game.ECHOES).script_objects["ABCD"].name == "Thing"
@@ -0,0 +1,100 @@
+import pytest
+
+from retro_data_structures.formats.script_object import ScriptInstance, ScriptInstanceHelper
+from retro_data_structures.game_check import Game
+from retro_data_structures.property_template import GetPropertyConstruct
+from retro_data_structures.property_view import PropertyView
+from test.test_lib import template_property, template_struct
+
+
+_TEMPLATE = {
+    "script_objects": {
+        "VIEW": template_struct(
+            "View",
+            template_property("Int", "A", 0x1, default=0),
+            template_property("Float", "B", 0x2, "OnlyIfModified", default=1.0),
+            template_property("Struct", "Pair", 0x3, archetype="Pair"),
+            template_property("Int", "Hidden", 0x4, "Never", default=0),
+            template_property("String", "Name", 0x5, default=""),
+        ),
+    },
+    "property_archetypes": {
+        "Pair": template_struct("Pair", template_property("Float", "X", 0x1, default=0.0),
+                                template_property("Float", "Y", 0x2, default=0.0)),
+    },
+}
+
+_VALUES = {"A": 1, "B": None, "Pair": {"X": 1.0, "Y": 2.0}, "Name": "Short"}
+
+
+@pytest.fixture(autouse=True)
+def _view_template(property_templates):
+    property_templates({Game.ECHOES: _TEMPLATE})
+
+
+def _build(**changes) -> bytes:
+    return GetPropertyConstruct(Game.ECHOES, "VIEW").build(dict(_VALUES, **changes), target_game=Game.ECHOES)
+
+
+def test_decodes_only_requested_properties():
+    data = _build()
+    view = PropertyView(data, Game.ECHOES, "VIEW")
+
+    assert view["A"] == 1
+    assert view["B"] == 1.0
+    assert view["Hidden"] is None
+    assert view.decoded == ("A", "B", "Hidden")
+    assert list(view) == ["A", "B", "Pair", "Hidden", "Name"]
+    assert view.build() is view._data
+
+    with pytest.raises(KeyError):
+        view["Missing"] = 2
+
+
+def test_splices_changes():
+    view = PropertyView(_build(), Game.ECHOES, "VIEW")
+
+    view["Name"] = "A longer name"
+    assert view.build() == _build(Name="A longer name")
+
+    # Only written when different from the default
+    view["B"] = 3.0
+    assert view.build() == _build(Name="A longer name", B=3.0)
+    view["B"] = 1.0
+    assert view.build() == _build(Name="A longer name")
+    assert view["B"] == 1.0
+
+    view["Pair"].Y = 5.0
+    view["Hidden"] = 10
+    assert view.build() == _build(Name="A longer name", Pair={"X": 1.0, "Y": 5.0})
+    assert GetPropertyConstruct(Game.ECHOES, "VIEW").parse(view.build(), target_game=Game.ECHOES).Pair.Y == 5.0
+
+
+def test_unsupported():
+    with pytest.raises(ValueError):
+        PropertyView(_build(), Game.PRIME, "VIEW")
+    with pytest.raises(ValueError):
+        PropertyView(_build(), Game.ECHOES, "NONE")
+    with pytest.raises(ValueError):
+        PropertyView(_build()[:-8], Game.ECHOES, "VIEW")
+
+
+def test_instance_single_properties(monkeypatch):
+    raw = ScriptInstance.parse(ScriptInstance.build({
+        "type": "VIEW",
+        "instance": {"id": {"raw": 1}, "connections": [], "base_property": _build()},
+    }, target_game=Game.ECHOES), target_game=Game.ECHOES)
+    instance = ScriptInstanceHelper(raw, Game.ECHOES, None)
+    parsed = []
+    original = ScriptInstanceHelper._get_raw_properties
+    monkeypatch.setattr(ScriptInstanceHelper, "_get_raw_properties", lambda self: parsed.append(self) or original(self))
+
+    assert instance.get_property("Name") == "Short"
+    instance.set_property("A", 7)
+    instance._set_raw_properties()
+    assert raw.instance.base_property == _build(A=7)
+    assert parsed == []
+
+    instance.set_property("A", 8)
+    assert instance.properties.A == 8
+    assert instance.get_property("A") == 8
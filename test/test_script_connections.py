@@ -0,0 +1,85 @@
+from construct import Container, ListContainer
+
+from retro_data_structures import script_connections
+from retro_data_structures.asset_provider import AssetProvider
+from retro_data_structures.formats.mlvl import Mlvl
+from retro_data_structures.formats.mrea import MREA, Mrea
+from retro_data_structures.formats.script_layer import ScriptLayerPrime
+from retro_data_structures.game_check import Game
+from retro_data_structures.script_connections import ScriptConnection, ScriptConnections
+from test.test_lib import actor_instance, echoes_mrea, write_echoes_world
+
+_GAME = Game.ECHOES
+
+
+def _area() -> Mrea:
+    raw = MREA.parse(echoes_mrea(
+        [actor_instance(0x1, "A", 1.0, [("ZERO", "ACTV", 0x3), ("DEAD", "DCTV", 0x2)]),
+         actor_instance(0x2, "B", 1.0)],
+        [actor_instance(0x04000003, "C", 1.0, [("ZERO", "ACTV", 0x2), ("ARRV", "ACTV", 0x2)])],
+    ), target_game=_GAME)
+    return Mrea(raw, _GAME, None)
+
+
+def test_area_connections(echoes_script_template):
+    connections = ScriptConnections.from_mrea(_area(), 5)
+
+    assert len(connections) == 4
+    assert list(connections.sources) == [0x1, 0x1, 0x04000003, 0x04000003]
+    assert list(connections.layers) == [0, 0, 1, 1]
+    assert connections.connections_to(0x2) == [
+        ScriptConnection(5, 0, 0x1, 0x2, "DEAD", "DCTV"),
+        ScriptConnection(5, 1, 0x04000003, 0x2, "ZERO", "ACTV"),
+        ScriptConnection(5, 1, 0x04000003, 0x2, "ARRV", "ACTV"),
+    ]
+    assert connections.senders_to(0x2) == [0x1, 0x04000003]
+    assert connections.senders_to(0x1) == []
+    assert connections.connections_from(0x1)[0] == ScriptConnection(5, 0, 0x1, 0x3, "ZERO", "ACTV")
+    assert connections.rows_from(0x2) == []
+
+
+def test_area_with_changes(echoes_script_template):
+    area = _area()
+    # Loading the layer uses its containers, which include changes not saved yet
+    layer = next(area.script_layers)
+    layer.get_instance(0x2).add_connection("ZERO", "ACTV", layer.get_instance(0x1))
+    layer.remove_instance(0x1)
+
+    connections = ScriptConnections.from_mrea(area)
+    assert list(zip(connections.sources, connections.targets)) == [
+        (0x2, 0x1), (0x04000003, 0x2), (0x04000003, 0x2),
+    ]
+
+
+def test_world_connections(echoes_script_template, tmp_path):
+    pak_path = write_echoes_world(tmp_path.joinpath("World.pak"), "Other")
+    with AssetProvider(_GAME, [pak_path]) as provider:
+        connections = ScriptConnections.from_mlvl(Mlvl.from_asset(0x10, _GAME, provider))
+
+    assert list(connections.areas) == [0, 0]
+    assert connections.senders_to(0x2) == [0x1, 0x04000003]
+    assert len(ScriptConnections.concatenate(_GAME, [connections, connections])) == 4
+
+
+def test_prime_layers():
+    def instance(instance_id, connections):
+        return Container(type=0x4E, instance=Container(
+            id=Container(raw=instance_id),
+            connections=ListContainer(Container(state=s, message=m, target=t) for s, m, t in connections),
+            base_property=b"\x00" * 5,
+        ))
+
+    data = ScriptLayerPrime.build(Container(unknown=0, layers=ListContainer([
+        Container(unk=0, objects=ListContainer([instance(0x1, [(9, 1, 0x2)]), instance(0x2, [])])),
+        Container(unk=0, objects=ListContainer([instance(0x04000003, [(2, 4, 0x2), (2, 4, 0x1)])])),
+    ])), target_game=Game.PRIME)
+
+    columns = script_connections._Columns()
+    script_connections._scan_prime_layers(memoryview(data), columns, 0)
+    connections = ScriptConnections._from_columns(Game.PRIME, columns)
+
+    assert connections.connections_to(0x2) == [
+        ScriptConnection(0, 0, 0x1, 0x2, 9, 1),
+        ScriptConnection(0, 1, 0x04000003, 0x2, 2, 4),
+    ]
+    assert list(connections.targets) == [0x2, 0x2, 0x1]
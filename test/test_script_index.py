@@ -0,0 +1,95 @@
+import pytest
+
+from retro_data_structures.asset_provider import AssetProvider
+from retro_data_structures.formats.script_object import ScriptInstance
+from retro_data_structures.game_check import Game
+from retro_data_structures.script_index import IndexedConnection, IndexedInstance, ScriptIndex
+from test.test_lib import actor_instance, echoes_mlvl, echoes_mrea, write_echoes_pak, write_echoes_world
+
+_GAME = Game.ECHOES
+
+
+def test_index_and_update(echoes_script_template, tmp_path):
+    pak_path = write_echoes_world(tmp_path.joinpath("World.pak"), "Pickup")
+    db_path = tmp_path.joinpath("index.db")
+
+    with ScriptIndex(db_path, _GAME, ["Health", "EditorProperties.Active"]) as index:
+        with AssetProvider(_GAME, [pak_path]) as provider:
+            assert index.update(provider) == 2
+            assert index.update(provider) == 0
+
+        assert index.find_instances(name="Pickup") == [
+            IndexedInstance(0x10, 0x20, "!!Area 0", 0, "Default", 0x1, "ACTR", "Pickup"),
+            IndexedInstance(0x10, 0x21, "!!Area 1", 0, "Default", 0x00010001, "ACTR", "Pickup"),
+        ]
+        assert [i.name for i in index.find_instances("ACTR", properties={"Health": 5.0})] == ["Door", "Relay"]
+        assert [i.name for i in index.find_instances(properties={"EditorProperties.Active": True},
+                                                     mrea_id=0x20)] == ["Pickup", "Door", "Relay"]
+        assert index.find_instances(instance_type="PLAT") == []
+        with pytest.raises(ValueError):
+            index.find_instances(properties={"Scale": 1.0})
+
+        assert index.connections_to(0x2) == [
+            IndexedConnection(0x20, 0x1, 0x2, "ZERO", "ACTV"),
+            IndexedConnection(0x20, 0x04000003, 0x2, "ZERO", "DCTV"),
+        ]
+        assert index.connections_from(0x1) == [IndexedConnection(0x20, 0x1, 0x2, "ZERO", "ACTV")]
+        assert index.connections_from(0x1, mrea_id=0x21) == []
+
+    # Only the second area changes
+    write_echoes_world(pak_path, "Renamed")
+    with ScriptIndex(db_path, _GAME, ["Health", "EditorProperties.Active"]) as index:
+        with AssetProvider(_GAME, [pak_path]) as provider:
+            assert index.update(provider) == 1
+        assert [i.mrea_id for i in index.find_instances(name="Pickup")] == [0x20]
+        assert [i.mrea_id for i in index.find_instances(properties={"Health": 20.0})] == [0x21]
+
+    # The area is removed from the world
+    write_echoes_world(pak_path, None)
+    with ScriptIndex(db_path, _GAME, ["Health", "EditorProperties.Active"]) as index:
+        with AssetProvider(_GAME, [pak_path]) as provider:
+            assert index.update(provider) == 0
+        assert index.find_instances(mrea_id=0x21) == []
+        assert index.find_instances(properties={"Health": 20.0}) == []
+
+    # Other properties need everything to be indexed again
+    with ScriptIndex(db_path, _GAME, ["Health"]) as index:
+        assert index.find_instances() == []
+        with AssetProvider(_GAME, [pak_path]) as provider:
+            assert index.update(provider, max_workers=2) == 1
+        assert len(index.find_instances()) == 3
+
+
+def test_unresolved_properties(echoes_script_template, tmp_path):
+    unknown = ScriptInstance.parse(ScriptInstance.build({
+        "type": "ZZZZ",
+        "instance": {"id": {"raw": 0x3}, "connections": [], "base_property": b"\x01\x02\x03"},
+    }, target_game=_GAME), target_game=_GAME)
+    pak_path = write_echoes_pak(tmp_path.joinpath("World.pak"), [
+        ("MLVL", 0x10, echoes_mlvl([(0x20, ["Default"])])),
+        ("MREA", 0x20, echoes_mrea([actor_instance(0x1, "Pickup", 10.0), unknown])),
+    ])
+
+    with ScriptIndex(tmp_path.joinpath("index.db"), _GAME, ["Health", "Health.X", "EditorProperties.Name"]) as index:
+        with AssetProvider(_GAME, [pak_path]) as provider:
+            assert index.update(provider) == 1
+
+        assert [(i.instance_id, i.name) for i in index.find_instances()] == [(0x1, "Pickup"), (0x3, None)]
+        assert [i.instance_id for i in index.find_instances(properties={"Health": 10.0})] == [0x1]
+        assert [i.instance_id for i in index.find_instances(properties={"EditorProperties.Name": "Pickup"})] == [0x1]
+        assert index.find_instances(properties={"Health.X": 10.0}) == []
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_corrupt_area_is_skipped(echoes_script_template, tmp_path, max_workers):
+    pak_path = write_echoes_pak(tmp_path.joinpath("World.pak"), [
+        ("MLVL", 0x10, echoes_mlvl([(0x20, ["Default"]), (0x21, ["Default"])])),
+        ("MREA", 0x20, b"\x00" * 64),
+        ("MREA", 0x21, echoes_mrea([actor_instance(0x00010001, "Pickup", 10.0)])),
+    ])
+
+    with ScriptIndex(tmp_path.joinpath("index.db"), _GAME, ["Health"]) as index:
+        with AssetProvider(_GAME, [pak_path]) as provider:
+            assert index.update(provider, max_workers=max_workers) == 1
+
+        assert [(i.mrea_id, i.instance_id) for i in index.find_instances()] == [(0x21, 0x00010001)]